@@ -20,8 +20,15 @@ Output format (CoNLL-U):
 """
 
 import argparse
+import os
+import sys
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from corpus_io import open_input, open_output
+
+from batch_align import run_pool
+
 
 class OBPEAligner:
     """Align OBPE subwords with gold POS tags."""
@@ -109,9 +116,9 @@ class OBPEAligner:
         total_words = 0
         misalignment_count = 0
         
-        with open(subwords_file, 'r', encoding='utf-8') as sf, \
-             open(tags_file, 'r', encoding='utf-8') as tf, \
-             open(output_file, 'w', encoding='utf-8') as of:
+        with open_input(subwords_file) as sf, \
+             open_input(tags_file) as tf, \
+             open_output(output_file) as of:
             
             for line_num, (subword_line, tag_line) in enumerate(zip(sf, tf), 1):
                 subwords = subword_line.strip().split()
@@ -217,8 +224,8 @@ def validate_alignment(subwords_file, tags_file, eow_marker='</w>'):
     total_lines = 0
     empty_lines = 0
     
-    with open(subwords_file, 'r', encoding='utf-8') as sf, \
-         open(tags_file, 'r', encoding='utf-8') as tf:
+    with open_input(subwords_file) as sf, \
+         open_input(tags_file) as tf:
         
         for line_num, (subword_line, tag_line) in enumerate(zip(sf, tf), 1):
             subwords = subword_line.strip().split()
@@ -277,7 +284,7 @@ def inspect_alignment(aligned_file, num_sentences=5):
     print(f"INSPECTING ALIGNED FILE: {aligned_file}")
     print(f"{'='*80}\n")
     
-    with open(aligned_file, 'r', encoding='utf-8') as f:
+    with open_input(aligned_file) as f:
         sent_count = 0
         current_sent = []
         
@@ -330,6 +337,28 @@ def inspect_alignment(aligned_file, num_sentences=5):
                 current_sent.append((subword, tag))
 
 
+def align_batch_file(subwords_file, tags_file, output_file, eow_marker, output_format,
+                     validate, force, inspect, inspect_sentences):
+    """One --batch file: validate, align and inspect as requested (runs in a worker process)."""
+    print(f"\nProcessing: {Path(subwords_file).name}")
+    
+    # Validate if requested
+    if validate:
+        valid = validate_alignment(subwords_file, tags_file, eow_marker)
+        if not valid and not force:
+            print(f"  ⚠️  Skipping due to validation errors (use --force to override)")
+            return
+        elif not valid and force:
+            print(f"  ⚠️  Validation failed but continuing due to --force")
+    
+    # Align
+    OBPEAligner(eow_marker=eow_marker).align_file(subwords_file, tags_file, output_file, output_format)
+    
+    # Inspect if requested
+    if inspect:
+        inspect_alignment(output_file, inspect_sentences)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Align OBPE subwords with gold POS tags',
@@ -397,6 +426,8 @@ Output format (CoNLL-U):
     parser.add_argument('--tags_dir', help='Directory with tags files')
     parser.add_argument('--output_dir', help='Output directory')
     parser.add_argument('--pattern', default='obpe', help='Pattern to match files (default: obpe)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Files aligned in parallel in batch mode (default: all cores)')
     
     # Options
     parser.add_argument('--eow_marker', default='</w>', help='End-of-word marker (default: </w>)')
@@ -437,6 +468,7 @@ Output format (CoNLL-U):
         print(f"Found {len(subwords_files)} files matching '{pattern}'")
         print()
         
+        jobs = []
         for subwords_file in subwords_files:
             # Derive tags filename
             base_name = subwords_file.stem.replace(f'_{args.pattern}', '').replace('.subwords', '')
@@ -446,24 +478,12 @@ Output format (CoNLL-U):
             if not tags_file.exists():
                 print(f"Warning: Tags file not found: {tags_file}")
                 continue
-            
-            print(f"\nProcessing: {subwords_file.name}")
-            
-            # Validate if requested
-            if args.validate:
-                valid = validate_alignment(subwords_file, tags_file, args.eow_marker)
-                if not valid and not args.force:
-                    print(f"  ⚠️  Skipping due to validation errors (use --force to override)")
-                    continue
-                elif not valid and args.force:
-                    print(f"  ⚠️  Validation failed but continuing due to --force")
-            
-            # Align
-            aligner.align_file(subwords_file, tags_file, output_file, args.format)
-            
-            # Inspect if requested
-            if args.inspect:
-                inspect_alignment(output_file, args.inspect_sentences)
+            jobs.append((str(subwords_file), str(tags_file), str(output_file), args.eow_marker, args.format,
+                         args.validate, args.force, args.inspect, args.inspect_sentences))
+        
+        # Files run in parallel; each file's report is printed in one piece
+        for _, report in run_pool(align_batch_file, jobs, args.workers):
+            print(report, end='')
     
     else:
         # Single file mode
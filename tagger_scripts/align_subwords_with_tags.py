@@ -7,57 +7,20 @@ python tagger_scripts/align_subwords_with_tags.py \
 
 '''
 import argparse
+import os
 import sys
-import unicodedata
 import string
 import re
-from typing import Optional
-
-
-def is_unicode_punct(token: str) -> bool:
-    """Return True if token consists only of true punctuation characters (category 'P'), excluding symbols and ASCII hyphen-minus."""
-    if not token:
-        return False
-    for ch in token:
-        cat = unicodedata.category(ch)
-        if not cat.startswith('P'):
-            return False
-        if ch == '-':  # Exclude ASCII hyphen-minus
-            return False
-    return True
-
-
-def extract_punct_surface(token: str, tokenizer_type: str) -> Optional[str]:
-    """Return the punctuation surface form for validation based on tokenizer markers."""
-    if not token:
-        return None
-
-    # Skip tokens that are symbols (category 'S') or contain any symbol characters
-    if any(unicodedata.category(ch).startswith('S') for ch in token):
-        return None
-
-    if tokenizer_type in {"bpe", "unigram"}:
-        if token.startswith('▁'):  # U+2581
-            raw = token[1:]
-            if raw and is_unicode_punct(raw):
-                return raw
-        elif is_unicode_punct(token):
-            return token
-    elif tokenizer_type == "obpe":
-        if token.endswith("</w>"):
-            raw = token[:-4]
-            if raw and is_unicode_punct(raw):
-                return raw
-        elif is_unicode_punct(token):
-            return token
-
-    return None
-
-
-def align_subwords_with_tags(subword_file, tag_file, output_file, tokenizer_type):
-    with open(subword_file, 'r', encoding='utf-8') as f_sub:
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from corpus_io import open_input, open_output
+from piece_table import PieceTable, extract_punct_surface, is_unicode_punct
+
+
+def align_subwords_with_tags(subword_file, tag_file, output_file, tokenizer_type, vocab_file=None):
+    with open_input(subword_file) as f_sub:
         subword_lines = [line.strip() for line in f_sub if line.strip()]
-    with open(tag_file, 'r', encoding='utf-8') as f_tag:
+    with open_input(tag_file) as f_tag:
         tag_lines = [line.strip() for line in f_tag if line.strip()]
 
     if len(subword_lines) != len(tag_lines):
@@ -65,19 +28,27 @@ def align_subwords_with_tags(subword_file, tag_file, output_file, tokenizer_type
 
     validation_errors = []
 
-    with open(output_file, 'w', encoding='utf-8') as fout:
-        for idx, (sub_sent, tag_sent) in enumerate(zip(subword_lines, tag_lines)):
-            sub_tokens = sub_sent.split()
+    # Marker and punctuation checks are properties of the piece: look them up
+    # per piece id (see tokenizer_scripts/piece_table.py) instead of redoing
+    # the per-character Unicode work for every occurrence
+    table = PieceTable.from_file(vocab_file, tokenizer_type) if vocab_file else PieceTable(tokenizer_type)
+    sentences = [sub_sent.split() for sub_sent in subword_lines[:len(tag_lines)]]
+    ids, offsets = table.encode_lines(sentences)
+    offsets = offsets.tolist()
+    word_start_flags = table.is_word_start[ids].tolist()
+    punct_flags = table.is_punct[ids].tolist()
+    punct_surface_flags = table.is_punct_surface[ids].tolist()
+    surfaces = table.surface
+
+    with open_output(output_file) as fout:
+        for idx, (sub_tokens, tag_sent) in enumerate(zip(sentences, tag_lines)):
             word_tags = tag_sent.split()
             aligned = []
             word_groups = []
             current_group = []
-
-            # Normalize tokens by stripping spaces and standardizing separators
-            def normalize_token(tok):
-                return tok.strip()
-
-            sub_tokens = [normalize_token(tok) for tok in sub_tokens]
+            start, end = offsets[idx], offsets[idx + 1]
+            starts = word_start_flags[start:end]
+            puncts = punct_flags[start:end]
 
             # Systematically group subwords based on separator pattern.
             if tokenizer_type in ["bpe", "unigram"]:
@@ -90,15 +61,15 @@ def align_subwords_with_tags(subword_file, tag_file, output_file, tokenizer_type
                 word_groups = []
                 current_group = []
                 for i, tok in enumerate(sub_tokens):
-                    if tok.startswith('▁'):
+                    if starts[i]:
                         # start a new group
                         if current_group:
                             word_groups.append(current_group)
                         current_group = [tok]
-                    elif is_unicode_punct(tok):
+                    elif puncts[i]:
                         # Check if token is at sentence end or followed by a token starting with '▁'
                         is_last_token = (i == len(sub_tokens) - 1)
-                        next_starts_with_underscore = (not is_last_token and sub_tokens[i+1].startswith('▁'))
+                        next_starts_with_underscore = (not is_last_token and starts[i+1])
                         if is_last_token or next_starts_with_underscore:
                             # punctuation as own group
                             if current_group:
@@ -186,12 +157,11 @@ def align_subwords_with_tags(subword_file, tag_file, output_file, tokenizer_type
                     for sub in group:
                         aligned.append((sub, tag))
 
-            # Validate punctuation alignment
+            # Validate punctuation alignment (aligned keeps the order of sub_tokens)
             sentence_failures = []
-            for sub, tag in aligned:
-                punct_surface = extract_punct_surface(sub, tokenizer_type)
-                if punct_surface and tag != "PUNCT":
-                    sentence_failures.append(f"token '{punct_surface}' tagged as '{tag}'")
+            for i, (sub, tag) in enumerate(aligned):
+                if punct_surface_flags[start + i] and tag != "PUNCT":
+                    sentence_failures.append(f"token '{surfaces[ids[start + i]]}' tagged as '{tag}'")
 
             if sentence_failures:
                 validation_errors.append((idx + 1, sentence_failures))
@@ -219,6 +189,8 @@ if __name__ == "__main__":
     parser.add_argument("--output", required=True, help="Output CoNLL file")
     parser.add_argument("--tokenizer_type", required=True, choices=["bpe", "unigram", "obpe"],
                         help="Specify tokenizer type (bpe/unigram/obpe)")
+    parser.add_argument("--vocab", help="SentencePiece .vocab file (or OBPE merges file) to fix the piece ids; "
+                                        "without it the table is built from the pieces as they occur")
     args = parser.parse_args()
 
-    align_subwords_with_tags(args.subwords, args.tags, args.output, args.tokenizer_type)
\ No newline at end of file
+    align_subwords_with_tags(args.subwords, args.tags, args.output, args.tokenizer_type, args.vocab)
\ No newline at end of file
@@ -0,0 +1,330 @@
+"""
+Aligned POS training data: streaming writers and lazy readers.
+
+The format follows the output suffix (a .gz/.xz/.bz2/.zst suffix on top
+compresses json and jsonl, see tokenizer_scripts/corpus_io.py):
+  .json   list of word records, as alignment_v3.py has always written it
+          {"id", "sent_id", "orig_word", "orig_tag", "subwords", "train_labels"}
+  .jsonl  one sentence per line:
+          {"sent_id": 0, "words": [...], "tags": [...], "subwords": [[...], ...]}
+  .npz    columnar NumPy arrays (np.savez, no pickles):
+            piece_table(_offsets), tag_table(_offsets)  UTF-8 string tables
+            piece_ids           int32, every subword as a piece_table index
+            word_piece_offsets  int64, num_words + 1 starts into piece_ids
+            tag_ids             int32, orig_tag of every word (tag_table index)
+            word_text(_offsets) UTF-8 orig_word of every word
+            sentence_offsets    int64, num_sentences + 1 starts into the words
+            sentence_ids        int64, sent_id of every sentence
+sent_id is the index of the sentence in the aligner's input (sentences
+that fail to align are skipped, so ids can have gaps); the words of one
+sentence are always consecutive. JSON lists from before sent_id are cut
+into sentences after sentence-final punctuation.
+train_labels are always [orig_tag] + ["<PAD>"] * (len(subwords) - 1), so
+only .json stores them. Writers go to a temporary file next to the output
+and only replace it on close(), so a failed run leaves the old output.
+
+    writer = open_aligned_writer(path)
+    writer.add_sentence(records, sent_id) # records as align_sentence returns them
+    writer.close()                        # or writer.discard()
+    for item in iter_items(path): ...     # the .json word records, from any format
+    for sentence in iter_sentences(path): ...   # lists of them, one per sentence
+"""
+
+import json
+import os
+import sys
+from array import array
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from corpus_io import compression_of, open_input, open_output, strip_compression
+
+FORMATS = ('json', 'jsonl', 'npz')
+FORMAT_VERSION = 2
+PAD = "<PAD>"
+READ_CHUNK = 1 << 20
+NPZ_CHUNK_WORDS = 1 << 16
+# sentence ends guessed for JSON lists written without sent_id
+LEGACY_BOUNDARIES = ('.', '!', '?', '...')
+
+
+def aligned_format(path):
+    name = strip_compression(path)
+    if name.endswith('.npz'):
+        if compression_of(path):
+            raise ValueError(f"{path}: .npz outputs are written uncompressed")
+        return 'npz'
+    return 'jsonl' if name.endswith('.jsonl') else 'json'
+
+
+def with_format(path, fmt):
+    """`path` with its .json/.jsonl/.npz suffix replaced by the one of `fmt`."""
+    base, ext = os.path.splitext(path)
+    if ext in ('.json', '.jsonl', '.npz'):
+        path = base
+    return f"{path}.{fmt}"
+
+
+def train_labels(tag, num_subwords):
+    return [tag] + [PAD] * (num_subwords - 1)
+
+
+# --- writers ---
+
+class _AlignedWriter:
+    def __init__(self, path):
+        output_dir, name = os.path.split(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.path = path
+        # same suffix as the output, so the same format and compression
+        self.tmp_path = os.path.join(output_dir, f".tmp.{os.getpid()}.{name}")
+        self.count = 0           # words
+        self.sentences = 0
+
+    def add_sentence(self, records, sent_id=None):
+        """`sent_id` defaults to the number of sentences written so far."""
+        self._write(records, self.sentences if sent_id is None else sent_id)
+        self.count += len(records)
+        self.sentences += 1
+
+    def close(self):
+        """Finish the file and move it into place."""
+        self._finish()
+        os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        self._finish()
+        os.remove(self.tmp_path)
+
+
+class JSONListWriter(_AlignedWriter):
+    """Stream word records into a JSON list laid out exactly like json.dump(items, f, indent=2)."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._f = open_output(self.tmp_path)
+
+    def _write(self, records, sent_id):
+        for i, record in enumerate(records):
+            item = {"id": self.count + i, "sent_id": sent_id, **record}
+            text = json.dumps(item, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            self._f.write(('[\n  ' if self.count + i == 0 else ',\n  ') + text)
+
+    def _finish(self):
+        self._f.write('\n]' if self.count else '[]')
+        self._f.close()
+
+
+class JSONLinesWriter(_AlignedWriter):
+    """One JSON object per sentence."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._f = open_output(self.tmp_path)
+
+    def _write(self, records, sent_id):
+        self._f.write(json.dumps({
+            "sent_id": sent_id,
+            "words": [r["orig_word"] for r in records],
+            "tags": [r["orig_tag"] for r in records],
+            "subwords": [r["subwords"] for r in records],
+        }, ensure_ascii=False) + '\n')
+
+    def _finish(self):
+        self._f.close()
+
+
+def _pack_strings(strings):
+    data = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in data], out=offsets[1:])
+    return np.frombuffer(b''.join(data), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    offsets = offsets.tolist()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+class ColumnarWriter(_AlignedWriter):
+    """Collect the columns in compact arrays and save them as one .npz on close."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.piece_to_id = {}
+        self.tag_to_id = {}
+        self.piece_ids = array('i')
+        self.word_piece_offsets = array('q', [0])
+        self.tag_ids = array('i')
+        self.word_text = bytearray()
+        self.word_text_offsets = array('q', [0])
+        self.sentence_offsets = array('q', [0])
+        self.sentence_ids = array('q')
+
+    def _write(self, records, sent_id):
+        piece_to_id, tag_to_id = self.piece_to_id, self.tag_to_id
+        for r in records:
+            for sub in r["subwords"]:
+                self.piece_ids.append(piece_to_id.setdefault(sub, len(piece_to_id)))
+            self.word_piece_offsets.append(len(self.piece_ids))
+            self.tag_ids.append(tag_to_id.setdefault(r["orig_tag"], len(tag_to_id)))
+            self.word_text += r["orig_word"].encode('utf-8')
+            self.word_text_offsets.append(len(self.word_text))
+        self.sentence_offsets.append(self.sentence_offsets[-1] + len(records))
+        self.sentence_ids.append(sent_id)
+
+    def _finish(self):
+        piece_table, piece_table_offsets = _pack_strings(self.piece_to_id)
+        tag_table, tag_table_offsets = _pack_strings(self.tag_to_id)
+        with open(self.tmp_path, 'wb') as f:
+            np.savez(f,
+                     format_version=np.array(FORMAT_VERSION),
+                     piece_table=piece_table, piece_table_offsets=piece_table_offsets,
+                     tag_table=tag_table, tag_table_offsets=tag_table_offsets,
+                     piece_ids=np.frombuffer(self.piece_ids, dtype=np.int32),
+                     word_piece_offsets=np.frombuffer(self.word_piece_offsets, dtype=np.int64),
+                     tag_ids=np.frombuffer(self.tag_ids, dtype=np.int32),
+                     word_text=np.frombuffer(bytes(self.word_text), dtype=np.uint8),
+                     word_text_offsets=np.frombuffer(self.word_text_offsets, dtype=np.int64),
+                     sentence_offsets=np.frombuffer(self.sentence_offsets, dtype=np.int64),
+                     sentence_ids=np.frombuffer(self.sentence_ids, dtype=np.int64))
+
+
+WRITERS = {'json': JSONListWriter, 'jsonl': JSONLinesWriter, 'npz': ColumnarWriter}
+
+
+def open_aligned_writer(path):
+    return WRITERS[aligned_format(path)](path)
+
+
+# --- readers ---
+
+def _iter_json_list(f):
+    """Items of a top-level JSON list, decoded one at a time from READ_CHUNK reads."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(READ_CHUNK).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Aligned JSON file does not hold a list")
+    pos = 1
+    while True:
+        # skip whitespace and the separator before the next item
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer):
+                break
+            more = f.read(READ_CHUNK)
+            if not more:
+                raise ValueError("Aligned JSON list is not closed")
+            buffer, pos = more, 0
+        if buffer[pos] == ']':
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # an item cut off at the end of the buffer may still decode (a number)
+                if end < len(buffer):
+                    break
+            except ValueError:
+                pass
+            more = f.read(READ_CHUNK)
+            if not more:
+                item, end = decoder.raw_decode(buffer, pos)
+                break
+            buffer, pos = buffer[pos:] + more, 0
+        yield item
+        pos = end
+
+
+def _word_item(word_id, sent_id, word, tag, subs):
+    return {"id": word_id, "sent_id": sent_id, "orig_word": word, "orig_tag": tag, "subwords": subs,
+            "train_labels": train_labels(tag, len(subs))}
+
+
+def _iter_jsonl_sentences(path):
+    word_id = 0
+    with open_input(path) as f:
+        for line_num, line in enumerate(f):
+            if not line.strip():
+                continue
+            sent = json.loads(line)
+            sent_id = sent.get("sent_id", line_num)
+            sentence = []
+            for word, tag, subs in zip(sent["words"], sent["tags"], sent["subwords"]):
+                sentence.append(_word_item(word_id, sent_id, word, tag, subs))
+                word_id += 1
+            yield sentence
+
+
+def _iter_npz_sentences(path):
+    with np.load(path, allow_pickle=False) as z:
+        pieces = _unpack_strings(z['piece_table'], z['piece_table_offsets'])
+        tags = _unpack_strings(z['tag_table'], z['tag_table_offsets'])
+        piece_ids = z['piece_ids']
+        word_piece_offsets = z['word_piece_offsets']
+        tag_ids = z['tag_ids']
+        word_text = z['word_text'].tobytes()
+        word_text_offsets = z['word_text_offsets']
+        sentence_offsets = z['sentence_offsets']
+        num_sentences = len(sentence_offsets) - 1
+        sentence_ids = z['sentence_ids'] if 'sentence_ids' in z.files else np.arange(num_sentences)
+    # lists are built for about NPZ_CHUNK_WORDS words at a time
+    first = 0
+    while first < num_sentences:
+        last = int(np.searchsorted(sentence_offsets, sentence_offsets[first] + NPZ_CHUNK_WORDS, 'right')) - 1
+        last = min(max(last, first + 1), num_sentences)
+        so = sentence_offsets[first:last + 1].tolist()
+        start, stop = so[0], so[-1]
+        wpo = word_piece_offsets[start:stop + 1].tolist()
+        ids = piece_ids[wpo[0]:wpo[-1]].tolist()
+        wto = word_text_offsets[start:stop + 1].tolist()
+        word_tags = tag_ids[start:stop].tolist()
+        for k, sent_id in enumerate(sentence_ids[first:last].tolist()):
+            sentence = []
+            for w in range(so[k], so[k + 1]):
+                i = w - start
+                subs = [pieces[p] for p in ids[wpo[i] - wpo[0]:wpo[i + 1] - wpo[0]]]
+                word = word_text[wto[i]:wto[i + 1]].decode('utf-8')
+                sentence.append(_word_item(w, sent_id, word, tags[word_tags[i]], subs))
+            yield sentence
+        first = last
+
+
+def _iter_json_items(path):
+    with open_input(path) as f:
+        yield from _iter_json_list(f)
+
+
+def _iter_json_sentences(path):
+    """Consecutive items with one sent_id; items without one are cut after LEGACY_BOUNDARIES."""
+    sentence = []
+    for item in _iter_json_items(path):
+        if sentence and 'sent_id' in item and item['sent_id'] != sentence[-1].get('sent_id'):
+            yield sentence
+            sentence = []
+        sentence.append(item)
+        if 'sent_id' not in item and item['orig_word'] in LEGACY_BOUNDARIES:
+            yield sentence
+            sentence = []
+    if sentence:
+        yield sentence
+
+
+SENTENCE_READERS = {'json': _iter_json_sentences, 'jsonl': _iter_jsonl_sentences, 'npz': _iter_npz_sentences}
+
+
+def iter_sentences(path):
+    """Lists of word records, one per sentence, of an aligned file in any format, read lazily."""
+    return SENTENCE_READERS[aligned_format(path)](path)
+
+
+def iter_items(path):
+    """Word records of an aligned file in any format, read lazily."""
+    if aligned_format(path) == 'json':
+        yield from _iter_json_items(path)
+        return
+    for sentence in iter_sentences(path):
+        yield from sentence
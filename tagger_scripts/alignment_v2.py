@@ -1,6 +1,12 @@
-import json
 import os
 import glob
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from corpus_io import open_input, strip_compression
+
+from aligned_io import open_aligned_writer
+from batch_align import run_pool
 
 # Word boundary of sentencepiece tokenizers: starting with  ▁(U+2581)
 SPIECE_MARKER = '▁' #(U+2581) '\u2581'
@@ -8,8 +14,8 @@ SPIECE_MARKER = '▁' #(U+2581) '\u2581'
 OBPE_MARKER = '</w>'
 
 def load_lines(filepath):
-    """loading"""
-    with open(filepath, 'r', encoding='utf-8') as f:
+    """loading (plain, .gz/.xz/.bz2/.zst or archive member)"""
+    with open_input(filepath) as f:
         return [line.strip() for line in f if line.strip()]
 
 def group_subwords_by_markers(subword_list, strategy):
@@ -76,7 +82,8 @@ def process_files(subword_path, txt_path, tag_path, output_path):
     strategy = detect_strategy(sub_lines[0])
     print(f"  -> Detected Strategy: {strategy}")
 
-    full_dataset = []
+    # records are streamed out (json / jsonl / npz by the suffix, see aligned_io.py)
+    writer = open_aligned_writer(output_path)
     success_count = 0
     error_count = 0
 
@@ -102,25 +109,27 @@ def process_files(subword_path, txt_path, tag_path, output_path):
             continue
 
         # 5. First-Token Tagging
+        records = []
         for i, (word, gold_tag, group) in enumerate(zip(words, tags, subword_groups)):
             
             # label token with real tag and label the rest with <PAD>
             train_labels = [gold_tag] + ["<PAD>"] * (len(group) - 1)
             
-            full_dataset.append({
-                "id": len(full_dataset),
+            records.append({
                 "orig_word": word,
                 "orig_tag": gold_tag,
                 "subwords": group,          #  ▁talo 或 talo</w>
                 "train_labels": train_labels
             })
+        writer.add_sentence(records, line_idx)
         
         success_count += 1
 
-    if full_dataset:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(full_dataset, f, ensure_ascii=False, indent=2)
+    if writer.count:
+            writer.close()
             print(f"    [SUCCESS] JSON Generated: {os.path.basename(output_path)}")
+    else:
+            writer.discard()
             print(f"    [FAIL] No valid data found. Check warnings above.")
     
     print(f"--> Saved to {output_path}")
@@ -189,9 +198,10 @@ def main():
         print(f"Error: Subwords directory not found at {subwords_dir}")
         return
 
+    jobs = []
     for filename in files:
-        # example: "fi_train.bpe"
-        parts = filename.rsplit('.', 1) 
+        # example: "fi_train.bpe" (or "fi_train.bpe.gz")
+        parts = strip_compression(filename).rsplit('.', 1) 
         
         # 2 parts ["et_dev", "bpe"]
         if len(parts) != 2:
@@ -217,12 +227,16 @@ def main():
             
         # Check if reference files exist before processing
         if os.path.exists(txt_path) and os.path.exists(tag_path):
-            process_files(subword_path, txt_path, tag_path, output_path)
+            jobs.append((subword_path, txt_path, tag_path, output_path))
         else:
             print(f"Skipping {filename}:")
             if not os.path.exists(txt_path): print(f"  Missing Text: {txt_path}")
             if not os.path.exists(tag_path): print(f"  Missing Tags: {tag_path}")
             continue
+
+    # align the files in parallel, printing each file's report in one piece
+    for _, report in run_pool(process_files, jobs):
+        print(report, end='')
     print(f"\n--- DONE ---")
 
 if __name__ == "__main__":
@@ -1,7 +1,15 @@
-import json
+import argparse
 import os
+import sys
 import unicodedata
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from corpus_io import exists, open_input
+from sentence_index import open_sentences
+
+from span_alignment import align_pieces, piece_table_for
+from aligned_io import open_aligned_writer, with_format
+
 # --- 配置 ---
 SPIECE_MARKER = '\u2581'  #('▁'): U+2581
 OBPE_MARKER = '</w>'
@@ -16,10 +24,17 @@ NAME_MAPPING = {
 }
 
 
-def load_lines(filepath):
-    if not filepath or not os.path.exists(filepath):
+def load_lines(filepath, sentences=None):
+    """
+    Non-empty stripped lines; `sentences` reads only a selection via the .idx sidecar.
+    Compressed files and archive members are read directly (see corpus_io.py).
+    """
+    if not filepath or not exists(filepath):
         raise FileNotFoundError(f"File not found: {filepath}")
-    with open(filepath, 'r', encoding='utf-8') as f:
+    if sentences:
+        with open_sentences(filepath, sentences) as f:
+            return [line.strip() for line in f if line.strip()]
+    with open_input(filepath) as f:
         return [line.strip() for line in f if line.strip()]
 
 def normalize_text(text):
@@ -96,11 +111,46 @@ def greedy_align_subwords(words, subwords, strategy):
 
     return groups, None
 
-def process_single_pair(sub_path, txt_path, tag_path, out_path):
+def align_sentence(words, tags, subs, strategy, spans=None, greedy=False, table=None):
+    """
+    Word-level training records of one sentence (without "id"), or
+    (None, error_info) when words/tags/subwords do not line up.
+    Subwords are grouped by character offsets (see span_alignment.py);
+    `spans` are their offsets in ' '.join(words) when the tokenizer gave them,
+    `table` a PieceTable to look piece markers and surfaces up in.
+    greedy=True uses the old string-rebuilding greedy_align_subwords instead.
+    """
+    if len(words) != len(tags):
+        return None, {"error": "Word/tag count mismatch"}
+    if greedy:
+        groups, error_info = greedy_align_subwords(words, subs, strategy)
+    else:
+        groups, error_info = align_pieces(words, subs, strategy, spans, table)
+    if error_info:
+        return None, error_info
+    records = []
+    for w, t, g in zip(words, tags, groups):
+        labels = [t] + ["<PAD>"] * (len(g) - 1)
+        records.append({
+            "orig_word": w,
+            "orig_tag": t,
+            "subwords": g,
+            "train_labels": labels
+        })
+    return records, None
+
+def warn_mismatch(index, error_info):
+    print(f"    [WARN] Mismatch at Sentence Index {index}: {error_info.get('error', 'word mismatch')}")
+    if 'orig_norm' in error_info:
+        print(f"           Target Word: '{error_info.get('orig_norm', 'Unknown')}'")
+        print(f"           Built Word:  '{error_info.get('built', 'Unknown')}'")
+
+def process_single_pair(sub_path, txt_path, tag_path, out_path, sentences=None, greedy=False,
+                        vocab=None, merges=None):
     try:
-        sub_lines = load_lines(sub_path)
-        txt_lines = load_lines(txt_path)
-        tag_lines = load_lines(tag_path)
+        sub_lines = load_lines(sub_path, sentences)
+        txt_lines = load_lines(txt_path, sentences)
+        tag_lines = load_lines(tag_path, sentences)
     except Exception as e:
         print(f"    [ERROR] Read Failed: {e}")
         return
@@ -112,7 +162,9 @@ def process_single_pair(sub_path, txt_path, tag_path, out_path):
 
     # 策略检测
     strategy = 'OBPE' if OBPE_MARKER in sub_lines[0] else 'SPIECE'
-    dataset = []
+    # per-piece markers / normalized surfaces, worked out once per distinct piece
+    table = piece_table_for(strategy, vocab, merges)
+    writer = open_aligned_writer(out_path)
     skipped_count = 0
     
     for i, (sub_l, txt_l, tag_l) in enumerate(zip(sub_lines, txt_lines, tag_lines)):
@@ -120,44 +172,29 @@ def process_single_pair(sub_path, txt_path, tag_path, out_path):
         tags = tag_l.split()
         subs = sub_l.split()
         
-        # 基本长度过滤
-        if len(words) != len(tags):
-            skipped_count += 1
-            continue
-        
-        # Greedy Alignment
-        groups, error_info = greedy_align_subwords(words, subs, strategy)
+        # 基本长度过滤 + offset alignment
+        records, error_info = align_sentence(words, tags, subs, strategy, greedy=greedy, table=table)
         
         if error_info:
             # 只打印前 1 个错误，避免刷屏
             # if skipped_count < 1:
             #     print(f"    [WARN] Line {i} Mismatch: {error_info.get('orig', 'Unknown')}")
-            if skipped_count < 5:
-                print(f"    [WARN] Mismatch at Sentence Index {i}:") # 这里的 i 就是句子的索引
-                print(f"           Target Word: '{error_info.get('orig_norm', 'Unknown')}'")
-                print(f"           Built Word:  '{error_info.get('built', 'Unknown')}'")
+            if skipped_count < 5 and len(words) == len(tags):
+                warn_mismatch(i, error_info) # 这里的 i 就是句子的索引
             skipped_count += 1
             continue
         
-        # 构建数据项
-        for w, t, g in zip(words, tags, groups):
-            labels = [t] + ["<PAD>"] * (len(g) - 1)
-            dataset.append({
-                "id": len(dataset),
-                "orig_word": w,
-                "orig_tag": t,
-                "subwords": g,
-                "train_labels": labels
-            })
+        # 写入数据项 (json / jsonl / npz by the output suffix, see aligned_io.py)
+        writer.add_sentence(records, i)
 
     # 保存结果
-    if dataset:
-        with open(out_path, 'w', encoding='utf-8') as f:
-            json.dump(dataset, f, ensure_ascii=False, indent=2)
-        print(f"    [SUCCESS] Generated: {os.path.basename(out_path)} ({len(dataset)} words)")
+    if writer.count:
+        writer.close()
+        print(f"    [SUCCESS] Generated: {os.path.basename(out_path)} ({writer.count} words)")
         if skipped_count > 0:
             print(f"              (Skipped {skipped_count} sentences due to mismatch)")
     else:
+        writer.discard()
         print(f"    [FAIL] No valid data found.")
 
 # def main():
@@ -241,6 +278,19 @@ def process_single_pair(sub_path, txt_path, tag_path, out_path):
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Align subwords with gold POS tags')
+    parser.add_argument('--sentences', help='Only these lines of every file: START:STOP, i,j,k or @file '
+                                            '(uses the .idx sidecars; runs the files one by one)')
+    parser.add_argument('--greedy', action='store_true',
+                        help='Use the old string-rebuilding greedy alignment instead of offsets')
+    parser.add_argument('--workers', type=int, default=None, help='Files aligned in parallel (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='Re-align even if outputs are newer than inputs')
+    parser.add_argument('--vocab', help='SentencePiece .vocab file to build the piece table from (bpe/unigram)')
+    parser.add_argument('--merges', help='OBPE merges file to build the piece table from (obpe)')
+    parser.add_argument('--output_format', choices=['json', 'jsonl', 'npz'], default='json',
+                        help='Word-record JSON list, one sentence per line, or columnar arrays (see aligned_io.py)')
+    args = parser.parse_args()
+
     base_dir = "./pilot_data/ud_data"
 
     sub_dir = os.path.join(base_dir, "subword")
@@ -263,37 +313,29 @@ def main():
 
     print("--- Running explicit SME/HU OBPE alignments ---")
 
+    jobs = []
     for lang in languages:
         for split in splits:
-            subword_filename = f"{lang}_et_{split}.obpe"
-            text_filename = f"{lang}_{split}_v5.txt"
-            tag_filename = f"{lang}_{split}_v5.tags"
-            output_filename = f"{lang}_et_{split}_obpe_aligned_v3.json"
-
-            subword_path = os.path.join(sub_dir, subword_filename)
-            txt_path = os.path.join(text_dir, text_filename)
-            tag_path = os.path.join(tags_dir, tag_filename)
-            out_path = os.path.join(output_dir, output_filename)
-
-            print(f"\nProcessing: {subword_filename}")
-
-            missing = False
-            if not os.path.exists(subword_path):
-                print(f"  [SKIP] Missing subword: {subword_filename}")
-                missing = True
-            if not os.path.exists(txt_path):
-                print(f"  [SKIP] Missing text: {text_filename}")
-                missing = True
-            if not os.path.exists(tag_path):
-                print(f"  [SKIP] Missing tags: {tag_filename}")
-                missing = True
-
-            if missing:
-                continue
-
-            process_single_pair(subword_path, txt_path, tag_path, out_path)
+            jobs.append((os.path.join(sub_dir, f"{lang}_et_{split}.obpe"),
+                         os.path.join(text_dir, f"{lang}_{split}_v5.txt"),
+                         os.path.join(tags_dir, f"{lang}_{split}_v5.tags"),
+                         with_format(os.path.join(output_dir, f"{lang}_et_{split}_obpe_aligned_v3"),
+                                     args.output_format)))
+
+    if args.sentences:
+        for subword_path, txt_path, tag_path, out_path in jobs:
+            print(f"\nProcessing: {os.path.basename(subword_path)}")
+            missing = [p for p in (subword_path, txt_path, tag_path) if not exists(p)]
+            for p in missing:
+                print(f"  [SKIP] Missing: {os.path.basename(p)}")
+            if not missing:
+                process_single_pair(subword_path, txt_path, tag_path, out_path, args.sentences, args.greedy,
+                                    args.vocab, args.merges)
+    else:
+        from batch_align import run_batch
+        run_batch(jobs, args.workers, args.force, args.greedy, vocab=args.vocab, merges=args.merges)
 
     print("\n--- DONE ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,297 @@
+'''
+Align every (subword, text, tags) triple in a process pool and print one merged summary.
+
+Triples from path templates: {name} fields are read off every subword file
+the first template matches and filled into the others (a field value cannot
+contain the characters next to the field, e.g. '_' in {lang}_{split}):
+python tagger_scripts/batch_align.py \
+    --subwords './pilot_data/ud_data/subword/{lang}_{split}.{tok}' \
+    --text './pilot_data/ud_data/text/{lang}_{split}_v5.txt' \
+    --tags './pilot_data/ud_data/tags/{lang}_{split}_v5.tags' \
+    --output './pilot_data/ud_data/aligned_json/{lang}_{split}_{tok}_aligned_v3.json'
+
+Or one job per manifest line, '#' starts a comment:
+    # subwords                                   text                                     tags                                      output
+    ./pilot_data/ud_data/subword/et_dev.bpe     ./pilot_data/ud_data/text/et_dev_v5.txt  ./pilot_data/ud_data/tags/et_dev_v5.tags  ./pilot_data/ud_data/aligned_json/et_dev_bpe_aligned_v3.json
+python tagger_scripts/batch_align.py --manifest align_jobs.txt
+
+Outputs are the JSON lists alignment_v3.py writes, or sentence-level
+.jsonl / columnar .npz by the output suffix (see aligned_io.py). The three inputs are
+streamed line by line (blank lines skipped, as load_lines does), so memory
+does not grow with the file. Outputs newer than all their inputs are
+skipped (--force re-aligns them). --vocab (SentencePiece .vocab) and
+--merges (OBPE merges file) build each job's piece table ahead of time;
+without them it fills up from the pieces as they are seen.
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import re
+import sys
+import time
+from collections import Counter
+from itertools import zip_longest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from corpus_io import exists, expand, open_input, source_path
+
+from aligned_io import open_aligned_writer
+from alignment_v3 import OBPE_MARKER, align_sentence
+from span_alignment import piece_table_for
+
+FIELD = re.compile(r'\{(\w+)\}')
+MAX_EXAMPLES = 5
+
+
+# --- job discovery ---
+
+def template_regex(template):
+    """
+    Regex matching paths of `template`; each {name} becomes a group (repeats must agree).
+    A value cannot hold '/' or the literal characters right before and after
+    the field, so '{lang}_{split}.bpe' reads et_train.bpe as lang=et,
+    split=train and does not match sme_et_train.bpe at all rather than guess
+    where lang ends.
+    """
+    parts, seen, pos = [], set(), 0
+    for m in FIELD.finditer(template):
+        parts.append(re.escape(template[pos:m.start()]))
+        name = m.group(1)
+        neighbours = {template[m.start() - 1:m.start()], template[m.end():m.end() + 1]}
+        excluded = '/' + ''.join(sorted(c for c in neighbours if c not in ('', '{', '}', '/')))
+        parts.append(f'(?P={name})' if name in seen else f'(?P<{name}>[^{re.escape(excluded)}]+?)')
+        seen.add(name)
+        pos = m.end()
+    parts.append(re.escape(template[pos:]))
+    return re.compile(''.join(parts))
+
+
+def jobs_from_templates(subwords, text, tags, output):
+    """(subwords, text, tags, output) for every file matching the subwords template."""
+    regex = template_regex(subwords)
+    jobs = []
+    for path in expand(FIELD.sub('*', subwords)):
+        m = regex.fullmatch(path)
+        if not m:
+            print(f"[SKIP] {path}: does not split into the fields of {subwords}")
+            continue
+        fields = m.groupdict()
+        jobs.append((path, text.format(**fields), tags.format(**fields), output.format(**fields)))
+    return jobs
+
+
+def read_manifest(manifest_path):
+    jobs = []
+    with open_input(manifest_path) as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            if len(parts) != 4:
+                raise ValueError(f"{manifest_path}:{line_num}: expected 'subwords text tags output'")
+            jobs.append(tuple(parts))
+    return jobs
+
+
+def is_up_to_date(inputs, output_file):
+    if not os.path.exists(output_file):
+        return False
+    return os.path.getmtime(output_file) >= max(os.path.getmtime(source_path(p)) for p in inputs)
+
+
+# --- one job ---
+
+def non_empty_lines(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def align_triple(sub_path, txt_path, tag_path, out_path, greedy=False, vocab=None, merges=None):
+    """
+    Stream one triple through align_sentence into `out_path`; `vocab` / `merges`
+    prebuild its PieceTable (see span_alignment.piece_table_for).
+    Returns a stats dict; the output is only kept when all three files have
+    the same number of sentences and at least one word was aligned.
+    """
+    stats = {'sentences': 0, 'aligned': 0, 'skipped': 0, 'words': 0, 'subwords': 0,
+             'errors': Counter(), 'examples': []}
+    writer = open_aligned_writer(out_path)
+    counts = [0, 0, 0]
+    strategy = None
+    try:
+        with open_input(sub_path) as sf, open_input(txt_path) as xf, open_input(tag_path) as gf:
+            for sub_l, txt_l, tag_l in zip_longest(non_empty_lines(sf), non_empty_lines(xf), non_empty_lines(gf)):
+                for k, line in enumerate((sub_l, txt_l, tag_l)):
+                    counts[k] += line is not None
+                if sub_l is None or txt_l is None or tag_l is None:
+                    continue
+                if strategy is None:
+                    strategy = 'OBPE' if OBPE_MARKER in sub_l else 'SPIECE'
+                    table = piece_table_for(strategy, vocab, merges)
+                words, tags, subs = txt_l.split(), tag_l.split(), sub_l.split()
+                records, error_info = align_sentence(words, tags, subs, strategy, greedy=greedy, table=table)
+                if error_info:
+                    reason = error_info.get('error', 'word mismatch')
+                    stats['errors'][reason] += 1
+                    if len(stats['examples']) < MAX_EXAMPLES:
+                        stats['examples'].append((stats['sentences'], reason))
+                    stats['skipped'] += 1
+                else:
+                    writer.add_sentence(records, stats['sentences'])
+                    stats['subwords'] += sum(len(record['subwords']) for record in records)
+                    stats['aligned'] += 1
+                stats['sentences'] += 1
+    except BaseException:
+        writer.discard()
+        raise
+
+    stats['words'] = writer.count
+    if len(set(counts)) != 1:
+        writer.discard()
+        stats['status'] = 'failed'
+        stats['message'] = f"Line Mismatch! Sub:{counts[0]} Txt:{counts[1]} Tag:{counts[2]}"
+    elif not writer.count:
+        writer.discard()
+        stats['status'] = 'failed'
+        stats['message'] = "No valid data found."
+    else:
+        writer.close()
+        stats['status'] = 'aligned'
+    return stats
+
+
+def run_job(job):
+    sub_path, txt_path, tag_path, out_path, force, greedy, vocab, merges = job
+    missing = [p for p in (sub_path, txt_path, tag_path) if not exists(p)]
+    if missing:
+        return out_path, {'status': 'missing', 'message': ', '.join(missing)}
+    if not force and is_up_to_date((sub_path, txt_path, tag_path), out_path):
+        return out_path, {'status': 'skipped'}
+    start = time.perf_counter()
+    try:
+        stats = align_triple(sub_path, txt_path, tag_path, out_path, greedy, vocab, merges)
+    except (OSError, UnicodeDecodeError) as e:
+        return out_path, {'status': 'failed', 'message': f"Read Failed: {e}"}
+    stats['seconds'] = time.perf_counter() - start
+    return out_path, stats
+
+
+# --- pool ---
+
+def _captured(task):
+    fn, args = task
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        result = fn(*args)
+    return result, buffer.getvalue()
+
+
+def run_pool(fn, arg_tuples, workers=None):
+    """
+    Yield (fn(*args), printed output) for every args tuple, in completion order,
+    over `workers` processes. Each task's prints are kept together.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(fn, args) for args in arg_tuples]
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _captured(task)
+        return
+    with mp.Pool(min(workers, len(tasks))) as pool:
+        yield from pool.imap_unordered(_captured, tasks)
+
+
+def merge_stats(rows):
+    total = {'files': Counter(), 'sentences': 0, 'aligned': 0, 'skipped': 0,
+             'words': 0, 'subwords': 0, 'errors': Counter()}
+    for _, stats in rows:
+        total['files'][stats['status']] += 1
+        if stats['status'] != 'aligned':
+            continue
+        for key in ('sentences', 'aligned', 'skipped', 'words', 'subwords'):
+            total[key] += stats.get(key, 0)
+        total['errors'].update(stats.get('errors', {}))
+    return total
+
+
+def run_batch(jobs, workers=None, force=False, greedy=False, summary_file=None, vocab=None, merges=None):
+    """
+    Align all (subwords, text, tags, output) jobs; returns the merged totals.
+    SentencePiece jobs take their piece table from `vocab`, OBPE jobs from `merges`.
+    """
+    start = time.perf_counter()
+    rows = []
+    args = [((sub, txt, tag, out, force, greedy, vocab, merges),) for sub, txt, tag, out in jobs]
+    for (out_path, stats), report in run_pool(run_job, args, workers):
+        rows.append((out_path, stats))
+        status = stats['status']
+        if status == 'aligned':
+            rate = stats['sentences'] / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+            print(f"[DONE] {out_path}: {stats['aligned']}/{stats['sentences']} sentences, "
+                  f"{stats['words']} words in {stats['seconds']:.2f}s ({rate:,.0f} sentences/sec)")
+            for index, reason in stats['examples']:
+                print(f"    [WARN] Mismatch at Sentence Index {index}: {reason}")
+        elif status == 'skipped':
+            print(f"[SKIP] {out_path}: output is newer than its inputs")
+        elif status == 'missing':
+            print(f"[MISSING] {out_path}: {stats['message']}")
+        else:
+            print(f"[FAIL] {out_path}: {stats['message']}")
+        # whatever the job printed itself, kept under its status line
+        if report:
+            print(report, end='' if report.endswith('\n') else '\n')
+
+    total = merge_stats(rows)
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(jobs)} jobs: " + ', '.join(f"{n} {s}" for s, n in sorted(total['files'].items())))
+    print(f"Aligned {total['aligned']}/{total['sentences']} sentences, {total['words']} words, "
+          f"{total['subwords']} subwords in {elapsed:.2f}s")
+    for reason, n in total['errors'].most_common():
+        print(f"  skipped {n}: {reason}")
+
+    if summary_file:
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'totals': dict(total, files=dict(total['files']), errors=dict(total['errors'])),
+                'jobs': [dict({k: v for k, v in stats.items() if k != 'examples'},
+                              output=out_path, errors=dict(stats.get('errors', {})))
+                         for out_path, stats in sorted(rows)],
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Summary saved to: {summary_file}")
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Align many (subwords, text, tags) triples in parallel')
+    parser.add_argument('--manifest', help='Job list: subwords text tags output')
+    parser.add_argument('--subwords', help='Subword file template with {fields}, e.g. .../{lang}_{split}.{tok}')
+    parser.add_argument('--text', help='Text file template (same fields)')
+    parser.add_argument('--tags', help='Tags file template (same fields)')
+    parser.add_argument('--output', help='Output JSON template (same fields)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='Re-align even if outputs are newer than inputs')
+    parser.add_argument('--greedy', action='store_true',
+                        help='Use the old string-rebuilding greedy alignment instead of offsets')
+    parser.add_argument('--summary_file', help='Also write per-file and total stats here (JSON)')
+    parser.add_argument('--vocab', help='SentencePiece .vocab file to build the piece table from (bpe/unigram jobs)')
+    parser.add_argument('--merges', help='OBPE merges file to build the piece table from (obpe jobs)')
+    args = parser.parse_args()
+
+    jobs = []
+    if args.manifest:
+        jobs.extend(read_manifest(args.manifest))
+    if args.subwords:
+        if not (args.text and args.tags and args.output):
+            parser.error("--subwords needs --text, --tags and --output")
+        jobs.extend(jobs_from_templates(args.subwords, args.text, args.tags, args.output))
+    if not args.manifest and not args.subwords:
+        parser.error("give --manifest or --subwords/--text/--tags/--output")
+
+    run_batch(jobs, args.workers, args.force, args.greedy, args.summary_file, args.vocab, args.merges)
@@ -0,0 +1,205 @@
+"""
+Vocabularies and id arrays for the BiLSTM tagger, cached on disk.
+
+Every aligned file (.json, .jsonl or .npz, see aligned_io.py) is turned
+into three flat arrays:
+  tokens   int32, word_to_idx id of every subword (<UNK> if unknown)
+  labels   int32, tag_to_idx id of every train_label (<PAD> if unknown)
+  offsets  int64, num_sequences + 1 starts into tokens/labels
+A sequence is one sentence, broken up after the word that reaches max_len
+subwords and cut to max_len, as JSONPOSDataset has always done.
+
+With a cache directory the vocabulary of the training files and the arrays
+of every split are written once and then memory-mapped:
+  <cache_dir>/vocab-<key>.json           key: contents of the vocab files
+  <cache_dir>/<name>-<key>/{tokens,labels,offsets}.npy
+                                         key: contents of the split, the vocabulary and max_len
+Keys hash file contents, not paths or mtimes, so a changed input builds a
+new entry and a copied one reuses the old. Stale entries are never removed.
+
+python tagger_scripts/bilstm_cache.py \
+    --train_file ./pilot_data/ud_data/aligned_json/sme_train_bpe_aligned_v3.json \
+    --dev_file ./pilot_data/ud_data/aligned_json/sme_dev_bpe_aligned_v3.json \
+    --test_file ./pilot_data/ud_data/aligned_json/sme_test_bpe_aligned_v3.json \
+    --cache_dir ./cache/bilstm_pos
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from corpus_io import source_path, split_member
+from oversampling import is_view, read_view
+
+from aligned_io import iter_items, iter_sentences
+
+CACHE_VERSION = 1
+ARRAYS = ('tokens', 'labels', 'offsets')
+HASH_CHUNK = 1 << 20
+
+
+def expand_views(json_files):
+    """Replace oversampled .view.json entries by their source files."""
+    paths = []
+    for file_path in json_files:
+        paths.extend(read_view(file_path)['sources'] if is_view(file_path) else [file_path])
+    return paths
+
+
+def build_vocab_from_json(json_files):
+    word_freq = defaultdict(int)
+    tag_set = set()
+
+    for file_path in expand_views(json_files):
+        for item in iter_items(file_path):
+            # Add subwords
+            for sub in item['subwords']:
+                word_freq[sub] += 1
+            # Add tags (excluding <PAD> which we handle manually)
+            for tag in item['train_labels']:
+                if tag != '<PAD>':
+                    tag_set.add(tag)
+
+    # 构建词汇表
+    word_to_idx = {'<PAD>': 0, '<UNK>': 1}
+    for word, freq in word_freq.items():
+        if freq >= 1:  # 出现一次就加入
+            word_to_idx[word] = len(word_to_idx)
+
+    # 构建标签映射
+    tag_to_idx = {'<PAD>': 0} # PAD ID must strictly be 0 for NLLLoss
+    for idx, tag in enumerate(sorted(list(tag_set))):
+        tag_to_idx[tag] = idx + 1 # Shift index to accommodate PAD
+
+    return word_to_idx, tag_to_idx
+
+
+def encode_file(json_file, word_to_idx, tag_to_idx, max_len=128):
+    """(tokens, labels, offsets) of one aligned file (not a view)."""
+    tokens, labels, offsets = array('i'), array('i'), array('q', [0])
+    unk, pad = word_to_idx['<UNK>'], tag_to_idx['<PAD>']
+
+    def add_sequence(subwords, tags):
+        # Truncate if exceeding max_len (only the word that crossed max_len)
+        tokens.extend(word_to_idx.get(w, unk) for w in subwords[:max_len])
+        labels.extend(tag_to_idx.get(t, pad) for t in tags[:max_len])
+        offsets.append(len(tokens))
+
+    for sentence in iter_sentences(json_file):
+        current_subwords = []
+        current_tags = []
+        for item in sentence:
+            current_subwords.extend(item['subwords'])
+            current_tags.extend(item['train_labels'])
+            # If a sentence gets too long, we force a break to manage memory
+            if len(current_subwords) >= max_len:
+                add_sequence(current_subwords, current_tags)
+                current_subwords = []
+                current_tags = []
+        if current_subwords:
+            add_sequence(current_subwords, current_tags)
+
+    return (np.frombuffer(tokens, dtype=np.int32), np.frombuffer(labels, dtype=np.int32),
+            np.frombuffer(offsets, dtype=np.int64))
+
+
+# --- keys ---
+
+def file_digest(path):
+    """sha1 of the bytes behind `path` (the whole archive and the member name for members)."""
+    h = hashlib.sha1()
+    archive, member = split_member(path)
+    if member is not None:
+        h.update(member.encode('utf-8') + b'\0')
+    with open(source_path(path), 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def vocab_digest(word_to_idx, tag_to_idx):
+    """sha1 of a vocabulary in id order, so equal vocabularies share split caches."""
+    h = hashlib.sha1()
+    for table in (word_to_idx, tag_to_idx):
+        for token, idx in table.items():
+            h.update(f"{idx}\t{token}\n".encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _key(*parts):
+    return hashlib.sha1('\0'.join(str(p) for p in (CACHE_VERSION,) + parts).encode('utf-8')).hexdigest()[:16]
+
+
+# --- cache ---
+
+def cached_vocab(json_files, cache_dir=None):
+    """build_vocab_from_json(json_files), read from or saved to cache_dir."""
+    if not cache_dir:
+        return build_vocab_from_json(json_files)
+    path = os.path.join(cache_dir, f"vocab-{_key(*map(file_digest, expand_views(json_files)))}.json")
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+        return vocab['word_to_idx'], vocab['tag_to_idx']
+    word_to_idx, tag_to_idx = build_vocab_from_json(json_files)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'word_to_idx': word_to_idx, 'tag_to_idx': tag_to_idx}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return word_to_idx, tag_to_idx
+
+
+def cached_arrays(json_file, word_to_idx, tag_to_idx, max_len=128, cache_dir=None):
+    """
+    encode_file(...), or with cache_dir its arrays memory-mapped (read-only)
+    from the cache, encoding and saving them first if they are not there.
+    """
+    if not cache_dir:
+        return encode_file(json_file, word_to_idx, tag_to_idx, max_len)
+    name = os.path.basename(split_member(json_file)[1] or json_file)
+    entry = os.path.join(cache_dir, f"{name}-{_key(file_digest(json_file), vocab_digest(word_to_idx, tag_to_idx), max_len)}")
+    if not os.path.isdir(entry):
+        arrays = encode_file(json_file, word_to_idx, tag_to_idx, max_len)
+        tmp_entry = f"{entry}.tmp.{os.getpid()}"
+        os.makedirs(tmp_entry, exist_ok=True)
+        for array_name, values in zip(ARRAYS, arrays):
+            np.save(os.path.join(tmp_entry, f"{array_name}.npy"), values)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another run saved the same entry first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+    return tuple(np.load(os.path.join(entry, f"{array_name}.npy"), mmap_mode='r') for array_name in ARRAYS)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the cached vocabulary and id arrays for train_bilstm_pos.py')
+    parser.add_argument('--train_file', type=str, required=True)
+    parser.add_argument('--dev_file', type=str, required=True)
+    parser.add_argument('--test_file', type=str, default=None)
+    parser.add_argument('--cache_dir', type=str, required=True)
+    parser.add_argument('--max_len', type=int, default=128)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    word_to_idx, tag_to_idx = cached_vocab([args.train_file, args.dev_file], args.cache_dir)
+    print(f"Vocab Size: {len(word_to_idx)}")
+    print(f"Tag Set Size: {len(tag_to_idx)}")
+    for split in (args.train_file, args.dev_file, args.test_file):
+        if not split:
+            continue
+        for source in expand_views([split]):
+            tokens, _, offsets = cached_arrays(source, word_to_idx, tag_to_idx, args.max_len, args.cache_dir)
+            print(f"{source}: {len(offsets) - 1} sequences, {len(tokens)} subwords")
+    print(f"Cache ready in {time.perf_counter() - start:.2f}s: {args.cache_dir}")
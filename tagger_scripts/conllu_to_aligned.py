@@ -0,0 +1,178 @@
+'''
+One streaming pass from a CoNLL-U treebank to aligned POS training data:
+extract forms/UPOS -> tokenize with a BPE/Unigram/OBPE model -> align
+subwords to tags -> write records, in chunks of --chunk_size sentences.
+
+python tagger_scripts/conllu_to_aligned.py \
+    --conllu ./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-train.conllu \
+    --tokenizer bpe --model ./models/bpe/et_bpe_model.model \
+    --output ./pilot_data/ud_data/aligned_json/et_train_bpe_aligned_v3.json
+
+The output is the same JSON list alignment_v3.py writes (.jsonl and .npz
+outputs hold sentences or columns, see aligned_io.py). The .txt, .tags
+and subword files of the staged pipeline are only written when asked for
+with --debug_text / --debug_tags / --debug_subwords. --conllu may be
+compressed or an archive member, and any output ending in .gz/.xz/.bz2/.zst
+is written compressed (see tokenizer_scripts/corpus_io.py).
+'''
+
+import argparse
+import os
+import sys
+import time
+from itertools import islice
+
+import sentencepiece as spm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from conllu import read_conllu, FORM, UPOS
+from corpus_io import open_output
+from piece_table import PieceTable
+from sentence_index import select_conllu
+from tokenizer_obpe import OBPEEncoder
+
+from aligned_io import open_aligned_writer
+from alignment_v3 import align_sentence, warn_mismatch
+from span_alignment import piece_table_for, spm_spans
+
+
+class SubwordTokenizer:
+    """Batch sentence tokenizer over a SentencePiece model or OBPE merges."""
+
+    def __init__(self, tokenizer_type, model_path, num_threads=-1):
+        self.tokenizer_type = tokenizer_type
+        self.model_path = model_path
+        self.num_threads = num_threads
+        if tokenizer_type == 'obpe':
+            self.model = OBPEEncoder.from_codes(model_path)
+            self.strategy = 'OBPE'
+        else:
+            self.model = spm.SentencePieceProcessor(model_file=model_path)
+            self.strategy = 'SPIECE'
+
+    def piece_table(self):
+        """PieceTable over the model's whole vocabulary (the merges' symbols for OBPE)."""
+        if self.tokenizer_type == 'obpe':
+            return piece_table_for(self.strategy, merges=self.model_path)
+        return PieceTable('bpe', [self.model.id_to_piece(i) for i in range(self.model.get_piece_size())])
+
+    def encode(self, lines):
+        """Space-joined subword strings, one per line (same as the tokenizer scripts write)."""
+        return self.encode_with_spans(lines)[0]
+
+    def encode_with_spans(self, lines):
+        """
+        (subword lines, spans): spans[i] holds the character span in lines[i]
+        of every piece, or None where the tokenizer could not give them.
+        """
+        if self.tokenizer_type == 'obpe':
+            encoded = [self.model.encode_sentence_spans(line) for line in lines]
+            return [' '.join(pieces) for pieces, _ in encoded], [spans for _, spans in encoded]
+        pieces = self.model.encode(lines, out_type=str, num_threads=self.num_threads)
+        spans = [spm_spans(self.model, line, p) for line, p in zip(lines, pieces)]
+        return [' '.join(p) for p in pieces], spans
+
+
+def iter_text_and_tags(sentences):
+    """(text line, tags line) per sentence, exactly as extract_text_and_pos_v4 writes them."""
+    for sent in sentences:
+        forms, tags = sent.columns(FORM, UPOS)
+        if forms:
+            yield ' '.join(forms), ' '.join(tags)
+
+
+def run_pipeline(conllu_file, tokenizer, output_file, chunk_size=1000, sentences=None,
+                 debug_text=None, debug_tags=None, debug_subwords=None):
+    """Returns (sentences read, sentences skipped, words written, seconds)."""
+    start = time.perf_counter()
+    source = select_conllu(conllu_file, sentences) if sentences else read_conllu(conllu_file)
+    pairs = iter_text_and_tags(source)
+
+    debug_files = []
+    def open_debug(path):
+        if not path:
+            return None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open_output(path)
+        debug_files.append(f)
+        return f
+    f_text, f_tags, f_subs = open_debug(debug_text), open_debug(debug_tags), open_debug(debug_subwords)
+
+    writer = open_aligned_writer(output_file)
+    # used for sentences the encoder gave no offsets for
+    table = tokenizer.piece_table()
+    sentence_count = skipped_count = 0
+    try:
+        while True:
+            chunk = list(islice(pairs, chunk_size))
+            if not chunk:
+                break
+            # text lines are stripped before encoding, as the tokenizer scripts do
+            texts = [text.strip() for text, _ in chunk]
+            subword_lines, spans = tokenizer.encode_with_spans(texts)
+            for (text, tags), sub_line, sub_spans in zip(chunk, subword_lines, spans):
+                if f_text:
+                    f_text.write(text + '\n')
+                if f_tags:
+                    f_tags.write(tags + '\n')
+                if f_subs:
+                    f_subs.write(sub_line + '\n')
+
+                # spans come from the encoder, so no word is rebuilt from its pieces;
+                # they index the encoded text, which is ' '.join(words) unless a
+                # form contains whitespace
+                words = text.split()
+                if sub_spans is not None and ' '.join(words) != text.strip():
+                    sub_spans = None
+                records, error_info = align_sentence(words, tags.split(), sub_line.split(),
+                                                     tokenizer.strategy, sub_spans, table=table)
+                if error_info:
+                    if skipped_count < 5 and error_info.get('error') != "Word/tag count mismatch":
+                        warn_mismatch(sentence_count, error_info)
+                    skipped_count += 1
+                else:
+                    writer.add_sentence(records, sentence_count)
+                sentence_count += 1
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        for f in debug_files:
+            f.close()
+
+    if writer.count:
+        writer.close()
+    else:
+        # alignment_v3 writes nothing when no sentence aligned
+        writer.discard()
+    return sentence_count, skipped_count, writer.count, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CoNLL-U -> subwords -> aligned POS training data in one pass')
+    parser.add_argument('--conllu', required=True, help='Input treebank')
+    parser.add_argument('--tokenizer', choices=['bpe', 'unigram', 'obpe'], required=True, help='Tokenizer type')
+    parser.add_argument('--model', required=True, help='SentencePiece .model file, or OBPE merges.txt')
+    parser.add_argument('--output', required=True, help='Aligned JSON output')
+    parser.add_argument('--chunk_size', type=int, default=1000, help='Sentences per tokenize/align batch')
+    parser.add_argument('--num_threads', type=int, default=-1, help='SentencePiece encode threads (-1 = all cores)')
+    parser.add_argument('--sentences', help='Only these sentences: START:STOP, i,j,k or @file (numbers or sent_ids)')
+    parser.add_argument('--debug_text', help='Also write the extracted text here')
+    parser.add_argument('--debug_tags', help='Also write the extracted tags here')
+    parser.add_argument('--debug_subwords', help='Also write the subword lines here')
+    args = parser.parse_args()
+
+    tokenizer = SubwordTokenizer(args.tokenizer, args.model, args.num_threads)
+    total, skipped, words, seconds = run_pipeline(
+        args.conllu, tokenizer, args.output, args.chunk_size, args.sentences,
+        args.debug_text, args.debug_tags, args.debug_subwords)
+
+    rate = total / seconds if seconds > 0 else float('inf')
+    if words:
+        print(f"    [SUCCESS] Generated: {os.path.basename(args.output)} ({words} words)")
+        if skipped:
+            print(f"              (Skipped {skipped} sentences due to mismatch)")
+    else:
+        print(f"    [FAIL] No valid data found.")
+    print(f"{total} sentences in {seconds:.2f}s ({rate:,.0f} sentences/sec)")
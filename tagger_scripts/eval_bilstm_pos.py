@@ -12,10 +12,9 @@ import argparse
 import os
 import random
 import numpy as np
-from torch.utils.data import DataLoader
 from sklearn.metrics import f1_score, classification_report
 # Import the classes from your training script 
-from train_bilstm_pos import BiLSTMPOSTagger, JSONPOSDataset
+from train_bilstm_pos import BiLSTMPOSTagger, JSONPOSDataset, make_loader
 
 def set_seed(seed):
     random.seed(seed)
@@ -33,7 +32,11 @@ def evaluate_best_model():
     parser.add_argument('--model_path', type=str, required=True, help="Path to best_model.pt")
     parser.add_argument('--test_file', type=str, required=True, help="Path to test .json file")
     parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--max_tokens', type=int, default=None,
+                        help="Token-budget batching: at most this many padded subwords per batch (overrides --batch_size)")
     parser.add_argument('--seed', type=int, default=42, help="Random seed for reproducibility")
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help="Reuse (or save) the test id arrays here (see bilstm_cache.py)")
     args = parser.parse_args()
     set_seed(args.seed)
 
@@ -51,6 +54,10 @@ def evaluate_best_model():
     tag_to_idx = checkpoint['tag_to_idx']
     saved_args = checkpoint['args']
     model_state_dict = checkpoint['model_state_dict']
+    # Checkpoints from before length-aware forward passes were trained on sentences padded to
+    # 128 subwords, and their backward LSTM direction learned to read that padding:
+    # evaluate them the same way
+    packed = checkpoint.get('packed', False)
 
     # 2. Re-create the Model Structure
     model = BiLSTMPOSTagger(
@@ -66,8 +73,11 @@ def evaluate_best_model():
 
     # 3. Load Test Data
     print(f"Loading test data: {args.test_file}")
-    test_dataset = JSONPOSDataset(args.test_file, word_to_idx, tag_to_idx)
-    test_loader = DataLoader(test_dataset, batch_size=args.batch_size)
+    test_dataset = JSONPOSDataset(args.test_file, word_to_idx, tag_to_idx, cache_dir=args.cache_dir)
+    test_loader = make_loader(test_dataset, args.batch_size, args.max_tokens,
+                              pad_to=None if packed else 128)
+    if not packed:
+        print("Checkpoint predates length-aware training: padding to 128 subwords as in its training")
 
     # 4. Run Prediction
     all_preds = []
@@ -76,7 +86,7 @@ def evaluate_best_model():
     print("Running evaluation...")
     with torch.no_grad():
         for words, tags, mask in test_loader:
-            tag_scores = model(words)
+            tag_scores = model(words, mask.sum(1) if packed else None)
             predicted = tag_scores.argmax(2)
 
             # Filter out padding (using the mask)
@@ -0,0 +1,202 @@
+"""
+Subword -> word alignment on character offsets.
+
+Every subword gets a (begin, end) span in the sentence text it was encoded
+from, and is assigned to the word whose interval contains it; no word is
+rebuilt from its pieces.
+  SentencePiece  spans from the model's normalizer offsets (spm_spans)
+  OBPE           spans recorded while encoding (OBPEEncoder.encode_sentence_spans)
+  subword files  without a model, pieces are grouped by their word-boundary
+                 markers when every group spells its word (NFKC), and by
+                 NFKC lengths (one normalize call per sentence) otherwise;
+                 with a PieceTable (tokenizer_scripts/piece_table.py) the
+                 normalized surfaces are looked up per piece id instead
+
+    groups, error_info = align_pieces(words, pieces, 'SPIECE', spans)
+    groups, error_info = align_pieces(words, pieces, 'OBPE', table=piece_table_for('OBPE', merges='merges.txt'))
+"""
+
+import os
+import re
+import sys
+import unicodedata
+from bisect import bisect_right
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from piece_table import PieceTable
+
+SPIECE_MARKER = '▁'
+OBPE_MARKER = '</w>'
+UNK_PIECES = ('<unk>', '[unk]')
+WORD = re.compile(r'\S+')
+# joins pieces / words so one normalize call covers a whole sentence
+SEPARATOR = '\x00'
+
+
+def word_spans(text):
+    """(begin, end) character span of every whitespace-separated word of text."""
+    return [m.span() for m in WORD.finditer(text)]
+
+
+def assign_spans(spans_of_words, piece_spans):
+    """
+    Group piece indices by the word their span falls in.
+    A piece is placed by its last character (its begin for empty spans), so
+    a SentencePiece '▁' covering the space before a word goes with that word.
+    Returns (groups, None) or (None, error_info).
+    """
+    ends = [end for _, end in spans_of_words]
+    groups = [[] for _ in spans_of_words]
+    for i, (begin, end) in enumerate(piece_spans):
+        anchor = end - 1 if end > begin else begin
+        w = bisect_right(ends, anchor)
+        if w == len(groups):
+            return None, {"error": "Subword past the last word", "piece": i}
+        if w > 0 and begin < ends[w - 1]:
+            return None, {"error": "Subword crosses a word boundary", "piece": i, "word": w}
+        groups[w].append(i)
+    for w, group in enumerate(groups):
+        if not group:
+            return None, {"error": "Word without subwords", "word": w}
+    return groups, None
+
+
+def spm_spans(sp, text, pieces):
+    """
+    Character spans in `text` of SentencePiece `pieces` (as encode(out_type=str)
+    returns them), from the normalizer's offset map. None when the pieces do
+    not spell out the normalized text (byte-fallback pieces) or the installed
+    sentencepiece cannot return offsets.
+    """
+    try:
+        normalized, offsets = sp.normalize(text, with_offsets=True)
+    except (AttributeError, TypeError):
+        return None
+    if sum(map(len, pieces)) != len(normalized) or ''.join(pieces) != normalized:
+        return None
+    spans = []
+    pos = 0
+    for piece in pieces:
+        spans.append((offsets[pos], offsets[pos + len(piece)]))
+        pos += len(piece)
+    return spans
+
+
+def strip_marker(piece, strategy):
+    if strategy == 'OBPE':
+        return piece[:-len(OBPE_MARKER)] if piece.endswith(OBPE_MARKER) else piece
+    return piece[1:] if piece.startswith(SPIECE_MARKER) else piece
+
+
+def piece_table_for(strategy, vocab=None, merges=None):
+    """
+    PieceTable for `strategy`, built ahead of time from a SentencePiece .vocab
+    file (SPIECE) or an OBPE merges file (OBPE) when one is given; otherwise
+    empty, filling up as pieces are seen.
+    """
+    if strategy == 'OBPE':
+        return PieceTable.from_file(merges, 'obpe') if merges else PieceTable('obpe')
+    return PieceTable.from_file(vocab, 'bpe') if vocab else PieceTable('bpe')
+
+
+def marker_groups(pieces, strategy):
+    """Piece indices per word from the markers: '▁' starts a word, '</w>' ends one."""
+    groups = []
+    if strategy == 'OBPE':
+        current = []
+        for i, piece in enumerate(pieces):
+            current.append(i)
+            if piece.endswith(OBPE_MARKER):
+                groups.append(current)
+                current = []
+        if current:
+            groups.append(current)
+        return groups
+    for i, piece in enumerate(pieces):
+        if not groups or piece.startswith(SPIECE_MARKER):
+            groups.append([i])
+        else:
+            groups[-1].append(i)
+    return groups
+
+
+def normalized_surfaces(words, pieces, strategy, table=None):
+    """
+    (NFKC words, NFKC piece surfaces without markers, unknown-piece flags).
+    Words are normalized with one call; piece surfaces come from `table`
+    (a PieceTable for `strategy`) or from one normalize call too.
+    """
+    if table is not None:
+        ids = table.ids(pieces)
+        norm_surface = table.norm_surface
+        norm_pieces = [norm_surface[i] for i in ids.tolist()]
+        unk = table.is_unk[ids].tolist()
+    else:
+        cores = [strip_marker(p, strategy) for p in pieces]
+        unk = [core.lower() in UNK_PIECES for core in cores]
+        norm_pieces = unicodedata.normalize('NFKC', SEPARATOR.join(cores)).split(SEPARATOR)
+    norm_words = unicodedata.normalize('NFKC', SEPARATOR.join(words)).split(SEPARATOR)
+    return norm_words, norm_pieces, unk
+
+
+def length_spans(words, pieces, strategy, table=None, normalized=None):
+    """
+    Spans of the pieces over the words laid end to end, from NFKC lengths,
+    checking once per sentence that they spell the same characters.
+    `normalized` is normalized_surfaces(...) when the caller already has it.
+    Returns (word spans, piece spans) or (None, error_info).
+    """
+    norm_words, norm_pieces, unk = normalized or normalized_surfaces(words, pieces, strategy, table)
+    if any(unk):
+        return None, {"error": "Unknown piece without offsets"}
+    if ''.join(norm_words) != ''.join(norm_pieces):
+        return None, {"error": "Subwords do not spell the sentence",
+                      "orig_norm": ' '.join(norm_words), "built": ' '.join(norm_pieces)}
+    def spans(parts):
+        result, pos = [], 0
+        for part in parts:
+            result.append((pos, pos + len(part)))
+            pos += len(part)
+        return result
+    return spans(norm_words), spans(norm_pieces)
+
+
+def groups_spell_words(index_groups, normalized):
+    """
+    True if every group of piece indices spells its word (NFKC). A group with
+    an unknown piece is taken to match, as the greedy aligner does.
+    """
+    norm_words, norm_pieces, unk = normalized
+    for word, group in zip(norm_words, index_groups):
+        if any(unk[i] for i in group):
+            continue
+        if ''.join(norm_pieces[i] for i in group) != word:
+            return False
+    return True
+
+
+def align_pieces(words, pieces, strategy, spans=None, table=None):
+    """
+    Group `pieces` into one list per word of `words`.
+    `spans` are the pieces' character spans in ' '.join(words), when the
+    tokenizer provided them; otherwise pieces go by their markers when
+    those give one group per word that spells it, and by their normalized
+    surfaces from `table` (a PieceTable for `strategy`) when they do not.
+    Returns (groups, None) or (None, error_info).
+    """
+    if spans is not None:
+        index_groups, error_info = assign_spans(word_spans(' '.join(words)), spans)
+    else:
+        index_groups = marker_groups(pieces, strategy)
+        error_info = None
+        normalized = normalized_surfaces(words, pieces, strategy, table)
+        # equal counts are not enough: subwords out of step with the text can
+        # still give one group per word
+        if len(index_groups) != len(words) or not groups_spell_words(index_groups, normalized):
+            word_sp, piece_sp = length_spans(words, pieces, strategy, table, normalized)
+            if word_sp is None:
+                return None, piece_sp
+            index_groups, error_info = assign_spans(word_sp, piece_sp)
+    if error_info:
+        return None, error_info
+    return [[pieces[i] for i in group] for group in index_groups], None
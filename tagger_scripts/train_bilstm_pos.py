@@ -6,22 +6,30 @@ python tagger_scripts/train_bilstm_pos.py \
     --model_dir ./models/bilstm_pos_bpe/ \
     --epochs 50 \
     --batch_size 32 \
-    --seed 42
+    --seed 42 \
+    --cache_dir ./cache/bilstm_pos
 '''
 # train_bilstm_pos_simple.py
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler
 import numpy as np
-from collections import defaultdict
+from bisect import bisect_right
+from functools import partial
 from sklearn.metrics import accuracy_score
 from sklearn.metrics import f1_score, classification_report
 import argparse
 import os
+import sys
 import json
 import random
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+from oversampling import is_view, read_view, iter_plan
+
+from bilstm_cache import cached_arrays, cached_vocab
+
 def set_seed(seed):
     random.seed(seed)
     np.random.seed(seed)
@@ -35,74 +43,138 @@ def set_seed(seed):
 
 
 class JSONPOSDataset(Dataset):
-    def __init__(self, json_file, word_to_idx, tag_to_idx, max_len=128):
-        self.sentences = []
-        self.labels = []
-        
-        # Load JSON data
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        current_subwords = []
-        current_tags = []
-        
-        for item in data:
-            # item structure: 
-            # {"orig_word": "...", "subwords": ["...", "..."], "train_labels": ["TAG", "<PAD>"]}
-            
-            # Extend current sentence sequence
-            current_subwords.extend(item['subwords'])
-            current_tags.extend(item['train_labels'])
-            
-            # Heuristic Sentence Boundary Detection
-            # UD sentences usually end with specific punctuation
-            # If sequence gets too long, we also force a break to manage memory
-            is_boundary = item['orig_word'] in ['.', '!', '?', '...'] 
-            
-            if is_boundary or len(current_subwords) >= max_len:
-                # Process the sentence if it has content
-                if current_subwords:
-                    # Truncate if exceeding max_len (rare if split by punctuation)
-                    trunc_words = current_subwords[:max_len]
-                    trunc_tags = current_tags[:max_len]
-                    
-                    # Convert to IDs
-                    word_ids = [word_to_idx.get(w, word_to_idx['<UNK>']) for w in trunc_words]
-                    tag_ids = [tag_to_idx.get(t, tag_to_idx['<PAD>']) for t in trunc_tags]
-                    
-                    # Padding
-                    pad_len = max_len - len(word_ids)
-                    padded_words = word_ids + [word_to_idx['<PAD>']] * pad_len
-                    padded_tags = tag_ids + [tag_to_idx['<PAD>']] * pad_len
-                    mask = [1] * len(word_ids) + [0] * pad_len
-                    
-                    self.sentences.append((padded_words, mask))
-                    self.labels.append(padded_tags)
-                
-                # Reset
-                current_subwords = []
-                current_tags = []
+    """
+    Items are (word ids, tag ids) int32 slices of the flat arrays bilstm_cache.py
+    builds for each source file; with cache_dir those are memory-mapped from disk.
+    """
+
+    def __init__(self, json_file, word_to_idx, tag_to_idx, max_len=128, cache_dir=None):
+        # (tokens, labels, offsets) per source file and the first item of each
+        self.parts = []
+        self.starts = [0]
+        # item -> sequence mapping for oversampled views (None = identity)
+        self.index = None
         
-        # Catch any leftover words as a final sentence
-        if current_subwords:
-            # ... (Same processing logic as above for leftover)
-            trunc_words = current_subwords[:max_len]
-            trunc_tags = current_tags[:max_len]
-            word_ids = [word_to_idx.get(w, word_to_idx['<UNK>']) for w in trunc_words]
-            tag_ids = [tag_to_idx.get(t, tag_to_idx['<PAD>']) for t in trunc_tags]
-            pad_len = max_len - len(word_ids)
-            padded_words = word_ids + [word_to_idx['<PAD>']] * pad_len
-            padded_tags = tag_ids + [tag_to_idx['<PAD>']] * pad_len
-            mask = [1] * len(word_ids) + [0] * pad_len
-            self.sentences.append((padded_words, mask))
-            self.labels.append(padded_tags)
+        # Oversampled view (see tokenizer_scripts/oversampling.py): each source is
+        # loaded once and repeated/sampled through self.index, nothing is copied
+        spec = read_view(json_file) if is_view(json_file) else None
+        for source in (spec['sources'] if spec else [json_file]):
+            self.parts.append(cached_arrays(source, word_to_idx, tag_to_idx, max_len, cache_dir))
+            self.starts.append(self.starts[-1] + len(self.parts[-1][2]) - 1)
+        if spec:
+            sizes = [end - start for start, end in zip(self.starts, self.starts[1:])]
+            self.index = [self.starts[src] + i for src, i in
+                          iter_plan(sizes, spec['multipliers'], spec['temperature'], spec['size'], spec['seed'])]
 
     def __len__(self):
-        return len(self.sentences)
+        return self.starts[-1] if self.index is None else len(self.index)
     
     def __getitem__(self, idx):
-        words, mask = self.sentences[idx]
-        return torch.tensor(words), torch.tensor(self.labels[idx]), torch.tensor(mask)
+        if self.index is not None:
+            idx = self.index[idx]
+        part = 0 if len(self.parts) == 1 else bisect_right(self.starts, idx) - 1
+        tokens, labels, offsets = self.parts[part]
+        i = idx - self.starts[part]
+        start, end = offsets[i], offsets[i + 1]
+        return tokens[start:end], labels[start:end]
+
+    def lengths(self):
+        """Subword count of every item, in dataset order."""
+        lengths = [n for _, _, offsets in self.parts for n in np.diff(offsets).tolist()]
+        return lengths if self.index is None else [lengths[i] for i in self.index]
+
+
+def pad_collate(batch, pad_to=None):
+    """
+    Stack (word ids, tag ids) items into (words, tags, mask), padded to the
+    longest item in the batch (or to `pad_to`). Index 0 is <PAD> in both vocabs.
+    """
+    longest = pad_to or max(len(words) for words, _ in batch)
+    # filled in NumPy (items may be read-only memory maps) and wrapped once per batch
+    words = np.zeros((len(batch), longest), dtype=np.int64)
+    tags = np.zeros((len(batch), longest), dtype=np.int64)
+    mask = np.zeros((len(batch), longest), dtype=np.int64)
+    for i, (word_ids, tag_ids) in enumerate(batch):
+        n = len(word_ids)
+        words[i, :n] = word_ids
+        tags[i, :n] = tag_ids
+        mask[i, :n] = 1
+    return torch.from_numpy(words), torch.from_numpy(tags), torch.from_numpy(mask)
+
+
+class BucketBatchSampler(Sampler):
+    """
+    Batches of items with similar lengths, so pad_collate pads little.
+    With shuffle, items are shuffled, cut into mega-batches of about
+    `bucket_batches` batches, sorted by length within each, cut into batches,
+    and the batches shuffled; without it the whole dataset is sorted.
+    Batches hold `batch_size` items, or with `max_tokens` as many items as fit
+    in max_tokens padded subwords (at least one).
+    """
+
+    def __init__(self, lengths, batch_size=32, max_tokens=None, shuffle=True, bucket_batches=50, seed=42):
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.bucket_batches = bucket_batches
+        self.rng = random.Random(seed)
+        # estimate until the first epoch is planned (exact for fixed-size batches)
+        self.num_batches = len(self._batches(shuffle=False))
+
+    def _mega_batches(self, order, shuffle):
+        if not shuffle:
+            return [order]
+        megas, current, tokens = [], [], 0
+        for i in order:
+            current.append(i)
+            tokens += self.lengths[i]
+            full = (tokens >= self.max_tokens * self.bucket_batches if self.max_tokens
+                    else len(current) >= self.batch_size * self.bucket_batches)
+            if full:
+                megas.append(current)
+                current, tokens = [], 0
+        if current:
+            megas.append(current)
+        return megas
+
+    def _batches(self, shuffle):
+        order = list(range(len(self.lengths)))
+        if shuffle:
+            self.rng.shuffle(order)
+        batches = []
+        for mega in self._mega_batches(order, shuffle):
+            mega.sort(key=self.lengths.__getitem__)
+            if not self.max_tokens:
+                batches.extend(mega[i:i + self.batch_size] for i in range(0, len(mega), self.batch_size))
+                continue
+            batch = []
+            for i in mega:
+                # sorted, so the new item is the longest in the batch
+                if batch and (len(batch) + 1) * self.lengths[i] > self.max_tokens:
+                    batches.append(batch)
+                    batch = []
+                batch.append(i)
+            if batch:
+                batches.append(batch)
+        if shuffle:
+            self.rng.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        batches = self._batches(self.shuffle)
+        self.num_batches = len(batches)
+        return iter(batches)
+
+    def __len__(self):
+        return self.num_batches
+
+
+def make_loader(dataset, batch_size=32, max_tokens=None, shuffle=False, seed=42, pad_to=None):
+    """DataLoader over length-bucketed, dynamically padded batches."""
+    sampler = BucketBatchSampler(dataset.lengths(), batch_size, max_tokens, shuffle, seed=seed)
+    collate = pad_collate if pad_to is None else partial(pad_collate, pad_to=pad_to)
+    return DataLoader(dataset, batch_sampler=sampler, collate_fn=collate)
 
 class BiLSTMPOSTagger(nn.Module):
     def __init__(self, vocab_size, tagset_size, embedding_dim=100, hidden_dim=128):
@@ -116,43 +188,31 @@ class BiLSTMPOSTagger(nn.Module):
         self.hidden2tag = nn.Linear(hidden_dim, tagset_size)
         self.dropout = nn.Dropout(0.3)
     
-    def forward(self, sentence):
+    def forward(self, sentence, lengths=None):
+        """
+        Log-probabilities of every tag at every position of the (batch, seq) id tensor.
+        With `lengths` (real subwords per sentence, e.g. mask.sum(1)) the LSTM never
+        reads padding: sentences of equal length go through it together, cut to that
+        length, which gives what packed sequences give (the backward direction starts
+        at the last real subword) while staying on the fused CPU kernel that
+        pack_padded_sequence falls off. Bucketed batches hold few distinct lengths.
+        Outputs at padding positions are zeros and must be masked, as the loss and
+        metrics do.
+        """
         embeds = self.word_embeddings(sentence)
-        lstm_out, _ = self.lstm(embeds)
+        if lengths is None:
+            lstm_out, _ = self.lstm(embeds)
+        else:
+            lstm_out = embeds.new_zeros(embeds.size(0), embeds.size(1), self.hidden_dim)
+            for n in lengths.unique().tolist():
+                rows = (lengths == n).nonzero(as_tuple=True)[0]
+                group_out, _ = self.lstm(embeds[rows, :n])
+                lstm_out[rows, :n] = group_out
         lstm_out = self.dropout(lstm_out)
         tag_space = self.hidden2tag(lstm_out)
         tag_scores = nn.functional.log_softmax(tag_space, dim=2)
         return tag_scores
 
-def build_vocab_from_json(json_files):
-    word_freq = defaultdict(int)
-    tag_set = set()
-    
-    for file_path in json_files:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            for item in data:
-                # Add subwords
-                for sub in item['subwords']:
-                    word_freq[sub] += 1
-                # Add tags (excluding <PAD> which we handle manually)
-                for tag in item['train_labels']:
-                    if tag != '<PAD>':
-                        tag_set.add(tag)
-    
-    # 构建词汇表
-    word_to_idx = {'<PAD>': 0, '<UNK>': 1}
-    for word, freq in word_freq.items():
-        if freq >= 1:  # 出现一次就加入
-            word_to_idx[word] = len(word_to_idx)
-    
-    # 构建标签映射
-    tag_to_idx = {'<PAD>': 0} # PAD ID must strictly be 0 for NLLLoss
-    for idx, tag in enumerate(sorted(list(tag_set))):
-        tag_to_idx[tag] = idx + 1 # Shift index to accommodate PAD
-    
-    return word_to_idx, tag_to_idx
-
 def train_bilstm():
     parser = argparse.ArgumentParser()
     parser.add_argument('--train_file', type=str, required=True)
@@ -162,9 +222,13 @@ def train_bilstm():
     parser.add_argument('--embedding_dim', type=int, default=100)
     parser.add_argument('--hidden_dim', type=int, default=128)
     parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--max_tokens', type=int, default=None,
+                        help="Token-budget batching: at most this many padded subwords per batch (overrides --batch_size)")
     parser.add_argument('--learning_rate', type=float, default=0.001)
     parser.add_argument('--epochs', type=int, default=50)
     parser.add_argument('--seed', type=int, default=42, help="Random seed for reproducibility")
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help="Keep the vocab and id arrays here and reuse them while the inputs are unchanged (see bilstm_cache.py)")
     
     args = parser.parse_args()
     
@@ -174,19 +238,20 @@ def train_bilstm():
     
     # 构建词汇表
     print("Vocab...")
-    word_to_idx, tag_to_idx = build_vocab_from_json([args.train_file, args.dev_file])
+    word_to_idx, tag_to_idx = cached_vocab([args.train_file, args.dev_file], args.cache_dir)
     
     print(f"Vocab Size: {len(word_to_idx)}")
     print(f"Tag Set Size: {len(tag_to_idx)}")
     
     # 创建数据集
-    train_dataset = JSONPOSDataset(args.train_file, word_to_idx, tag_to_idx)
-    dev_dataset = JSONPOSDataset(args.dev_file, word_to_idx, tag_to_idx)
-    test_dataset = JSONPOSDataset(args.test_file, word_to_idx, tag_to_idx)
+    train_dataset = JSONPOSDataset(args.train_file, word_to_idx, tag_to_idx, cache_dir=args.cache_dir)
+    dev_dataset = JSONPOSDataset(args.dev_file, word_to_idx, tag_to_idx, cache_dir=args.cache_dir)
+    test_dataset = JSONPOSDataset(args.test_file, word_to_idx, tag_to_idx, cache_dir=args.cache_dir)
     
-    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True)
-    dev_loader = DataLoader(dev_dataset, batch_size=args.batch_size)
-    test_loader = DataLoader(test_dataset, batch_size=args.batch_size)
+    # length-bucketed batches, padded only to their longest sentence
+    train_loader = make_loader(train_dataset, args.batch_size, args.max_tokens, shuffle=True, seed=args.seed)
+    dev_loader = make_loader(dev_dataset, args.batch_size, args.max_tokens)
+    test_loader = make_loader(test_dataset, args.batch_size, args.max_tokens)
     
     print(f"Train Sentences: {len(train_dataset)}")
     print(f"Dev Sentences: {len(dev_dataset)}")
@@ -211,7 +276,7 @@ def train_bilstm():
 
         for batch_idx, (words, tags, mask) in enumerate(train_loader):
             optimizer.zero_grad()
-            tag_scores = model(words)
+            tag_scores = model(words, mask.sum(1))
             
             # Flatten for loss
             loss = criterion(tag_scores.view(-1, len(tag_to_idx)), tags.view(-1))
@@ -227,7 +292,7 @@ def train_bilstm():
         
         with torch.no_grad():
             for words, tags, mask in dev_loader:
-                tag_scores = model(words)
+                tag_scores = model(words, mask.sum(1))
                 predicted = tag_scores.argmax(2)
                 
                 # Flatten and filter out PAD tokens using mask
@@ -252,7 +317,9 @@ def train_bilstm():
                 'model_state_dict': model.state_dict(),
                 'word_to_idx': word_to_idx,
                 'tag_to_idx': tag_to_idx,
-                'args': vars(args)
+                'args': vars(args),
+                # trained without padding in the LSTM; older checkpoints saw 128 padded subwords
+                'packed': True
             }, os.path.join(args.model_dir, 'best_model.pt'))
             print(f"Saved best model, acc: {val_acc:.4f}")
     
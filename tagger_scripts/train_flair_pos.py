@@ -28,6 +28,8 @@ from pathlib import Path
 from flair.training_utils import EvaluationMetric
 from flair.data import Sentence
 
+from aligned_io import iter_sentences
+
 # hardware setup
 if torch.backends.mps.is_available():
     device = torch.device("mps")
@@ -50,50 +52,45 @@ def set_seed(seed):
 
 
 def load_json_to_flair_list(json_file):
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        
+    # sentences are read lazily from .json, .jsonl or .npz (see aligned_io.py) with the
+    # boundaries the aligner kept; JSON lists written without sent_id are cut after
+    # sentence-final punctuation as before
     sentences_list = []  # Mechanism of Flair requires list of sentence objects
-    # catche
-    current_tokens = []
-    current_tags = []
     
-    for item in data:
-        # item: {"subwords": ["He", "llo"], "train_labels": ["PROPN", "<PAD>"], "orig_word": "Hello"}
-        subwords = item['subwords']
-        tags = item['train_labels']
-        orig_word = item['orig_word']
-        for sub, tag in zip(subwords, tags):
-            # filter padding # optional
-            if sub == "<PAD>": continue
-            
-            current_tokens.append(sub)
-            current_tags.append(tag)
+    def add_sentence(tokens, tags):
+        # Flair Sentence objects
+        sentence = Sentence(tokens, use_tokenizer=False)
         
-        # boundary detection
-        is_boundary = item['orig_word'] in ['.', '!', '?', '...'] 
+        # assign tags to tokens
+        for token, tag in zip(sentence, tags):
+            token.add_label('upos', tag)
         
-        if is_boundary or len(current_tokens) > 256: 
-            if current_tokens:
-                # Flair Sentence objects
-                sentence = Sentence(current_tokens, use_tokenizer=False)
-                
-                # assign tags to tokens
-                for token, tag in zip(sentence, current_tags):
-                    token.add_label('upos', tag)
+        sentences_list.append(sentence)
+    
+    for aligned_sentence in iter_sentences(json_file):
+        # catche
+        current_tokens = []
+        current_tags = []
+        
+        for item in aligned_sentence:
+            # item: {"subwords": ["He", "llo"], "train_labels": ["PROPN", "<PAD>"], "orig_word": "Hello"}
+            subwords = item['subwords']
+            tags = item['train_labels']
+            for sub, tag in zip(subwords, tags):
+                # filter padding # optional
+                if sub == "<PAD>": continue
                 
-                sentences_list.append(sentence)
-            
-            # Reset
-            current_tokens = []
-            current_tags = []
+                current_tokens.append(sub)
+                current_tags.append(tag)
             
-    # leftovers
-    if current_tokens:
-        sentence = Sentence(current_tokens, use_tokenizer=False)
-        for token, tag in zip(sentence, current_tags):
-            token.add_label('upos', tag)
-        sentences_list.append(sentence)
+            # very long sentences are still broken up
+            if len(current_tokens) > 256:
+                add_sentence(current_tokens, current_tags)
+                current_tokens = []
+                current_tags = []
+        
+        if current_tokens:
+            add_sentence(current_tokens, current_tags)
         
     return sentences_list
 
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tagger_scripts'))
+
+from batch_align import jobs_from_templates, template_regex
+
+
+def test_fields_stop_at_the_following_separator():
+    regex = template_regex('data/{lang}_{split}.{tok}')
+    assert regex.fullmatch('data/et_train.obpe').groupdict() == {'lang': 'et', 'split': 'train', 'tok': 'obpe'}
+    # ambiguous names are not matched instead of being split at a guess
+    assert regex.fullmatch('data/sme_et_train.obpe') is None
+
+
+def test_repeated_fields_must_agree():
+    regex = template_regex('{lang}/{lang}_{split}.bpe')
+    assert regex.fullmatch('et/et_dev.bpe').groupdict() == {'lang': 'et', 'split': 'dev'}
+    assert regex.fullmatch('et/fi_dev.bpe') is None
+
+
+def test_jobs_from_templates(tmp_path):
+    for name in ('et_train.bpe', 'sme_et_train.bpe'):
+        (tmp_path / name).write_text('▁a\n', encoding='utf-8')
+    jobs = jobs_from_templates(str(tmp_path / '{lang}_{split}.bpe'), 'text/{lang}_{split}.txt',
+                               'tags/{lang}_{split}.tags', 'out/{lang}_{split}.json')
+    assert jobs == [(str(tmp_path / 'et_train.bpe'), 'text/et_train.txt', 'tags/et_train.tags', 'out/et_train.json')]
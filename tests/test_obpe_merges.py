@@ -0,0 +1,20 @@
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tokenizer_scripts'))
+
+from tokenizer_obpe import load_codes
+from train_obpe import OBPETrainer, save_merges
+
+
+def test_merges_round_trip_through_load_codes(tmp_path):
+    # hashtag-heavy text learns merges whose first symbol starts with '#'
+    hrl = Counter({'#tag': 50, '##x': 40, '#x': 30, 'tagid': 20})
+    lrl = Counter({'#tag': 25, '#x': 15, 'xx': 10})
+    merges = OBPETrainer(hrl, lrl).train(20, min_frequency=2, verbose=False)
+    assert any(a.startswith('#') for a, _ in merges)
+
+    path = tmp_path / 'merges.txt'
+    save_merges(merges, path)
+    assert load_codes(path) == [tuple(pair) for pair in merges]
@@ -0,0 +1,160 @@
+"""
+Streaming CoNLL-U reader shared by the extraction scripts.
+
+    from conllu import read_conllu, FORM, UPOS
+    for sent in read_conllu('./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-dev.conllu'):
+        forms, tags = sent.columns(FORM, UPOS)
+
+The file is read in large text blocks and cut into sentences at blank lines
+with one regex split per block. A Sentence keeps its raw text; comment
+metadata is only parsed when asked for, and syntactic words are picked out
+by their integer ID, so multiword ranges (1-2) and empty nodes (3.1) are
+skipped without splitting their columns.
+"""
+
+import argparse
+import os
+import re
+import time
+
+from corpus_io import open_input, source_path
+
+# column indices: ID, FORM, LEMMA, UPOS, XPOS, FEATS, HEAD, DEPREL, DEPS, MISC
+ID, FORM, LEMMA, UPOS, XPOS, FEATS, HEAD, DEPREL, DEPS, MISC = range(10)
+
+BLOCK_SIZE = 1 << 24
+
+SENTENCE_BREAK = re.compile(r'\n(?:[ \t\r\f\v]*\n)+')
+COMMENT_LINE = re.compile(r'^#.*$', re.M)
+WORD_LINE = re.compile(r'^\d+\t.*$', re.M)
+TOKEN_LINE = re.compile(r'^[^#\n].*$', re.M)
+
+
+def is_multiword(line):
+    return '-' in line[:line.find('\t')]
+
+
+def is_empty_node(line):
+    return '.' in line[:line.find('\t')]
+
+
+def parse_comment(line):
+    """Return (key, value) of a '# key = value' line, or None."""
+    key, sep, value = line[1:].partition('=')
+    if not sep or not key or not value:
+        return None
+    return key.strip(), value.strip()
+
+
+class Sentence:
+    __slots__ = ('block', '_meta')
+
+    def __init__(self, block):
+        self.block = block
+        self._meta = None
+
+    def lines(self):
+        return self.block.split('\n')
+
+    def comments(self):
+        return COMMENT_LINE.findall(self.block)
+
+    def tokens(self):
+        """All token lines, including multiword ranges and empty nodes."""
+        return TOKEN_LINE.findall(self.block)
+
+    def words(self):
+        """Token lines of syntactic words (integer ID: no ranges, no empty nodes)."""
+        return WORD_LINE.findall(self.block)
+
+    def rows(self, upto=MISC):
+        """Split word lines into their first `upto` + 1 columns (the rest stays joined)."""
+        return [line.split('\t', upto + 1) for line in self.words() if line.count('\t') > upto]
+
+    def columns(self, *indices):
+        """One list of values per requested column index, over all syntactic words."""
+        words = self.words()
+        # well-formed sentences: split all word lines at once and take
+        # every 10th field, instead of splitting line by line
+        fields = '\t'.join(words).split('\t')
+        if len(fields) == 10 * len(words):
+            return tuple(fields[i::10] for i in indices)
+        rows = self.rows(max(indices))
+        return tuple([row[i] for row in rows] for i in indices)
+
+    def column(self, index):
+        return self.columns(index)[0]
+
+    def metadata(self):
+        """'# key = value' comments as a dict, parsed on first use."""
+        if self._meta is None:
+            self._meta = {}
+            for line in self.comments():
+                item = parse_comment(line)
+                if item:
+                    self._meta[item[0]] = item[1]
+        return self._meta
+
+    def get(self, key, default=None):
+        """One metadata value, parsing only comments that can contain `key`."""
+        if self._meta is not None:
+            return self._meta.get(key, default)
+        for line in self.comments():
+            if key in line:
+                item = parse_comment(line)
+                if item and item[0] == key:
+                    return item[1]
+        return default
+
+    def text(self):
+        """The sentence block as it appeared in the file, without the trailing blank line."""
+        return self.block
+
+
+def read_conllu(path, block_size=BLOCK_SIZE):
+    """
+    Iterate over the sentences of a CoNLL-U file in order (.gz/.xz/.zst and
+    archive members too, see corpus_io.py).
+    The file is opened right away, so a missing file fails at the call.
+    """
+    f = open_input(path, buffering=block_size)
+    return _iter_sentences(f, block_size)
+
+
+def _iter_sentences(f, block_size):
+    with f:
+        tail = ''
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            pieces = SENTENCE_BREAK.split(tail + block)
+            # the last piece may continue in the next block
+            tail = pieces.pop()
+            for piece in pieces:
+                piece = piece.strip('\n')
+                if piece and not piece.isspace():
+                    yield Sentence(piece)
+        tail = tail.strip('\n')
+        if tail and not tail.isspace():
+            yield Sentence(tail)
+
+
+def count_sentences(path):
+    return sum(1 for _ in read_conllu(path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Read a CoNLL-U file and report basic counts')
+    parser.add_argument('--input', nargs='+', required=True, help='CoNLL-U files')
+    args = parser.parse_args()
+
+    for path in args.input:
+        start = time.perf_counter()
+        sentences = words = 0
+        for sent in read_conllu(path):
+            sentences += 1
+            words += len(sent.words())
+        elapsed = time.perf_counter() - start
+        mb = os.path.getsize(source_path(path)) / (1024 * 1024)
+        print(f"{path}: {sentences} sentences, {words} words, {elapsed:.2f}s ({mb / max(elapsed, 1e-9):.1f} MB/s)")
@@ -1,66 +1,74 @@
 
 """
 batch extract all splits of specific genres (train, dev, test) of Finnish-TDT and Russian-Taiga
+
+One file per genre in a single pass (fi_extracted_genres-train.b.conllu, ...):
+python tokenizer_scripts/extract_genres_all_splits.py --shard
+
+Ad hoc slicing of one file:
+python tokenizer_scripts/extract_genres_all_splits.py \
+    --input ./pilot_data/ud_data/UD_Finnish-TDT/fi_tdt-ud-dev.conllu \
+    --dataset finnish --genres wn --output /tmp/fi_dev_wn.conllu
 """
+import argparse
 import os
 import sys
-import re
-
-def sentence_matches(sent_lines, dataset, genres):
-    meta = {}
-    for ln in sent_lines:
-        if not ln.startswith('#'):
-            continue
-        m = re.match(r'#\s*([^=]+?)\s*=\s*(.+)', ln)
-        if m:
-            key = m.group(1).strip().lower()
-            val = m.group(2).strip().lower()
-            meta[key] = val
-
-    sid = meta.get('sent_id') or meta.get('send_id') or meta.get('sentid') or ''
-    genre_meta = meta.get('genre', '')
-
-    if dataset == 'finnish':
-        sid = sid.strip()
-        for g in genres:
-            if sid.startswith(g.lower()):
-                return True
-        for v in meta.values():
-            for g in genres:
-                if v.startswith(g.lower()):
-                    return True
-        return False
-    else:  # russian
-        for g in genres:
-            if genre_meta == g.lower():
-                return True
-        for v in meta.values():
-            for g in genres:
-                if g.lower() in v.split():
-                    return True
-        return False
+
+from conllu import read_conllu
+from corpus_io import compression_of, open_output
+
+# comment keys that may carry the sentence id in Finnish-TDT
+SENT_ID_KEYS = ('sent_id', 'send_id', 'sentid')
+
+
+class GenreMatcher:
+    """
+    Assign a sentence to one of `genres`, reading only the comment that decides it.
+    finnish: longest genre that prefixes sent_id (TDT ids look like 'wn10-015-3'),
+             so 'wn' wins over 'w'; lookup is a set probe per prefix length
+    russian: the '# genre = ...' value looked up directly
+    """
+
+    def __init__(self, dataset, genres):
+        self.dataset = dataset
+        self.genres = [g.lower() for g in genres]
+        self.genre_set = set(self.genres)
+        self.lengths = sorted({len(g) for g in self.genres}, reverse=True)
+
+    def genre_of(self, sentence):
+        if self.dataset == 'finnish':
+            for key in SENT_ID_KEYS:
+                sid = sentence.get(key)
+                if sid is not None:
+                    break
+            else:
+                return None
+            sid = sid.lower()
+            for n in self.lengths:
+                if sid[:n] in self.genre_set:
+                    return sid[:n]
+            return None
+        genre = sentence.get('genre')
+        if genre is None:
+            return None
+        genre = genre.lower()
+        return genre if genre in self.genre_set else None
+
+    def matches(self, sentence):
+        return self.genre_of(sentence) is not None
+
 
 def extract_genre_file(in_path, out_path, dataset, genres):
+    matcher = GenreMatcher(dataset, genres)
     matched = 0
     total = 0
     try:
-        with open(in_path, 'r', encoding='utf-8') as inf, open(out_path, 'w', encoding='utf-8') as outf:
-            buf = []
-            for line in inf:
-                line = line.rstrip('\n')
-                if line == '':
-                    if buf:
-                        total += 1
-                        if sentence_matches(buf, dataset, genres):
-                            outf.write('\n'.join(buf) + '\n\n')
-                            matched += 1
-                        buf = []
-                    continue
-                buf.append(line)
-            if buf:
+        sentences = read_conllu(in_path)
+        with open_output(out_path) as outf:
+            for sent in sentences:
                 total += 1
-                if sentence_matches(buf, dataset, genres):
-                    outf.write('\n'.join(buf) + '\n\n')
+                if matcher.matches(sent):
+                    outf.write(sent.text() + '\n\n')
                     matched += 1
     except FileNotFoundError:
         print(f"Input file not found: {in_path}", file=sys.stderr)
@@ -72,15 +80,81 @@ def extract_genre_file(in_path, out_path, dataset, genres):
     print(f"Processed {total} sentences, wrote {matched} matching sentences to {out_path}")
     return True
 
-def run_extraction(dataset, input_file, genres, output_conllu):
+def shard_genre_file(in_path, out_pattern, dataset, genres, keep_other=False):
+    """
+    Write every genre to its own file in one pass over `in_path`.
+    `out_pattern` contains '{genre}'; unmatched sentences go to genre 'other'
+    when keep_other is set. Returns {genre: sentence count} or None on error.
+    """
+    matcher = GenreMatcher(dataset, genres)
+    writers = {}
+    counts = {}
+    total = 0
+    try:
+        for sent in read_conllu(in_path):
+            total += 1
+            genre = matcher.genre_of(sent)
+            if genre is None:
+                if not keep_other:
+                    continue
+                genre = 'other'
+            if genre not in writers:
+                out_dir = os.path.dirname(out_pattern.format(genre=genre))
+                if out_dir:
+                    os.makedirs(out_dir, exist_ok=True)
+                writers[genre] = open_output(out_pattern.format(genre=genre))
+                counts[genre] = 0
+            writers[genre].write(sent.text() + '\n\n')
+            counts[genre] += 1
+    except FileNotFoundError:
+        print(f"Input file not found: {in_path}", file=sys.stderr)
+        return None
+    finally:
+        for f in writers.values():
+            f.close()
+
+    print(f"Processed {total} sentences")
+    for genre in sorted(counts):
+        print(f"  {genre}: {counts[genre]} sentences -> {out_pattern.format(genre=genre)}")
+    return counts
+
+def run_extraction(dataset, input_file, genres, output_conllu, shard=False):
+    """Filter to `output_conllu`, or with shard=True write one file per genre next to it."""
+    if shard:
+        # x.conllu.gz -> x.{genre}.conllu.gz
+        compression = compression_of(output_conllu) or ''
+        root, ext = os.path.splitext(output_conllu[:len(output_conllu) - len(compression)])
+        output_conllu = f"{root}.{{genre}}{ext}{compression}"
     print(f"\nExtract: {os.path.basename(input_file)}")
     print(f"Dataset: {dataset}  Genres: {genres}")
     print(f"Output: {output_conllu}")
     print("-" * 60)
+    if shard:
+        return shard_genre_file(input_file, output_conllu, dataset, genres) is not None
     return extract_genre_file(input_file, output_conllu, dataset, genres)
 
 def main():
-    base_dir = "/Users/Ingrid/Uralic-language-NLP/pilot_data"
+    parser = argparse.ArgumentParser(description='Extract (or shard) treebank sentences by genre')
+    parser.add_argument('--base_dir', default="/Users/Ingrid/Uralic-language-NLP/pilot_data",
+                        help='pilot_data directory holding ud_data/')
+    parser.add_argument('--shard', action='store_true',
+                        help='Write every genre to its own file (<output>.<genre>.conllu) in one pass')
+    parser.add_argument('--input', help='Process just this CoNLL-U file (with --dataset, --genres, --output)')
+    parser.add_argument('--dataset', choices=['finnish', 'russian'], help='--input: how to read the genre')
+    parser.add_argument('--genres', nargs='+', help='--input: genres to keep')
+    parser.add_argument('--output', help="--input: output file ('{genre}' in it is filled in with --shard)")
+    args = parser.parse_args()
+
+    if args.input:
+        if not (args.dataset and args.genres and args.output):
+            parser.error("--input needs --dataset, --genres and --output")
+        if args.shard and '{genre}' in args.output:
+            shard_genre_file(args.input, args.output, args.dataset, args.genres)
+        else:
+            run_extraction(args.dataset, args.input, args.genres, args.output, args.shard)
+        return
+
+    base_dir = args.base_dir
     output_dir = os.path.join(base_dir, "ud_data", "extracted_genres")
     os.makedirs(output_dir, exist_ok=True)
     
@@ -106,7 +180,8 @@ def main():
                 'finnish',
                 input_file,
                 finnish_genres,
-                output_conllu
+                output_conllu,
+                args.shard
             )
             print(f"{split} split {'extracted' if success else 'extraction failed'}")
         else:
@@ -138,7 +213,8 @@ def main():
                 'russian',
                 input_file,
                 russian_genres,
-                output_conllu
+                output_conllu,
+                args.shard
             )
             print(f"{split} split {'extracted' if success else 'extraction failed'}")
         else:
@@ -1,147 +1,228 @@
+'''
+Extract one line of word forms (.txt) and one line of UPOS tags (.tags) per sentence.
+
+All UD treebanks at once, on every core:
+python tokenizer_scripts/extract_text_and_pos_v4.py \
+    --glob './pilot_data/ud_data/UD_*/*.conllu' \
+    --text_dir ./pilot_data/ud_data/text --tags_dir ./pilot_data/ud_data/tags --suffix _v5
+
+et_ewt-ud-test.conllu becomes et_test_v5.txt / et_test_v5.tags (language =
+file name up to the first '_', split = part after the last '-').
+Compressed treebanks and members of a release tarball are read directly:
+    --glob './pilot_data/ud_data/ud-treebanks-v2.14.tgz::*/UD_Estonian-EWT/*.conllu'
+and --out_compression gz writes et_test_v5.txt.gz / et_test_v5.tags.gz.
+Or list the jobs explicitly, one per line, '#' starts a comment:
+    # conllu                                                  text output                              tags output
+    ./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-dev.conllu  ./pilot_data/ud_data/text/et_dev_v5.txt  ./pilot_data/ud_data/tags/et_dev_v5.tags
+python tokenizer_scripts/extract_text_and_pos_v4.py --manifest extract_jobs.txt
+
+Outputs newer than their input are skipped (--force re-extracts them).
+Jobs that would write the same output (e.g. two treebanks of one language
+and split in glob mode) are refused before anything runs; list them in a
+manifest with distinct names instead. Outputs are written to temporary
+files and only moved into place once both are complete.
+Without --glob/--manifest the DEFAULT_JOBS below are run.
+'''
+
+import argparse
+import multiprocessing as mp
 import os
+import time
 
-def extract_text_and_pos_from_conllu(conllu_file, text_output_file, pos_output_file, language='finnish'):
-    
-    with open(conllu_file, 'r', encoding='utf-8') as f_in, \
-         open(text_output_file, 'w', encoding='utf-8') as f_text, \
-         open(pos_output_file, 'w', encoding='utf-8') as f_pos:
-        
-        current_pos_tags = []
-        current_tokens = []
-        sentence_count = 0
-        
-        for line in f_in:
-            line = line.strip()
-            
-            # 【rely on tokens only
-            if line.startswith('#'):
-                continue
-            
-            # Empty line = sentence boundary
-            if not line:
-                if current_tokens and current_pos_tags:
-                    # delete regular expression process
-                    output_text = ' '.join(current_tokens)
-                    
-                    f_text.write(output_text + '\n')
-                    f_pos.write(' '.join(current_pos_tags) + '\n')
-                    
-                    sentence_count += 1
-                    
-                    current_pos_tags = []
-                    current_tokens = []
-                continue
+from conllu import read_conllu, FORM, UPOS
+from corpus_io import exists, expand, open_output, source_path, split_member, strip_compression
+from sentence_index import select_conllu
+
+def extract_text_and_pos_from_conllu(conllu_file, text_output_file, pos_output_file, language='finnish',
+                                     verbose=True, sentences=None):
+    """
+    Write one line of word forms and one line of UPOS tags per sentence.
+    Comments, multiword ranges and empty nodes are skipped (see conllu.py).
+    `sentences` limits the output to a selection (see sentence_index.py).
+    Returns the sentence count.
+    """
+    # same suffix as the outputs, so the same compression; an interrupted run
+    # leaves no partial output that would look up to date
+    tmp_files = [os.path.join(os.path.dirname(path), f".tmp.{os.getpid()}.{os.path.basename(path)}")
+                 for path in (text_output_file, pos_output_file)]
+    try:
+        with open_output(tmp_files[0]) as f_text, \
+             open_output(tmp_files[1]) as f_pos:
             
-            # Parse token line
-            parts = line.split('\t')
-            # info in CoNLL-U: ID, FORM, LEMMA, UPOS, XPOS, FEATS, HEAD, DEPREL, DEPS, MISC
-            if len(parts) >= 10: # 标准 CoNLL-U 至少 10 列
-                token_id = parts[0].strip()
-                token_form = parts[1].strip() # 这是单词
-                pos_tag = parts[3].strip()    # 这是 UPOS 标签
-                
-                # Multi-word token ID (range IDs)
-                
-                if '-' in token_id or '.' in token_id:
+            sentence_count = 0
+            source = select_conllu(conllu_file, sentences) if sentences else read_conllu(conllu_file)
+            for sent in source:
+                # info in CoNLL-U: ID, FORM, LEMMA, UPOS, XPOS, FEATS, HEAD, DEPREL, DEPS, MISC
+                forms, tags = sent.columns(FORM, UPOS)
+                if not forms:
                     continue
-                
-                try:
-                    current_pos_tags.append(pos_tag)
-                    current_tokens.append(token_form)
-                except ValueError:
-                    continue
-        
-        # Handle last sentence
-        if current_tokens and current_pos_tags:
-            output_text = ' '.join(current_tokens)
-            f_text.write(output_text + '\n')
-            f_pos.write(' '.join(current_pos_tags) + '\n')
-            sentence_count += 1
+                f_text.write(' '.join(forms) + '\n')
+                f_pos.write(' '.join(tags) + '\n')
+                sentence_count += 1
+    except BaseException:
+        for tmp_file in tmp_files:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        raise
+    os.replace(tmp_files[0], text_output_file)
+    os.replace(tmp_files[1], pos_output_file)
             
+    if verbose:
         print(f"Extracted {sentence_count} sentences from {conllu_file}")
         print(f"  -> Saved to: {os.path.basename(text_output_file)} & {os.path.basename(pos_output_file)}\n")
+    return sentence_count
+
+
+# (conllu, text output, tags output) run when no --glob/--manifest is given
+DEFAULT_JOBS = [
+    ('./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-test.conllu',
+     './pilot_data/ud_data/text/et_test_v5.txt', './pilot_data/ud_data/tags/et_test_v5.tags'),
+    ('./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-dev.conllu',
+     './pilot_data/ud_data/text/et_dev_v5.txt', './pilot_data/ud_data/tags/et_dev_v5.tags'),
+    ('./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-train.conllu',
+     './pilot_data/ud_data/text/et_train_v5.txt', './pilot_data/ud_data/tags/et_train_v5.tags'),
+    ('./pilot_data/ud_data/UD_Hungarian-Szeged/hu_szeged-ud-dev.conllu',
+     './pilot_data/ud_data/text/hu_dev_v5.txt', './pilot_data/ud_data/tags/hu_dev_v5.tags'),
+    ('./pilot_data/ud_data/UD_Hungarian-Szeged/hu_szeged-ud-test.conllu',
+     './pilot_data/ud_data/text/hu_test_v5.txt', './pilot_data/ud_data/tags/hu_test_v5.tags'),
+    ('./pilot_data/ud_data/UD_Hungarian-Szeged/hu_szeged-ud-train.conllu',
+     './pilot_data/ud_data/text/hu_train_v5.txt', './pilot_data/ud_data/tags/hu_train_v5.tags'),
+    # ('./pilot_data/ud_data/extracted_genres/fi_extracted_genres-train.conllu',
+    #  './pilot_data/ud_data/text/fi_train_v5.txt', './pilot_data/ud_data/tags/fi_train_v5.tags'),
+    # ('./pilot_data/ud_data/extracted_genres/ru_extracted_genres-train.conllu',
+    #  './pilot_data/ud_data/text/ru_train_v5.txt', './pilot_data/ud_data/tags/ru_train_v5.tags'),
+    # ('./pilot_data/ud_data/UD_North_Sami-Giella/sme_giella-ud-full.conllu',
+    #  './pilot_data/ud_data/text/sme_full_v5.txt', './pilot_data/ud_data/tags/sme_full_v5.tags'),
+    # ('./pilot_data/ud_data/UD_Kimi_Zyrian-Lattice/kpv_lattice-ud-full.conllu',
+    #  './pilot_data/ud_data/text/kpv_full_v5.txt', './pilot_data/ud_data/tags/kpv_full_v5.tags'),
+]
+
+
+def output_names(conllu_file, suffix='_v5', compression=''):
+    """et_ewt-ud-test.conllu(.gz) -> ('et_test_v5.txt', 'et_test_v5.tags'), plus compression ('.gz')"""
+    stem = os.path.splitext(os.path.basename(strip_compression(conllu_file)))[0]
+    lang = stem.split('_', 1)[0]
+    split = stem.rsplit('-', 1)[-1]
+    return f"{lang}_{split}{suffix}.txt{compression}", f"{lang}_{split}{suffix}.tags{compression}"
+
+
+def jobs_from_glob(patterns, text_dir, tags_dir, suffix='_v5', compression=''):
+    jobs = []
+    for pattern in patterns:
+        # 'archive.tgz::member-pattern' also matches members (see corpus_io.py)
+        for conllu_file in expand(pattern):
+            text_name, tags_name = output_names(conllu_file, suffix, compression)
+            jobs.append((conllu_file, os.path.join(text_dir, text_name), os.path.join(tags_dir, tags_name)))
+    return jobs
+
+
+def read_manifest(manifest_path):
+    """Return (conllu, text output, tags output) tuples from a manifest file."""
+    jobs = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            if len(parts) != 3:
+                raise ValueError(f"{manifest_path}:{line_num}: expected 'conllu text_output tags_output'")
+            jobs.append(tuple(parts))
+    return jobs
+
+
+def check_unique_outputs(jobs):
+    """Raise ValueError if two jobs would write the same text or tags file."""
+    writers = {}
+    clashes = []
+    for conllu_file, text_output_file, pos_output_file in jobs:
+        for path in (text_output_file, pos_output_file):
+            key = os.path.abspath(path)
+            if key in writers and writers[key] != conllu_file:
+                clashes.append(f"  {path}: {writers[key]} and {conllu_file}")
+            writers.setdefault(key, conllu_file)
+    if clashes:
+        raise ValueError("Several inputs map to the same output (give them distinct names in a manifest):\n"
+                         + "\n".join(clashes))
+
+
+def is_up_to_date(conllu_file, text_output_file, pos_output_file):
+    if not (os.path.exists(text_output_file) and os.path.exists(pos_output_file)):
+        return False
+    source_mtime = os.path.getmtime(source_path(conllu_file))
+    return min(os.path.getmtime(text_output_file), os.path.getmtime(pos_output_file)) >= source_mtime
+
+
+def run_job(job):
+    """Extract one (conllu, text, tags) job in a worker; returns a result row."""
+    conllu_file, text_output_file, pos_output_file, force, sentences = job
+    if not exists(conllu_file):
+        return conllu_file, 'missing', 0, 0.0
+    if not force and not sentences and is_up_to_date(conllu_file, text_output_file, pos_output_file):
+        return conllu_file, 'skipped', 0, 0.0
+    for path in (text_output_file, pos_output_file):
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    count = extract_text_and_pos_from_conllu(conllu_file, text_output_file, pos_output_file,
+                                             verbose=False, sentences=sentences)
+    return conllu_file, 'extracted', count, time.perf_counter() - start
+
+
+def run_jobs(jobs, workers=None, force=False, sentences=None):
+    jobs = list(dict.fromkeys(jobs))   # overlapping patterns may list a job twice
+    check_unique_outputs(jobs)
+    workers = workers or os.cpu_count() or 1
+    tasks = [(c, t, p, force, sentences) for c, t, p in jobs]
+    total_sentences, total_bytes = 0, 0
+    start = time.perf_counter()
+    with mp.Pool(min(workers, max(1, len(tasks)))) as pool:
+        for conllu_file, status, count, seconds in pool.imap_unordered(run_job, tasks):
+            if status == 'extracted':
+                total_sentences += count
+                rate = count / seconds if seconds > 0 else float('inf')
+                if split_member(conllu_file)[1] is None:
+                    # bytes read from disk (compressed size for .gz/.xz/.zst)
+                    size = os.path.getsize(conllu_file)
+                    total_bytes += size
+                    throughput = f", {size / (1024 * 1024) / max(seconds, 1e-9):.1f} MB/s"
+                else:
+                    throughput = ""
+                print(f"[DONE] {conllu_file}: {count} sentences in {seconds:.2f}s "
+                      f"({rate:,.0f} sentences/sec{throughput})")
+            elif status == 'skipped':
+                print(f"[SKIP] {conllu_file}: outputs are newer than the input")
+            else:
+                print(f"[MISSING] {conllu_file}")
+    elapsed = time.perf_counter() - start
+    print(f"\nExtracted {total_sentences} sentences ({total_bytes / (1024 * 1024):.1f} MB) "
+          f"from {len(jobs)} jobs in {elapsed:.2f}s with {workers} workers")
+    return total_sentences
+
 
 if __name__ == "__main__":
-    
-
-    # extract_text_and_pos_from_conllu(
-    #     conllu_file='./pilot_data/ud_data/extracted_genres/fi_extracted_genres-train.conllu',
-    #     text_output_file='./pilot_data/ud_data/text/fi_train_v5.txt',
-    #     pos_output_file='./pilot_data/ud_data/tags/fi_train_v5.tags'
-    # )
-
-
-    # extract_text_and_pos_from_conllu(
-    #     conllu_file='./pilot_data/ud_data/extracted_genres/fi_extracted_genres-dev.conllu',
-    #     text_output_file='./pilot_data/ud_data/text/fi_dev_v5.txt',
-    #     pos_output_file='./pilot_data/ud_data/tags/fi_dev_v5.tags'
-    # )
-
-    # extract_text_and_pos_from_conllu(
-    #     conllu_file='./pilot_data/ud_data/extracted_genres/fi_extracted_genres-test.conllu',
-    #     text_output_file='./pilot_data/ud_data/text/fi_test_v5.txt',
-    #     pos_output_file='./pilot_data/ud_data/tags/fi_test_v5.tags'
-    # )
-
-    # extract_text_and_pos_from_conllu(
-    #     conllu_file='./pilot_data/ud_data/extracted_genres/ru_extracted_genres-train.conllu',
-    #     text_output_file='./pilot_data/ud_data/text/ru_train_v5.txt',
-    #     pos_output_file='./pilot_data/ud_data/tags/ru_train_v5.tags'
-    # )
-
-
-    # extract_text_and_pos_from_conllu(
-    #     conllu_file='./pilot_data/ud_data/extracted_genres/ru_extracted_genres-dev.conllu',
-    #     text_output_file='./pilot_data/ud_data/text/ru_dev_v5.txt',
-    #     pos_output_file='./pilot_data/ud_data/tags/ru_dev_v5.tags'
-    # )
-
-    # extract_text_and_pos_from_conllu(
-    #     conllu_file='./pilot_data/ud_data/extracted_genres/ru_extracted_genres-test.conllu',
-    #     text_output_file='./pilot_data/ud_data/text/ru_test_v5.txt',
-    #     pos_output_file='./pilot_data/ud_data/tags/ru_test_v5.tags'
-    # )
-
-    extract_text_and_pos_from_conllu(
-        conllu_file='./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-test.conllu',
-        text_output_file='./pilot_data/ud_data/text/et_test_v5.txt',
-        pos_output_file='./pilot_data/ud_data/tags/et_test_v5.tags'
-    )
-
-    extract_text_and_pos_from_conllu(
-        conllu_file='./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-dev.conllu',
-        text_output_file='./pilot_data/ud_data/text/et_dev_v5.txt',
-        pos_output_file='./pilot_data/ud_data/tags/et_dev_v5.tags'
-    )
-
-    extract_text_and_pos_from_conllu(
-        conllu_file='./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-train.conllu',
-        text_output_file='./pilot_data/ud_data/text/et_train_v5.txt',
-        pos_output_file='./pilot_data/ud_data/tags/et_train_v5.tags'
-    )
-
-    extract_text_and_pos_from_conllu(
-        conllu_file='./pilot_data/ud_data/UD_Hungarian-Szeged/hu_szeged-ud-dev.conllu',
-        text_output_file='./pilot_data/ud_data/text/hu_dev_v5.txt',
-        pos_output_file='./pilot_data/ud_data/tags/hu_dev_v5.tags'
-    )
-    extract_text_and_pos_from_conllu(
-        conllu_file='./pilot_data/ud_data/UD_Hungarian-Szeged/hu_szeged-ud-test.conllu',
-        text_output_file='./pilot_data/ud_data/text/hu_test_v5.txt',
-        pos_output_file='./pilot_data/ud_data/tags/hu_test_v5.tags'
-    )
-    extract_text_and_pos_from_conllu(
-        conllu_file='./pilot_data/ud_data/UD_Hungarian-Szeged/hu_szeged-ud-train.conllu',
-        text_output_file='./pilot_data/ud_data/text/hu_train_v5.txt',
-        pos_output_file='./pilot_data/ud_data/tags/hu_train_v5.tags'
-    )
-    # extract_text_and_pos_from_conllu(
-    #     conllu_file='./pilot_data/ud_data/UD_North_Sami-Giella/sme_giella-ud-full.conllu',
-    #     text_output_file='./pilot_data/ud_data/text/sme_full_v5.txt',
-    #     pos_output_file='./pilot_data/ud_data/tags/sme_full_v5.tags'
-    # )
-    # extract_text_and_pos_from_conllu(
-    #     conllu_file='./pilot_data/ud_data/UD_Kimi_Zyrian-Lattice/kpv_lattice-ud-full.conllu',
-    #     text_output_file='./pilot_data/ud_data/text/kpv_full_v5.txt',
-    #     pos_output_file='./pilot_data/ud_data/tags/kpv_full_v5.tags'
-    # )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Extract text and UPOS tags from CoNLL-U treebanks in parallel')
+    parser.add_argument('--manifest', help='Job list: conllu text_output tags_output')
+    parser.add_argument('--glob', nargs='+', help='CoNLL-U file patterns; output names come from the file names')
+    parser.add_argument('--text_dir', default='./pilot_data/ud_data/text', help='Glob mode: .txt output directory')
+    parser.add_argument('--tags_dir', default='./pilot_data/ud_data/tags', help='Glob mode: .tags output directory')
+    parser.add_argument('--suffix', default='_v5', help='Glob mode: output name suffix')
+    parser.add_argument('--out_compression', choices=['gz', 'xz', 'bz2', 'zst'],
+                        help='Glob mode: write compressed outputs (.txt.gz, ...)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='Re-extract even if outputs are newer than inputs')
+    parser.add_argument('--sentences', help='Only these sentences of every input: START:STOP, i,j,k or @file '
+                                            '(numbers or sent_ids; uses the .idx sidecar)')
+    args = parser.parse_args()
+
+    jobs = []
+    if args.manifest:
+        jobs.extend(read_manifest(args.manifest))
+    if args.glob:
+        compression = f".{args.out_compression}" if args.out_compression else ''
+        jobs.extend(jobs_from_glob(args.glob, args.text_dir, args.tags_dir, args.suffix, compression))
+    if not args.manifest and not args.glob:
+        jobs = DEFAULT_JOBS
+
+    run_jobs(jobs, args.workers, args.force, args.sentences)
@@ -2,36 +2,241 @@
 python tokenizer_scripts/oversampling.py \
     --input downstream_task/joeynmt/data/processed/train.sme.obpe \
     --output downstream_task/joeynmt/data/processed/train.sme_oversampled.obpe
+
+Virtual oversampling (writes a small .view.json instead of duplicated data):
+python tokenizer_scripts/oversampling.py \
+    --input downstream_task/joeynmt/data/extracted_train.fi downstream_task/joeynmt/data/sme_train.sme \
+    --view downstream_task/joeynmt/data/train.fi_sme.view.json \
+    --temperature 5 --seed 42
+
+The tokenizer scripts accept a .view.json wherever they take an input text
+file, and JSONPOSDataset accepts one whose sources are aligned JSON files.
 '''
 
 import argparse
+import io
+import json
 import os
+import random
+from itertools import islice
+
+from corpus_io import exists, is_plain, open_input, open_output
+
+VIEW_SUFFIX = '.view.json'
+
 
 def oversample_file(input_path, output_path, multiplier):
     """
     Oversamples a given file by duplicating its content 'multiplier' times.
     """
-    with open(input_path, 'r', encoding='utf-8') as infile:
+    with open_input(input_path) as infile:
         lines = infile.readlines()
         
-    with open(output_path, 'w', encoding='utf-8') as outfile:
+    with open_output(output_path) as outfile:
         for _ in range(multiplier):
             outfile.writelines(lines)
     
     print(f"Oversampled '{input_path}' by {multiplier} times to '{output_path}'.")
     print(f"Original lines: {len(lines)}, New lines: {len(lines) * multiplier}")
 
+
+# --- virtual oversampling ---
+
+def temperature_weights(sizes, temperature):
+    """Sampling probability of each source: p_i ~ (n_i / N) ** (1 / T)."""
+    total = sum(sizes)
+    if not total:
+        raise ValueError("view has no items")
+    scaled = [(n / total) ** (1.0 / temperature) if n else 0.0 for n in sizes]
+    norm = sum(scaled)
+    return [w / norm for w in scaled]
+
+
+def iter_plan(sizes, multipliers=None, temperature=None, size=None, seed=42):
+    """
+    Yield (source, item) pairs of an oversampled view over sources with `sizes` items.
+    Fixed multipliers repeat each source in order, source after source, which
+    matches oversample_file. Temperature sampling draws the source of every
+    item from a seeded RNG and walks each source cyclically; `size` defaults
+    to the total number of items.
+    """
+    if temperature is None:
+        multipliers = multipliers or [1] * len(sizes)
+        for source, (n, mult) in enumerate(zip(sizes, multipliers)):
+            for _ in range(mult):
+                for item in range(n):
+                    yield source, item
+        return
+
+    weights = temperature_weights(sizes, temperature)
+    rng = random.Random(seed)
+    position = [0] * len(sizes)
+    sources = list(range(len(sizes)))
+    total = sum(sizes) if size is None else size
+    emitted = 0
+    while emitted < total:
+        batch = min(10000, total - emitted)
+        for source in rng.choices(sources, weights=weights, k=batch):
+            yield source, position[source] % sizes[source]
+            position[source] += 1
+        emitted += batch
+
+
+def plan_length(sizes, multipliers=None, temperature=None, size=None):
+    if temperature is None:
+        multipliers = multipliers or [1] * len(sizes)
+        return sum(n * m for n, m in zip(sizes, multipliers))
+    return sum(sizes) if size is None else size
+
+
+def count_lines(path):
+    """Number of lines, counting a last line without a trailing newline."""
+    count = 0
+    last = b'\n'
+    with open_input(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            count += block.count(b'\n')
+            last = block[-1:]
+    return count + (last != b'\n')
+
+
+def is_view(path):
+    return str(path).endswith(VIEW_SUFFIX)
+
+
+def write_view(view_path, sources, multipliers=None, temperature=None, size=None, seed=42):
+    """Write a view spec; source paths are stored relative to the spec file."""
+    view_dir = os.path.dirname(os.path.abspath(view_path))
+    spec = {
+        "format": "oversampled_view",
+        "sources": [os.path.relpath(os.path.abspath(p), view_dir) for p in sources],
+        "multipliers": multipliers,
+        "temperature": temperature,
+        "size": size,
+        "seed": seed,
+    }
+    with open(view_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, indent=2)
+    return spec
+
+
+def read_view(view_path):
+    with open(view_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if spec.get("format") != "oversampled_view":
+        raise ValueError(f"Not an oversampled view: {view_path}")
+    view_dir = os.path.dirname(os.path.abspath(view_path))
+    spec["sources"] = [p if os.path.isabs(p) else os.path.join(view_dir, p) for p in spec["sources"]]
+    multipliers = spec.get("multipliers")
+    if multipliers is not None and len(multipliers) == 1:
+        spec["multipliers"] = multipliers * len(spec["sources"])
+    return spec
+
+
+class OversampledView:
+    """
+    Lazily stream the lines of an oversampled corpus described by a view spec.
+    Nothing is duplicated on disk; each source is re-read as needed.
+    """
+
+    def __init__(self, view_path):
+        self.path = view_path
+        self.spec = read_view(view_path)
+        self.sources = self.spec["sources"]
+        self.sizes = [count_lines(p) for p in self.sources]
+
+    def __len__(self):
+        return plan_length(self.sizes, self.spec["multipliers"], self.spec["temperature"], self.spec["size"])
+
+    def _cycle_lines(self, path):
+        while True:
+            with open_input(path) as f:
+                yield from f
+
+    def __iter__(self):
+        spec = self.spec
+        if spec["temperature"] is None:
+            # sequential passes, same order as oversample_file
+            multipliers = spec["multipliers"] or [1] * len(self.sources)
+            for path, mult in zip(self.sources, multipliers):
+                for _ in range(mult):
+                    with open_input(path) as f:
+                        yield from f
+            return
+
+        readers = [self._cycle_lines(p) for p in self.sources]
+        for source, _ in iter_plan(self.sizes, None, spec["temperature"], spec["size"], spec["seed"]):
+            yield next(readers[source])
+
+    # context-manager protocol so a view can stand in for open(path)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def open_text(path, offset=0):
+    """
+    open(path) for text files (also compressed ones and archive members, see
+    corpus_io.py), an OversampledView for .view.json files.
+    A non-zero byte `offset` (which must fall on a line start) skips ahead.
+    """
+    if is_view(path):
+        if offset:
+            raise ValueError("Views cannot be opened at a byte offset")
+        return OversampledView(path)
+    if offset:
+        if not is_plain(path):
+            raise ValueError(f"Compressed inputs cannot be opened at a byte offset: {path}")
+        f = open(path, 'rb')
+        f.seek(offset)
+        return io.TextIOWrapper(f, encoding='utf-8')
+    return open_input(path)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Oversample a text file by duplicating its content.")
     parser.add_argument("--input", nargs='+', required=True, help="Path to the input files.")
-    parser.add_argument("--output", nargs='+', required=True, help="Path to the output oversampled files.")
+    parser.add_argument("--output", nargs='+', help="Path to the output oversampled files.")
     parser.add_argument("--multiplier", type=int, default=5,
                         help="Number of times to duplicate the file content (default: 5).")
-    
+    parser.add_argument("--view", help="Write a virtual view over all --input files to this .view.json instead")
+    parser.add_argument("--multipliers", nargs='+', type=int,
+                        help="View: per-input multipliers (default: --multiplier for every input)")
+    parser.add_argument("--temperature", type=float,
+                        help="View: temperature-based sampling across inputs instead of fixed multipliers")
+    parser.add_argument("--size", type=int, help="View: number of lines to sample with --temperature")
+    parser.add_argument("--seed", type=int, default=42, help="View: sampling seed")
+    parser.add_argument("--show", type=int, default=0, help="View: print the first N lines of the view")
+
     args = parser.parse_args()
 
-    for in_path, out_path in zip(args.input, args.output):
-        if not os.path.exists(in_path):
-            print(f"Input file not found: {in_path}")
-            continue
-        oversample_file(in_path, out_path, args.multiplier)
\ No newline at end of file
+    if args.view:
+        if not args.view.endswith(VIEW_SUFFIX):
+            parser.error(f"--view must end with {VIEW_SUFFIX}")
+        missing = [p for p in args.input if not exists(p)]
+        if missing:
+            parser.error(f"Input file not found: {', '.join(missing)}")
+        multipliers = None
+        if args.temperature is None:
+            multipliers = args.multipliers or [args.multiplier] * len(args.input)
+            if len(multipliers) != len(args.input):
+                parser.error("--multipliers needs one value per input")
+        write_view(args.view, args.input, multipliers, args.temperature, args.size, args.seed)
+
+        view = OversampledView(args.view)
+        print(f"Wrote view '{args.view}' over {len(view.sources)} files")
+        for path, n in zip(view.sources, view.sizes):
+            print(f"  {path}: {n} lines")
+        print(f"View lines: {len(view)}")
+        for line in islice(view, args.show):
+            print(line.rstrip('\n'))
+    else:
+        if not args.output:
+            parser.error("--output is required unless --view is given")
+        for in_path, out_path in zip(args.input, args.output):
+            if not exists(in_path):
+                print(f"Input file not found: {in_path}")
+                continue
+            oversample_file(in_path, out_path, args.multiplier)
@@ -0,0 +1,189 @@
+"""
+Per-piece property tables for tokenizer vocabularies.
+
+Whether a subword starts or ends a word, is punctuation, or what it reads
+as without its boundary marker depends only on the vocabulary piece, not
+on where it occurs. PieceTable works each property out once per piece and
+keeps it in a NumPy array indexed by piece id, so aligners and validators
+map a sentence to ids once and then only index arrays:
+  is_word_start     starts with the SentencePiece marker '▁'
+  is_word_end       ends with the OBPE marker '</w>'
+  is_punct          is_unicode_punct(piece)
+  is_punct_surface  extract_punct_surface(piece, tokenizer_type) is not None
+  is_unk            <unk> / [unk] once the marker is stripped
+  surface           piece without its marker (list of str)
+  norm_surface      NFKC of surface (list of str)
+
+Ids follow a SentencePiece .vocab file or the symbols of an OBPE merges
+file; pieces outside it (characters no merge touches, byte fallback)
+get the next id the first time ids() sees them.
+
+python tokenizer_scripts/piece_table.py --vocab vocab/bpe/et_bpe_model.vocab --tokenizer_type bpe --show 20
+"""
+
+import argparse
+import unicodedata
+from typing import Optional
+
+import numpy as np
+
+SPIECE_MARKER = '▁'
+OBPE_MARKER = '</w>'
+UNK_PIECES = ('<unk>', '[unk]')
+COLUMNS = ('is_word_start', 'is_word_end', 'is_punct', 'is_punct_surface', 'is_unk')
+MIN_CAPACITY = 1024
+
+
+def is_unicode_punct(token: str) -> bool:
+    """Return True if token consists only of true punctuation characters (category 'P'), excluding symbols and ASCII hyphen-minus."""
+    if not token:
+        return False
+    for ch in token:
+        cat = unicodedata.category(ch)
+        if not cat.startswith('P'):
+            return False
+        if ch == '-':  # Exclude ASCII hyphen-minus
+            return False
+    return True
+
+
+def extract_punct_surface(token: str, tokenizer_type: str) -> Optional[str]:
+    """Return the punctuation surface form for validation based on tokenizer markers."""
+    if not token:
+        return None
+
+    # Skip tokens that are symbols (category 'S') or contain any symbol characters
+    if any(unicodedata.category(ch).startswith('S') for ch in token):
+        return None
+
+    if tokenizer_type in {"bpe", "unigram"}:
+        if token.startswith('▁'):  # U+2581
+            raw = token[1:]
+            if raw and is_unicode_punct(raw):
+                return raw
+        elif is_unicode_punct(token):
+            return token
+    elif tokenizer_type == "obpe":
+        if token.endswith("</w>"):
+            raw = token[:-4]
+            if raw and is_unicode_punct(raw):
+                return raw
+        elif is_unicode_punct(token):
+            return token
+
+    return None
+
+
+def strip_marker(piece, tokenizer_type):
+    if tokenizer_type == 'obpe':
+        return piece[:-len(OBPE_MARKER)] if piece.endswith(OBPE_MARKER) else piece
+    return piece[1:] if piece.startswith(SPIECE_MARKER) else piece
+
+
+def read_vocab(vocab_path):
+    """Pieces of a SentencePiece .vocab file ("piece<TAB>score" per line), in id order."""
+    with open(vocab_path, encoding='utf-8') as f:
+        return [line.rstrip('\n').split('\t', 1)[0] for line in f if line.strip('\n')]
+
+
+def merges_pieces(codes_path):
+    """Every symbol an OBPE merges file can produce, bare and with '</w>'."""
+    from tokenizer_obpe import load_codes
+    symbols = {}
+    for a, b in load_codes(codes_path):
+        for s in (a, b, a + b):
+            symbols.setdefault(s, None)
+    return [p for s in symbols for p in (s, s + OBPE_MARKER)]
+
+
+class PieceTable:
+    def __init__(self, tokenizer_type, pieces=()):
+        self.tokenizer_type = tokenizer_type
+        self.pieces = []
+        self.piece_to_id = {}
+        self.surface = []
+        self.norm_surface = []
+        # bool columns with room to grow; the public arrays are views of their
+        # first len(self) entries
+        self._columns = {name: np.zeros(MIN_CAPACITY, dtype=bool) for name in COLUMNS}
+        self.add(pieces)
+
+    @classmethod
+    def from_file(cls, path, tokenizer_type):
+        """A .vocab file for bpe/unigram, a merges file for obpe."""
+        return cls(tokenizer_type, merges_pieces(path) if tokenizer_type == 'obpe' else read_vocab(path))
+
+    def __len__(self):
+        return len(self.pieces)
+
+    def add(self, pieces):
+        """Give ids to the pieces not in the table yet."""
+        new = []
+        for piece in pieces:
+            if piece not in self.piece_to_id:
+                self.piece_to_id[piece] = len(self.pieces)
+                self.pieces.append(piece)
+                new.append(piece)
+        if not new:
+            return
+        end = len(self.pieces)
+        start = end - len(new)
+        capacity = len(self._columns[COLUMNS[0]])
+        if end > capacity:
+            # geometric growth keeps filling the table piece by piece linear
+            capacity = max(end, 2 * capacity)
+            for name, column in self._columns.items():
+                grown = np.zeros(capacity, dtype=bool)
+                grown[:start] = column[:start]
+                self._columns[name] = grown
+        tokenizer_type = self.tokenizer_type
+        surface = [strip_marker(p, tokenizer_type) for p in new]
+        self.surface.extend(surface)
+        self.norm_surface.extend(unicodedata.normalize('NFKC', s) for s in surface)
+        columns = {
+            'is_word_start': [p.startswith(SPIECE_MARKER) for p in new],
+            'is_word_end': [p.endswith(OBPE_MARKER) for p in new],
+            'is_punct': [is_unicode_punct(p) for p in new],
+            'is_punct_surface': [extract_punct_surface(p, tokenizer_type) is not None for p in new],
+            'is_unk': [s.lower() in UNK_PIECES for s in surface],
+        }
+        for name, values in columns.items():
+            self._columns[name][start:end] = values
+
+    is_word_start = property(lambda self: self._columns['is_word_start'][:len(self.pieces)])
+    is_word_end = property(lambda self: self._columns['is_word_end'][:len(self.pieces)])
+    is_punct = property(lambda self: self._columns['is_punct'][:len(self.pieces)])
+    is_punct_surface = property(lambda self: self._columns['is_punct_surface'][:len(self.pieces)])
+    is_unk = property(lambda self: self._columns['is_unk'][:len(self.pieces)])
+
+    def ids(self, pieces):
+        """int32 ids of `pieces`, adding unseen ones."""
+        get = self.piece_to_id.get
+        ids = [get(p) for p in pieces]
+        if None in ids:
+            self.add(pieces)
+            ids = [self.piece_to_id[p] for p in pieces]
+        return np.array(ids, dtype=np.int32)
+
+    def encode_lines(self, piece_lists):
+        """Flat ids of many sentences and the num_sentences + 1 offsets into them."""
+        offsets = np.zeros(len(piece_lists) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in piece_lists], out=offsets[1:])
+        flat = [p for pieces in piece_lists for p in pieces]
+        return self.ids(flat), offsets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect the per-piece property table of a vocabulary')
+    parser.add_argument('--vocab', required=True, help='SentencePiece .vocab file, or merges file for obpe')
+    parser.add_argument('--tokenizer_type', required=True, choices=['bpe', 'unigram', 'obpe'])
+    parser.add_argument('--show', type=int, default=10, help='Print the first N rows')
+    args = parser.parse_args()
+
+    table = PieceTable.from_file(args.vocab, args.tokenizer_type)
+    print(f"{len(table)} pieces")
+    for name in COLUMNS:
+        print(f"  {name}: {int(getattr(table, name).sum())}")
+    for i in range(min(args.show, len(table))):
+        flags = ' '.join(name for name in COLUMNS if getattr(table, name)[i])
+        print(f"{i}\t{table.pieces[i]}\t{table.surface[i]}\t{flags}")
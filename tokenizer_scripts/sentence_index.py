@@ -0,0 +1,309 @@
+"""
+Byte-offset sentence index sidecars for CoNLL-U and line-aligned files.
+
+For a file <f> the index is
+  <f>.idx.bin   int64 start offsets, num_sentences + 1 entries (last = file size)
+  <f>.idx.json  header: kind, source size and mtime, count (and sent_ids for CoNLL-U)
+kind 'conllu': a sentence is a blank-line separated block (*.conllu files)
+kind 'lines':  a sentence is one line (.txt, .tags, subword files)
+
+The index is built on first use and rebuilt when the source changes, so
+random access, sampling and sharding seek straight to a sentence instead of
+re-reading the file from the start. Compressed files and archive members
+(see corpus_io.py) cannot be indexed; open_sentences and select_conllu read
+them in one streaming pass instead.
+
+Scripts take a selection as --sentences:
+  100:200     sentences 100..199 (either end may be left out)
+  5,17,42     these sentence numbers (0-based), in this order
+  @ids.txt    one sentence number, or CoNLL-U sent_id, per line
+
+python tokenizer_scripts/sentence_index.py --build ./pilot_data/ud_data/UD_Estonian-EWT/et_ewt-ud-train.conllu
+python tokenizer_scripts/sentence_index.py --input ./pilot_data/ud_data/text/et_train_v5.txt --sample 500 --seed 1
+"""
+
+import argparse
+import contextlib
+import json
+import mmap
+import os
+import random
+import re
+from itertools import islice
+
+import numpy as np
+
+from corpus_io import is_plain, open_input
+
+INDEX_VERSION = 2
+SCAN_BYTES = 1 << 26
+# bytes conllu.SENTENCE_BREAK allows on a blank line: ' \t\r\f\v'
+BLANK_BYTES = np.frombuffer(b' \t\r\x0c\x0b', dtype=np.uint8)
+SENT_ID_COMMENT = re.compile(rb'^#\s*sent_id\s*=\s*(.*?)\s*$', re.M)
+
+
+def index_paths(path):
+    return path + '.idx.bin', path + '.idx.json'
+
+
+def index_kind(path):
+    return 'conllu' if path.endswith('.conllu') else 'lines'
+
+
+def line_starts(data):
+    """Start offset of every line of a uint8 array (a last line without newline counts)."""
+    size = len(data)
+    starts = [np.zeros(1, dtype=np.int64)]
+    for base in range(0, size, SCAN_BYTES):
+        chunk = np.asarray(data[base:base + SCAN_BYTES])
+        starts.append(np.flatnonzero(chunk == 10).astype(np.int64) + base + 1)
+    starts = np.concatenate(starts)
+    if size == 0 or starts[-1] == size:
+        starts = starts[:-1]
+    return starts
+
+
+def conllu_starts(data):
+    """Start offset of every sentence: the first non-blank line after a blank one."""
+    starts = line_starts(data)
+    if not len(starts):
+        return starts
+    ends = np.append(starts[1:] - 1, len(data))
+    lengths = ends - starts
+    blank = lengths == 0
+    # whitespace-only lines of any length are breaks too, as in conllu.SENTENCE_BREAK;
+    # they are rare, so only lines starting with whitespace are checked by hand
+    first = np.asarray(data[starts])
+    for i in np.flatnonzero((lengths > 0) & np.isin(first, BLANK_BYTES)):
+        blank[i] = bytes(data[starts[i]:ends[i]]).isspace()
+    previous_blank = np.concatenate([[True], blank[:-1]])
+    return starts[~blank & previous_blank]
+
+
+class SentenceIndex:
+    def __init__(self, path, kind=None, rebuild=False):
+        if not is_plain(path):
+            raise ValueError(f"Sentence indexes need an uncompressed file on disk: {path}")
+        self.path = path
+        self.kind = kind or index_kind(path)
+        self._mm = None
+        if rebuild or not self._load():
+            self.build()
+            self._load()
+
+    def _load(self):
+        bin_path, header_path = index_paths(self.path)
+        if not (os.path.exists(bin_path) and os.path.exists(header_path)):
+            return False
+        with open(header_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        stat = os.stat(self.path)
+        if (header.get('version') != INDEX_VERSION or header.get('kind') != self.kind
+                or header.get('source_size') != stat.st_size
+                or header.get('source_mtime_ns') != stat.st_mtime_ns):
+            return False
+        self.header = header
+        self.offsets = np.fromfile(bin_path, dtype=np.int64)
+        self.sent_ids = header.get('sent_ids')
+        self._id_lookup = None
+        return True
+
+    def build(self):
+        stat = os.stat(self.path)
+        sent_ids = None
+        if stat.st_size == 0:
+            starts = np.zeros(0, dtype=np.int64)
+        else:
+            data = np.memmap(self.path, dtype=np.uint8, mode='r')
+            if self.kind == 'conllu':
+                starts = conllu_starts(data)
+                sent_ids = self._scan_sent_ids(starts)
+            else:
+                starts = line_starts(data)
+            del data
+        offsets = np.append(starts, stat.st_size).astype(np.int64)
+
+        bin_path, header_path = index_paths(self.path)
+        offsets.tofile(bin_path)
+        header = {
+            'format': 'sentence_index',
+            'version': INDEX_VERSION,
+            'kind': self.kind,
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'num_sentences': len(offsets) - 1,
+        }
+        if sent_ids is not None:
+            header['sent_ids'] = sent_ids
+        with open(header_path, 'w', encoding='utf-8') as f:
+            json.dump(header, f, ensure_ascii=False)
+        return len(offsets) - 1
+
+    def _scan_sent_ids(self, starts):
+        """sent_id of every sentence (None where missing)."""
+        sent_ids = [None] * len(starts)
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for m in SENT_ID_COMMENT.finditer(mm):
+                i = int(np.searchsorted(starts, m.start(), side='right')) - 1
+                if i >= 0 and sent_ids[i] is None:
+                    sent_ids[i] = m.group(1).decode('utf-8')
+        return sent_ids
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _data(self):
+        if self._mm is None:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if len(self) else b''
+        return self._mm
+
+    def close(self):
+        if self._mm is not None and not isinstance(self._mm, bytes):
+            self._mm.close()
+        self._mm = None
+
+    def resolve(self, selection):
+        """Turn a range, or a list of sentence numbers / sent_ids, into sentence numbers."""
+        if isinstance(selection, range):
+            return range(*slice(selection.start, selection.stop).indices(len(self)))
+        ids = []
+        for item in selection:
+            if isinstance(item, str) and not item.lstrip('-').isdigit():
+                if self._id_lookup is None:
+                    self._id_lookup = {sid: i for i, sid in enumerate(self.sent_ids or ()) if sid is not None}
+                if item not in self._id_lookup:
+                    raise KeyError(f"sent_id '{item}' not in {self.path}")
+                ids.append(self._id_lookup[item])
+            else:
+                i = int(item)
+                if not -len(self) <= i < len(self):
+                    raise IndexError(f"sentence {i} out of range for {self.path} ({len(self)} sentences)")
+                ids.append(i % len(self))
+        return ids
+
+    def raw(self, i):
+        """Bytes of sentence i, including its line break / trailing blank lines."""
+        return self._data()[self.offsets[i]:self.offsets[i + 1]]
+
+    def text(self, i):
+        """Sentence i as text: one line with its newline, or a CoNLL-U block without blank lines."""
+        text = self.raw(i).decode('utf-8')
+        if self.kind == 'conllu':
+            return text.replace('\r\n', '\n').rstrip()
+        return text
+
+    def iter_text(self, selection):
+        for i in self.resolve(selection):
+            yield self.text(i)
+
+    def sample(self, k, seed=42):
+        """k distinct sentence numbers in file order."""
+        return sorted(random.Random(seed).sample(range(len(self)), min(k, len(self))))
+
+    def shards(self, num_shards):
+        """Split into at most num_shards contiguous ranges of about equal byte size."""
+        if not len(self):
+            return []
+        total = self.offsets[-1] - self.offsets[0]
+        targets = self.offsets[0] + total * np.arange(1, num_shards) // num_shards
+        bounds = np.unique(np.concatenate([[0], np.searchsorted(self.offsets[:-1], targets), [len(self)]]))
+        return [range(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_selection(spec):
+    """'START:STOP' -> range, 'i,j,k' -> list, '@file' -> list of numbers or sent_ids."""
+    if spec is None:
+        return None
+    if isinstance(spec, (range, list, tuple)):
+        return spec
+    spec = spec.strip()
+    if spec.startswith('@'):
+        with open(spec[1:], 'r', encoding='utf-8') as f:
+            items = [line.strip() for line in f if line.strip()]
+        return [int(x) if x.lstrip('-').isdigit() else x for x in items]
+    if ':' in spec:
+        start, _, stop = spec.partition(':')
+        return range(int(start) if start else 0, int(stop) if stop else 2 ** 62)
+    return [int(x) for x in spec.split(',') if x.strip()]
+
+
+def stream_select(items, selection, key=None):
+    """
+    Pick a selection out of an iterator in one pass, for inputs without an index.
+    Ranges stream through; lists are collected and yielded in the order given.
+    `key(item)` supplies the sent_id that string entries are matched against.
+    """
+    if isinstance(selection, range):
+        yield from islice(items, max(selection.start, 0), max(selection.stop, 0))
+        return
+    if any(isinstance(x, int) and x < 0 for x in selection):
+        raise IndexError("Negative sentence numbers need an indexed (uncompressed) file")
+    wanted = set(selection)
+    found = {}
+    for i, item in enumerate(items):
+        if i in wanted:
+            found[i] = item
+        sid = key(item) if key else None
+        if sid is not None and sid in wanted:
+            found[sid] = item
+    for x in selection:
+        if x not in found:
+            raise KeyError(f"sentence {x!r} not in input")
+        yield found[x]
+
+
+@contextlib.contextmanager
+def open_sentences(path, selection):
+    """Like open(path) over a line file, but yielding only the selected lines."""
+    if not is_plain(path):
+        with open_input(path) as f:
+            yield stream_select(f, parse_selection(selection))
+        return
+    with SentenceIndex(path, kind='lines') as index:
+        yield index.iter_text(parse_selection(selection))
+
+
+def select_conllu(path, selection):
+    """Yield conllu.Sentence objects for the selected sentences of a CoNLL-U file."""
+    from conllu import Sentence, read_conllu
+    if not is_plain(path):
+        yield from stream_select(read_conllu(path), parse_selection(selection),
+                                 key=lambda sent: sent.get('sent_id'))
+        return
+    with SentenceIndex(path, kind='conllu') as index:
+        for text in index.iter_text(parse_selection(selection)):
+            yield Sentence(text)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and query byte-offset sentence indexes')
+    parser.add_argument('--build', nargs='+', help='(Re)build the index of these files')
+    parser.add_argument('--input', help='Indexed file to query')
+    parser.add_argument('--sentences', help='Print these sentences: START:STOP, i,j,k or @file')
+    parser.add_argument('--sample', type=int, help='Print the numbers of N random sentences')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed')
+    parser.add_argument('--shards', type=int, help='Print N byte-balanced sentence ranges')
+    args = parser.parse_args()
+
+    for path in args.build or []:
+        with SentenceIndex(path, rebuild=True) as index:
+            print(f"Indexed {len(index)} sentences ({index.kind}) -> {index_paths(path)[0]}")
+
+    if args.input:
+        with SentenceIndex(args.input) as index:
+            print(f"{args.input}: {len(index)} sentences ({index.kind})")
+            if args.sentences:
+                for text in index.iter_text(parse_selection(args.sentences)):
+                    print(text.rstrip('\n'))
+            if args.sample:
+                print(','.join(map(str, index.sample(args.sample, args.seed))))
+            if args.shards:
+                for shard in index.shards(args.shards):
+                    print(f"{shard.start}:{shard.stop}")
@@ -0,0 +1,161 @@
+"""
+Binary token-id corpus format.
+
+A corpus written with prefix `<out>` consists of
+  <out>.ids.bin      flat uint16/uint32 array of piece ids
+  <out>.offsets.bin  int64 array of num_sentences + 1 start offsets
+  <out>.json         header: model, model type, dtype, counts
+                     (and the piece list for OBPE, which has no native ids)
+
+Sentence i is ids[offsets[i]:offsets[i + 1]]; TokenIdCorpus opens both
+arrays with np.memmap so slicing never loads the whole corpus.
+
+python tokenizer_scripts/token_ids.py --corpus ./pilot_data/ud_data/subword/sme_train.bpe --show 3
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def corpus_paths(prefix):
+    return prefix + ".ids.bin", prefix + ".offsets.bin", prefix + ".json"
+
+
+def id_dtype(vocab_size):
+    return np.uint16 if vocab_size is not None and vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+class TokenIdWriter:
+    """
+    Stream sentences of piece ids to disk.
+    Give `vocab_size` when ids come from the model (SentencePiece); leave it
+    None to map piece strings to ids on the fly with add_pieces (OBPE).
+    """
+
+    def __init__(self, prefix, model, model_type, vocab_size=None):
+        output_dir = os.path.dirname(prefix)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.prefix = prefix
+        self.model = model
+        self.model_type = model_type
+        self.vocab_size = vocab_size
+        self.dtype = id_dtype(vocab_size)
+        self.piece_to_id = None if vocab_size is not None else {}
+        self.offsets = [0]
+        ids_path, _, _ = corpus_paths(prefix)
+        self._f_ids = open(ids_path, "wb")
+
+    def add(self, ids):
+        np.asarray(ids, dtype=self.dtype).tofile(self._f_ids)
+        self.offsets.append(self.offsets[-1] + len(ids))
+
+    def add_batch(self, id_lists):
+        if not id_lists:
+            return
+        flat = np.fromiter((i for ids in id_lists for i in ids), dtype=self.dtype)
+        flat.tofile(self._f_ids)
+        for ids in id_lists:
+            self.offsets.append(self.offsets[-1] + len(ids))
+
+    def add_pieces(self, pieces):
+        vocab = self.piece_to_id
+        self.add([vocab.setdefault(p, len(vocab)) for p in pieces])
+
+    def close(self):
+        self._f_ids.close()
+        _, offsets_path, header_path = corpus_paths(self.prefix)
+        np.asarray(self.offsets, dtype=np.int64).tofile(offsets_path)
+
+        header = {
+            "format": "token_ids",
+            "version": FORMAT_VERSION,
+            "model": self.model,
+            "model_type": self.model_type,
+            "dtype": np.dtype(self.dtype).name,
+            "num_sentences": len(self.offsets) - 1,
+            "num_tokens": self.offsets[-1],
+            "vocab_size": self.vocab_size if self.piece_to_id is None else len(self.piece_to_id),
+        }
+        if self.piece_to_id is not None:
+            header["pieces"] = list(self.piece_to_id)
+        with open(header_path, "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TokenIdCorpus:
+    """Zero-copy random access to a corpus written by TokenIdWriter."""
+
+    def __init__(self, prefix):
+        ids_path, offsets_path, header_path = corpus_paths(prefix)
+        with open(header_path, "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        if self.header.get("format") != "token_ids":
+            raise ValueError(f"Not a token-id corpus header: {header_path}")
+
+        self.offsets = np.memmap(offsets_path, dtype=np.int64, mode="r")
+        if self.header["num_tokens"]:
+            self.ids = np.memmap(ids_path, dtype=self.header["dtype"], mode="r")
+        else:
+            # np.memmap refuses empty files
+            self.ids = np.zeros(0, dtype=self.header["dtype"])
+        self.pieces = self.header.get("pieces")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def sentence_lengths(self):
+        return np.diff(self.offsets)
+
+    def slice(self, start, stop):
+        """Flat ids and rebased offsets for sentences [start, stop)."""
+        offsets = np.asarray(self.offsets[start:stop + 1])
+        return self.ids[offsets[0]:offsets[-1]], offsets - offsets[0]
+
+    def pieces_of(self, i, sp=None):
+        """Piece strings of sentence i (SentencePiece corpora need the loaded processor)."""
+        ids = self[i].tolist()
+        if self.pieces is not None:
+            return [self.pieces[t] for t in ids]
+        if sp is None:
+            raise ValueError("SentencePiece corpus: pass the loaded processor as sp")
+        return [sp.id_to_piece(t) for t in ids]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a binary token-id corpus")
+    parser.add_argument("--corpus", required=True, help="Corpus prefix (without .ids.bin/.json)")
+    parser.add_argument("--show", type=int, default=0, help="Print the first N sentences")
+    args = parser.parse_args()
+
+    corpus = TokenIdCorpus(args.corpus)
+    lengths = corpus.sentence_lengths()
+    print(f"Model: {corpus.header['model']} ({corpus.header['model_type']})")
+    print(f"Sentences: {len(corpus)}, tokens: {corpus.header['num_tokens']}, dtype: {corpus.header['dtype']}")
+    if len(corpus):
+        print(f"Mean length: {lengths.mean():.2f}, max length: {lengths.max()}")
+
+    sp = None
+    if corpus.pieces is None and args.show:
+        import sentencepiece as spm
+        sp = spm.SentencePieceProcessor(model_file=corpus.header["model"])
+    for i in range(min(args.show, len(corpus))):
+        print(" ".join(corpus.pieces_of(i, sp)))
@@ -0,0 +1,185 @@
+"""
+Content-hash cache for the tokenization entry points.
+
+Every output directory gets a .tokenize_manifest.json that maps each output
+file (the .json header for token-id corpora) to the input hash, model/codes hash and options it was produced from.
+Before encoding, plan() compares the current state against that record:
+  skip    input, model, options and output are unchanged
+  append  the input only grew (old content is an exact prefix ending in a
+          newline), so only the new bytes are encoded and appended
+  full    anything else
+Append is only used for text outputs of plain files; token-id corpora,
+oversampled views and compressed inputs or archive members are re-encoded
+in full when they change.
+"""
+
+import hashlib
+import json
+import os
+
+from corpus_io import is_plain, split_member
+from oversampling import is_view, read_view
+
+MANIFEST_NAME = '.tokenize_manifest.json'
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_input(path, prefix_size=None):
+    """
+    Return (sha1, size, prefix_sha1, prefix_ends_with_newline) in one pass.
+    prefix_sha1 covers the first `prefix_size` bytes (None if the file is shorter).
+    """
+    h = hashlib.sha1()
+    size = 0
+    prefix_sha1 = None
+    prefix_newline = False
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            if prefix_size is not None and prefix_sha1 is None and size + len(block) >= prefix_size:
+                cut = prefix_size - size
+                h.update(block[:cut])
+                prefix_sha1 = h.hexdigest()
+                prefix_newline = cut > 0 and block[cut - 1:cut] == b'\n'
+                h.update(block[cut:])
+            else:
+                h.update(block)
+            size += len(block)
+    if prefix_size == 0:
+        prefix_sha1 = hashlib.sha1().hexdigest()
+    return h.hexdigest(), size, prefix_sha1, prefix_newline
+
+
+def hash_packed(path):
+    """SHA-1 of the file on disk behind `path`, combined with the member name for archive members."""
+    archive, member = split_member(path)
+    digest = file_sha1(archive)
+    if member is None:
+        return digest
+    return hashlib.sha1(f"{digest}{member}".encode('utf-8')).hexdigest()
+
+
+def hash_view(path):
+    """Hash of a view spec together with the content of all its sources."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        h.update(f.read())
+    for source in read_view(path)['sources']:
+        h.update(hash_packed(source).encode('ascii'))
+    return h.hexdigest()
+
+
+class Plan:
+    def __init__(self, action, input_file, output_file, stat_path, model_hash, options,
+                 input_sha1, input_size, offset=0):
+        self.action = action
+        self.input_file = input_file
+        self.output_file = output_file
+        self.stat_path = stat_path
+        self.model_hash = model_hash
+        self.options = options
+        self.input_sha1 = input_sha1
+        self.input_size = input_size
+        self.offset = offset
+
+
+class TokenizeCache:
+    def __init__(self):
+        self._manifests = {}
+
+    def _manifest_path(self, output_file):
+        return os.path.join(os.path.dirname(os.path.abspath(output_file)), MANIFEST_NAME)
+
+    def _load(self, manifest_path):
+        if manifest_path not in self._manifests:
+            entries = {}
+            if os.path.exists(manifest_path):
+                try:
+                    with open(manifest_path, 'r', encoding='utf-8') as f:
+                        entries = json.load(f)
+                except ValueError:
+                    entries = {}
+            self._manifests[manifest_path] = entries
+        return self._manifests[manifest_path]
+
+    def plan(self, input_file, output_file, model_hash, options):
+        ids_output = options.get('output_format') == 'ids'
+        # a token-id corpus is a prefix; its header is written last
+        stat_path = output_file + '.json' if ids_output else output_file
+        entry = self._load(self._manifest_path(output_file)).get(os.path.abspath(stat_path))
+
+        if is_view(input_file):
+            input_sha1, input_size = hash_view(input_file), None
+            prefix_sha1, prefix_newline = None, False
+        elif not is_plain(input_file):
+            input_sha1, input_size = hash_packed(input_file), None
+            prefix_sha1, prefix_newline = None, False
+        else:
+            prefix_size = entry['input_size'] if entry and entry.get('input_size') is not None else None
+            input_sha1, input_size, prefix_sha1, prefix_newline = hash_input(input_file, prefix_size)
+
+        def make(action, offset=0):
+            return Plan(action, input_file, output_file, stat_path, model_hash, options,
+                        input_sha1, input_size, offset)
+
+        if entry is None or not os.path.exists(stat_path):
+            return make('full')
+        stat = os.stat(stat_path)
+        if (entry['output_size'], entry['output_mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            return make('full')
+        if entry['model_hash'] != model_hash or entry['options'] != options:
+            return make('full')
+        if entry['input_sha1'] == input_sha1:
+            return make('skip')
+        if (not ids_output and input_size is not None and entry.get('input_size') is not None
+                and input_size > entry['input_size'] and prefix_sha1 == entry['input_sha1']
+                and prefix_newline):
+            return make('append', entry['input_size'])
+        return make('full')
+
+    def record(self, plan):
+        """Store the state an output was produced from; call after encoding."""
+        manifest_path = self._manifest_path(plan.output_file)
+        stat = os.stat(plan.stat_path)
+        entry = {
+            'input': os.path.abspath(plan.input_file),
+            'input_sha1': plan.input_sha1,
+            'input_size': plan.input_size,
+            'model_hash': plan.model_hash,
+            'options': plan.options,
+            'output_size': stat.st_size,
+            'output_mtime_ns': stat.st_mtime_ns,
+        }
+        # re-read before writing so concurrent runs into one directory keep
+        # each other's entries
+        self._manifests.pop(manifest_path, None)
+        entries = self._load(manifest_path)
+        entries[os.path.abspath(plan.stat_path)] = entry
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+
+def run_cached(cache, input_file, output_file, model_hash, options, encode_fn):
+    """
+    Run encode_fn(start_offset) unless the cache says the output is current.
+    encode_fn returns (sentence_count, seconds); a skipped file returns (0, 0.0).
+    """
+    if cache is None:
+        return encode_fn(0)
+    plan = cache.plan(input_file, output_file, model_hash, options)
+    if plan.action == 'skip':
+        print(f"Up to date, skipped: {output_file}")
+        return 0, 0.0
+    if plan.action == 'append':
+        print(f"Input grew, encoding new lines only: {input_file} (from byte {plan.offset})")
+    result = encode_fn(plan.offset)
+    cache.record(plan)
+    return result
@@ -18,30 +18,91 @@ python tokenizer_scripts/tokenizer.py \
 import sentencepiece as spm
 import os
 import argparse
+import time
+from itertools import islice
 
-def encode_with_tokenizer(model_file, input_file, output_file):
-    """tokenization step"""
+from corpus_io import open_output
+from oversampling import open_text
+from token_ids import TokenIdWriter
+from tokenize_cache import TokenizeCache, file_sha1, run_cached
+from sentence_index import open_sentences
+
+
+def iter_chunks(lines, chunk_size):
+    """Yield lists of up to chunk_size non-empty stripped lines."""
+    stripped = (line.strip() for line in lines)
+    non_empty = (line for line in stripped if line)  # skip empty lines
+    while True:
+        chunk = list(islice(non_empty, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def open_input(input_file, start_offset=0, sentences=None):
+    if sentences:
+        return open_sentences(input_file, sentences)
+    return open_text(input_file, start_offset)
+
+
+def encode_with_tokenizer(model_file, input_file, output_file, chunk_size=10000, num_threads=-1, sp=None,
+                          output_format='text', start_offset=0, sentences=None):
+    """
+    tokenization step
+    Lines are read in chunks of `chunk_size` and each chunk is encoded with a
+    single batched sp.encode call on `num_threads` threads (-1 = all cores).
+    Pass an already loaded processor as `sp` to skip loading `model_file`.
+    `input_file` may be an oversampled .view.json (see oversampling.py), a
+    compressed file or an archive member, and `output_file` ending in .gz/.xz/
+    .bz2/.zst is written compressed (see corpus_io.py).
+    output_format='ids' writes a binary token-id corpus (see token_ids.py)
+    with `output_file` as its prefix instead of space-joined pieces.
+    A non-zero `start_offset` (text output only) encodes the input from that
+    byte on and appends to `output_file`; see tokenize_cache.py.
+    `sentences` encodes only a selection of input lines (see sentence_index.py).
+    Returns (sentence_count, seconds).
+    """
     # Ensure the output directory for tokenized text exists
     output_dir = os.path.dirname(output_file)
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
             
-    sp = spm.SentencePieceProcessor(model_file=model_file)
+    if sp is None:
+        sp = spm.SentencePieceProcessor(model_file=model_file)
     
+    if output_format == 'ids':
+        start = time.perf_counter()
+        with open_input(input_file, start_offset, sentences) as f_in, \
+             TokenIdWriter(output_file, model_file, 'sentencepiece', sp.get_piece_size()) as writer:
+            sentence_count = 0
+            for chunk in iter_chunks(f_in, chunk_size):
+                writer.add_batch(sp.encode(chunk, out_type=int, num_threads=num_threads))
+                sentence_count += len(chunk)
+        elapsed = time.perf_counter() - start
+        print(f"Tokenized {sentence_count} sentences -> {output_file}.ids.bin")
+        return sentence_count, elapsed
+
     # encode sentences
-    with open(input_file, "r", encoding="utf-8") as f_in, \
-         open(output_file, "w", encoding="utf-8") as f_out:
+    start = time.perf_counter()
+    with open_input(input_file, start_offset, sentences) as f_in, \
+         open_output(output_file, "a" if start_offset else "w") as f_out:
         
         sentence_count = 0
-        for line in f_in:
-            line = line.strip()
-            if line:  # skip empty lines
-                # out_type=str returns a list of tokens ["Hel", "sinki"]
-                pieces = sp.encode(line, out_type=str)
-                f_out.write(" ".join(pieces) + "\n")
-                sentence_count += 1
+        for chunk in iter_chunks(f_in, chunk_size):
+            # out_type=str returns a list of tokens per line [["Hel", "sinki"], ...]
+            pieces = sp.encode(chunk, out_type=str, num_threads=num_threads)
+            f_out.write("\n".join(" ".join(p) for p in pieces) + "\n")
+            sentence_count += len(chunk)
+    elapsed = time.perf_counter() - start
     
     print(f"Tokenized {sentence_count} sentences -> {output_file}")
+    return sentence_count, elapsed
+
+
+def print_throughput(total_sentences, total_seconds):
+    rate = total_sentences / total_seconds if total_seconds > 0 else float("inf")
+    print(f"Encoded {total_sentences} sentences in {total_seconds:.2f}s ({rate:,.0f} sentences/sec)")
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Apply existing tokenizer to files')
@@ -51,6 +112,16 @@ if __name__ == '__main__':
                        help='Raw text files to tokenize')
     parser.add_argument('--output_files', nargs='+', required=True, 
                        help='Output paths for tokenized files')
+    parser.add_argument('--chunk_size', type=int, default=10000,
+                       help='Lines per batched encode call')
+    parser.add_argument('--num_threads', type=int, default=-1,
+                       help='SentencePiece encode threads (-1 = all cores)')
+    parser.add_argument('--output_format', choices=['text', 'ids'], default='text',
+                       help='text: space-joined pieces; ids: binary token-id corpus (output path is the prefix)')
+    parser.add_argument('--force', action='store_true',
+                       help='Re-encode every file, ignoring the .tokenize_manifest.json cache')
+    parser.add_argument('--sentences',
+                       help='Only these input lines: START:STOP, i,j,k or @file (uses the .idx sidecar)')
 
     args = parser.parse_args()
 
@@ -63,7 +134,21 @@ if __name__ == '__main__':
 
     # Run inference only
     print(f"Loading model: {args.model_file}")
+    cache = None if args.force or args.sentences else TokenizeCache()
+    model_hash = file_sha1(args.model_file)
+    options = {'tokenizer': 'sentencepiece', 'output_format': args.output_format}
+    # loaded once and shared by every input file
+    sp = spm.SentencePieceProcessor(model_file=args.model_file)
+    total_sentences, total_seconds = 0, 0.0
     for input_file, output_file in zip(args.input_files, args.output_files):
-        encode_with_tokenizer(args.model_file, input_file, output_file)
+        count, seconds = run_cached(
+            cache, input_file, output_file, model_hash, options,
+            lambda offset: encode_with_tokenizer(args.model_file, input_file, output_file,
+                                                 args.chunk_size, args.num_threads, sp=sp,
+                                                 output_format=args.output_format,
+                                                 start_offset=offset, sentences=args.sentences))
+        total_sentences += count
+        total_seconds += seconds
 
-    print(f"\nAll done! Output files: {', '.join(args.output_files)}")
\ No newline at end of file
+    print(f"\nAll done! Output files: {', '.join(args.output_files)}")
+    print_throughput(total_sentences, total_seconds)
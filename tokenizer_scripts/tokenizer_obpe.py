@@ -10,63 +10,386 @@ python tokenizer_scripts/tokenizer_obpe.py \
 """
 
 import argparse
-from collections import defaultdict
+import hashlib
+import heapq
+import json
+import multiprocessing as mp
+import os
+import re
+import shutil
+import tempfile
+import time
+import sys
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from corpus_io import is_plain, open_output
+from oversampling import is_view, open_text
+from tokenize_cache import TokenizeCache, run_cached
+from sentence_index import open_sentences
+from token_ids import TokenIdWriter
+
+COMPILED_VERSION = 1
+WORD = re.compile(r"\S+")
 
 
 def load_codes(codes_path):
     """
     Load OBPE merge rules.
-    Each line: "a b" (two aymbols)
+    Each line: "a b" (two aymbols), after an optional "#version" header.
+    Other lines starting with '#' are merges of symbols that begin with '#'.
+    Lines that do not split into exactly two symbols are skipped with a warning.
     """
     merges = []
+    bad_lines = []
     with open(codes_path, encoding="utf-8") as f:
-        for line in f:
+        for line_num, line in enumerate(f, 1):
             line = line.strip()
-            if not line or line.startswith("#"):
+            if not line or (line_num == 1 and line.startswith("#version")):
                 continue
-            a, b = line.split()
-            merges.append((a, b))
+            parts = line.split()
+            if len(parts) != 2:
+                bad_lines.append((line_num, line))
+                continue
+            merges.append((parts[0], parts[1]))
+
+    if bad_lines:
+        print(f"Warning: skipped {len(bad_lines)} malformed merge lines in {codes_path}", file=sys.stderr)
+        for line_num, line in bad_lines[:5]:
+            print(f"  line {line_num}: {line!r}", file=sys.stderr)
     return merges
 
 
+def hash_codes(codes_path):
+    """SHA-1 of the merges file, used to key caches built from it."""
+    h = hashlib.sha1()
+    with open(codes_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# --- compiled merges ---
+# <prefix>.json         header: source hash, counts
+# <prefix>.symbols      interned symbols, one per line (symbols never contain whitespace)
+# <prefix>.pairs.bin    int32 (n_merges, 2) symbol ids; the row index is the rank
+
+def compiled_prefix(codes_path, compiled_dir=None):
+    compiled_dir = compiled_dir or os.path.dirname(os.path.abspath(codes_path))
+    return os.path.join(compiled_dir, os.path.basename(codes_path) + ".compiled")
+
+
+def compile_codes(codes_path, prefix, codes_hash=None):
+    """Parse and validate merges.txt once and write its compiled form."""
+    merges = load_codes(codes_path)
+    symbol_ids = {}
+    pairs = np.empty((len(merges), 2), dtype=np.int32)
+    for i, (a, b) in enumerate(merges):
+        pairs[i, 0] = symbol_ids.setdefault(a, len(symbol_ids))
+        pairs[i, 1] = symbol_ids.setdefault(b, len(symbol_ids))
+
+    os.makedirs(os.path.dirname(prefix), exist_ok=True)
+    pairs.tofile(prefix + ".pairs.bin")
+    with open(prefix + ".symbols", "w", encoding="utf-8") as f:
+        f.write("\n".join(symbol_ids))
+    # header last: a run interrupted before this point leaves no valid header
+    with open(prefix + ".json", "w", encoding="utf-8") as f:
+        json.dump({
+            "version": COMPILED_VERSION,
+            "codes_hash": codes_hash or hash_codes(codes_path),
+            "num_merges": len(merges),
+            "num_symbols": len(symbol_ids),
+        }, f, indent=2)
+    return merges
+
+
+def load_compiled_codes(prefix, codes_hash):
+    """Return the rank table from a compiled merges file, or None if missing or stale."""
+    try:
+        with open(prefix + ".json", encoding="utf-8") as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header.get("version") != COMPILED_VERSION or header.get("codes_hash") != codes_hash:
+        return None
+
+    with open(prefix + ".symbols", encoding="utf-8") as f:
+        symbols = f.read().split("\n") if header["num_symbols"] else []
+    if header["num_merges"] == 0:
+        return {}
+    pairs = np.memmap(prefix + ".pairs.bin", dtype=np.int32, mode="r").reshape(-1, 2)
+    if len(pairs) != header["num_merges"] or len(symbols) != header["num_symbols"] \
+            or pairs.min() < 0 or pairs.max() >= len(symbols):
+        return None
+
+    lookup = symbols.__getitem__
+    lefts = map(lookup, pairs[:, 0].tolist())
+    rights = map(lookup, pairs[:, 1].tolist())
+    # later duplicates win, as in OBPEEncoder.__init__
+    return dict(zip(zip(lefts, rights), range(len(pairs))))
+
+
 def get_pairs(symbols):
     """Return set of adjacent symbol pairs."""
     return {(symbols[i], symbols[i + 1]) for i in range(len(symbols) - 1)}
 
 
-def apply_bpe_to_word(word, merges):
+class OBPEEncoder:
     """
-    Apply OBPE merges to a single word.
-    OBPE operates on characters.
+    Apply OBPE merges with a rank table compiled once.
+    Merges are applied per word with a heap over adjacent pairs and a
+    linked list of symbols, so each word costs O(n log n).
+    Each word type is segmented once; results are kept in an LRU of
+    `cache_size` entries (0 disables it).
     """
-    symbols = list(word)
 
-    if len(symbols) == 1:
+    def __init__(self, merges, cache_size=200000, codes_hash=None, codes_path=None, ranks=None):
+        # later duplicates win, same as the original per-word merge_dict
+        if ranks is None:
+            ranks = {pair: i for i, pair in enumerate(merges)}
+        self.ranks = ranks
+        if codes_hash is None:
+            codes_hash = hashlib.sha1(
+                "\n".join(f"{a} {b}" for a, b in merges).encode("utf-8")).hexdigest()
+        self.codes_hash = codes_hash
+        self.codes_path = codes_path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # set to a dict to collect newly segmented types (used by workers)
+        self.new_types = None
+
+    @classmethod
+    def from_codes(cls, codes_path, cache_size=200000, compiled=True, compiled_dir=None):
+        """
+        Load merges from `codes_path`. With `compiled`, the compiled form next to
+        the codes (or in `compiled_dir`) is used, and rebuilt when the hash of
+        the codes file no longer matches.
+        """
+        codes_hash = hash_codes(codes_path)
+        ranks = None
+        if compiled:
+            prefix = compiled_prefix(codes_path, compiled_dir)
+            ranks = load_compiled_codes(prefix, codes_hash)
+            if ranks is None:
+                try:
+                    merges = compile_codes(codes_path, prefix, codes_hash)
+                    print(f"Compiled {len(merges)} merges to {prefix}.*")
+                except OSError as e:
+                    print(f"Warning: could not write compiled merges ({e}), parsing text", file=sys.stderr)
+                    merges = load_codes(codes_path)
+                return cls(merges, cache_size=cache_size, codes_hash=codes_hash, codes_path=codes_path)
+        if ranks is None:
+            return cls(load_codes(codes_path), cache_size=cache_size,
+                       codes_hash=codes_hash, codes_path=codes_path)
+        return cls(None, cache_size=cache_size, codes_hash=codes_hash,
+                   codes_path=codes_path, ranks=ranks)
+
+    def encode_word(self, word):
+        """Segment a single word into OBPE subwords (no </w> marker)."""
+        if not self.cache_size:
+            return self._merge_word(word)
+
+        cache = self._cache
+        cached = cache.get(word)
+        if cached is not None:
+            cache.move_to_end(word)
+            self.hits += 1
+            return list(cached)
+
+        self.misses += 1
+        symbols = self._merge_word(word)
+        cache[word] = tuple(symbols)
+        if self.new_types is not None:
+            self.new_types[word] = cache[word]
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
         return symbols
 
-    merge_dict = {pair: i for i, pair in enumerate(merges)}
+    def _merge_word(self, word):
+        symbols = list(word)
+        n = len(symbols)
+        if n < 2:
+            return symbols
+
+        ranks = self.ranks
+        prev = list(range(-1, n - 1))
+        nxt = list(range(1, n + 1))
+        nxt[-1] = -1
+
+        heap = []
+        for i in range(n - 1):
+            rank = ranks.get((symbols[i], symbols[i + 1]))
+            if rank is not None:
+                heap.append((rank, i, symbols[i], symbols[i + 1]))
+        heapq.heapify(heap)
+
+        while heap:
+            # merge every occurrence of the best pair left to right before
+            # looking at pairs the merges create, as the per-pass scan did
+            rank = heap[0][0]
+            merged_at = []
+            while heap and heap[0][0] == rank:
+                _, i, left, right = heapq.heappop(heap)
+                j = nxt[i]
+                # stale entry: one side was merged away since it was pushed
+                if symbols[i] != left or j == -1 or symbols[j] != right:
+                    continue
+                symbols[i] = left + right
+                symbols[j] = None
+                k = nxt[j]
+                nxt[i] = k
+                if k != -1:
+                    prev[k] = i
+                merged_at.append(i)
+
+            for i in merged_at:
+                p = prev[i]
+                if p != -1:
+                    pair_rank = ranks.get((symbols[p], symbols[i]))
+                    if pair_rank is not None:
+                        heapq.heappush(heap, (pair_rank, p, symbols[p], symbols[i]))
+                k = nxt[i]
+                if k != -1:
+                    pair_rank = ranks.get((symbols[i], symbols[k]))
+                    if pair_rank is not None:
+                        heapq.heappush(heap, (pair_rank, i, symbols[i], symbols[k]))
+
+        return [s for s in symbols if s is not None]
+
+    def encode_sentence(self, sentence):
+        """
+        Apply OBPE to one sentence.
+        Each word is segmented independently.
+        """
+        output_tokens = []
+        for word in sentence.strip().split():
+            output_tokens.extend(self.encode_word(word))
+            # OBPE word boundary marker
+            output_tokens[-1] = output_tokens[-1] + "</w>"
+        return " ".join(output_tokens)
+
+    def encode_sentence_spans(self, sentence):
+        """
+        Like encode_sentence, but returns (pieces, spans): the pieces as a list
+        and the (begin, end) character span in `sentence` each piece covers
+        (without its </w> marker). OBPE pieces of a word spell it exactly.
+        """
+        pieces, spans = [], []
+        for match in WORD.finditer(sentence):
+            pos = match.start()
+            for symbol in self.encode_word(match.group()):
+                pieces.append(symbol)
+                spans.append((pos, pos + len(symbol)))
+                pos += len(symbol)
+            pieces[-1] = pieces[-1] + "</w>"
+        return pieces, spans
+
+    def encode_file(self, input_file, output_file, output_format="text", start_offset=0, sentences=None):
+        """
+        Segment a whole file (or an oversampled .view.json, a compressed file
+        or an archive member), keeping blank lines. Returns the sentence count.
+        output_format="ids" writes a binary token-id corpus (see token_ids.py)
+        with `output_file` as its prefix; blank lines become empty sentences.
+        A non-zero `start_offset` (text only) segments the input from that
+        byte on and appends to `output_file`. `sentences` segments only a
+        selection of input lines (see sentence_index.py).
+        """
+        if sentences:
+            fin_context = open_sentences(input_file, sentences)
+        else:
+            fin_context = open_text(input_file, start_offset)
+        if output_format == "ids":
+            sentence_count = 0
+            with fin_context as fin, \
+                 self.id_writer(output_file) as writer:
+                for line in fin:
+                    line = line.strip()
+                    if line:
+                        sentence_count += 1
+                        writer.add_pieces(self.encode_sentence(line).split())
+                    else:
+                        writer.add([])
+            return sentence_count
+
+        sentence_count = 0
+        with fin_context as fin, \
+             open_output(output_file, "a" if start_offset else "w") as fout:
+            for line in fin:
+                line = line.strip()
+                if not line:
+                    fout.write("\n")
+                    continue
+                fout.write(self.encode_sentence(line) + "\n")
+                sentence_count += 1
+        return sentence_count
+
+    def id_writer(self, prefix):
+        return TokenIdWriter(prefix, self.codes_path or f"obpe:{self.codes_hash}", "obpe")
+
+    def cache_path(self, cache_dir):
+        return os.path.join(cache_dir, f"obpe_{self.codes_hash[:16]}.cache.json")
+
+    def load_cache(self, cache_dir):
+        """Load segmentations saved by an earlier run with the same codes."""
+        path = self.cache_path(cache_dir)
+        if not self.cache_size or not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("codes_hash") != self.codes_hash:
+            return 0
+        # the file is written oldest first, keep the most recent entries
+        entries = list(data["words"].items())[-self.cache_size:]
+        for word, segmented in entries:
+            self._cache[word] = tuple(segmented.split(" "))
+        return len(entries)
 
-    while True:
-        pairs = get_pairs(symbols)
-        candidates = [(merge_dict[p], p) for p in pairs if p in merge_dict]
-        if not candidates:
-            break
+    def save_cache(self, cache_dir):
+        """Write the in-memory LRU to `cache_dir`, keyed by the codes hash."""
+        if not self.cache_size:
+            return None
+        os.makedirs(cache_dir, exist_ok=True)
+        path = self.cache_path(cache_dir)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "codes_hash": self.codes_hash,
+                "words": {w: " ".join(sy) for w, sy in self._cache.items()},
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
 
-        _, best_pair = min(candidates)
-        new_symbols = []
-        i = 0
+    def add_to_cache(self, entries):
+        """Merge {word: subwords} segmented elsewhere into the LRU."""
+        if not self.cache_size:
+            return
+        for word, symbols in entries.items():
+            self._cache[word] = tuple(symbols)
+            self._cache.move_to_end(word)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
 
-        while i < len(symbols):
-            if i < len(symbols) - 1 and (symbols[i], symbols[i + 1]) == best_pair:
-                new_symbols.append(symbols[i] + symbols[i + 1])
-                i += 2
-            else:
-                new_symbols.append(symbols[i])
-                i += 1
+    def cache_stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return (f"Word cache: {self.hits} hits, {self.misses} misses "
+                f"({rate:.1%} hit rate, {len(self._cache)} types cached)")
 
-        symbols = new_symbols
 
-    return symbols
+def _as_encoder(merges):
+    return merges if isinstance(merges, OBPEEncoder) else OBPEEncoder(merges)
+
+
+def apply_bpe_to_word(word, merges):
+    """
+    Apply OBPE merges to a single word.
+    `merges` may be the list from load_codes or a prebuilt OBPEEncoder;
+    pass an encoder when segmenting many words.
+    """
+    return _as_encoder(merges).encode_word(word)
 
 
 def apply_obpe_sentence(sentence, merges):
@@ -74,17 +397,127 @@ def apply_obpe_sentence(sentence, merges):
     Apply OBPE to one sentence.
     Each word is segmented independently.
     """
-    output_tokens = []
-    words = sentence.strip().split()
+    return _as_encoder(merges).encode_sentence(sentence)
+
+
+# --- multi-process mode ---
+# Workers are forked after _WORKER_ENCODER is set, so the rank table is
+# shared copy-on-write instead of being pickled for every shard.
+_WORKER_ENCODER = None
+MIN_SHARD_BYTES = 1 << 20
 
-    for word in words:
-        subwords = apply_bpe_to_word(word, merges)
-        for sw in subwords:
-            output_tokens.append(sw)
-        # OBPE word boundary marker
-        output_tokens[-1] = output_tokens[-1] + "</w>"
 
-    return " ".join(output_tokens)
+def _init_worker(encoder=None):
+    # only called with an argument where fork is unavailable (spawn)
+    global _WORKER_ENCODER
+    if encoder is not None:
+        _WORKER_ENCODER = encoder
+
+
+def shard_offsets(path, num_shards, start=0):
+    """
+    Split a file from byte `start` on into at most `num_shards` byte ranges
+    [start, end) whose boundaries fall right after a newline.
+    """
+    size = os.path.getsize(path)
+    num_shards = max(1, min(num_shards, (size - start) // MIN_SHARD_BYTES))
+    bounds = [start]
+    with open(path, "rb") as f:
+        for i in range(1, num_shards):
+            f.seek(max(start + (size - start) * i // num_shards, bounds[-1]))
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _encode_shard(task):
+    input_file, start, end, shard_output = task
+    encoder = _WORKER_ENCODER
+    hits, misses = encoder.hits, encoder.misses
+    encoder.new_types = {} if encoder.cache_size else None
+    sentence_count = 0
+
+    with open(input_file, "rb") as fin, \
+         open(shard_output, "w", encoding="utf-8") as fout:
+        fin.seek(start)
+        pos = start
+        while pos < end:
+            raw = fin.readline()
+            if not raw:
+                break
+            pos += len(raw)
+            line = raw.decode("utf-8").strip()
+            if not line:
+                fout.write("\n")
+                continue
+            fout.write(encoder.encode_sentence(line) + "\n")
+            sentence_count += 1
+
+    new_types = encoder.new_types or {}
+    encoder.new_types = None
+    return sentence_count, encoder.hits - hits, encoder.misses - misses, new_types
+
+
+def encode_file_parallel(encoder, input_file, output_file, workers, output_format="text", start_offset=0,
+                         sentences=None):
+    """
+    Segment `input_file` in byte-range shards on a process pool and
+    concatenate the shard outputs in the original line order.
+    Blank lines are kept, so line alignment with .tags files is exact.
+    """
+    global _WORKER_ENCODER
+    if is_view(input_file) or not is_plain(input_file) or sentences:
+        # views and compressed inputs are streamed, not byte-addressable;
+        # selections are read through the index
+        return encoder.encode_file(input_file, output_file, output_format, start_offset, sentences)
+    shards = shard_offsets(input_file, workers * 4, start_offset)
+    if workers <= 1 or len(shards) == 1:
+        return encoder.encode_file(input_file, output_file, output_format, start_offset)
+
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    tmp_dir = tempfile.mkdtemp(prefix=".obpe_shards_", dir=output_dir)
+    tasks = [(input_file, start, end, os.path.join(tmp_dir, f"{i:05d}"))
+             for i, (start, end) in enumerate(shards)]
+
+    if "fork" in mp.get_all_start_methods():
+        _WORKER_ENCODER = encoder
+        ctx = mp.get_context("fork")
+        pool_args = {}
+    else:
+        ctx = mp.get_context()
+        pool_args = {"initializer": _init_worker, "initargs": (encoder,)}
+
+    sentence_count = 0
+    try:
+        with ctx.Pool(workers, **pool_args) as pool:
+            for count, hits, misses, new_types in pool.imap(_encode_shard, tasks):
+                sentence_count += count
+                encoder.hits += hits
+                encoder.misses += misses
+                encoder.add_to_cache(new_types)
+
+        if output_format == "ids":
+            # piece ids are assigned here so they agree across shards
+            with encoder.id_writer(output_file) as writer:
+                for _, _, _, shard_output in tasks:
+                    with open(shard_output, encoding="utf-8") as fin:
+                        for line in fin:
+                            writer.add_pieces(line.split())
+        else:
+            with open_output(output_file, "ab" if start_offset else "wb") as fout:
+                for _, _, _, shard_output in tasks:
+                    with open(shard_output, "rb") as fin:
+                        shutil.copyfileobj(fin, fout, 1 << 20)
+    finally:
+        _WORKER_ENCODER = None
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return sentence_count
 
 
 def main():
@@ -92,23 +525,51 @@ def main():
     parser.add_argument("--codes", required=True, help="OBPE merge rules")
     parser.add_argument("--input", nargs='+', required=True, help="Input text files")
     parser.add_argument("--output", nargs='+', required=True, help="Output OBPE files")
+    parser.add_argument("--cache_size", type=int, default=200000,
+                        help="Max word types kept in the segmentation LRU (0 disables it)")
+    parser.add_argument("--cache_dir", default=None,
+                        help="Directory for the on-disk word cache, reused across runs with the same codes")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; inputs over 1 MiB are split into line-aligned shards")
+    parser.add_argument("--output_format", choices=["text", "ids"], default="text",
+                        help="text: OBPE pieces; ids: binary token-id corpus (output path is the prefix)")
+    parser.add_argument("--compiled_dir", default=None,
+                        help="Where to keep the compiled merge table (default: next to --codes)")
+    parser.add_argument("--no_compile", action="store_true",
+                        help="Always parse --codes as text, never read or write the compiled form")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-encode every file, ignoring the .tokenize_manifest.json cache")
+    parser.add_argument("--sentences",
+                        help="Only these input lines: START:STOP, i,j,k or @file (uses the .idx sidecar)")
     args = parser.parse_args()
 
-    merges = load_codes(args.codes)
+    encoder = OBPEEncoder.from_codes(args.codes, cache_size=args.cache_size,
+                                     compiled=not args.no_compile, compiled_dir=args.compiled_dir)
+    if args.cache_dir:
+        loaded = encoder.load_cache(args.cache_dir)
+        print(f"Loaded {loaded} cached word types from {encoder.cache_path(args.cache_dir)}")
 
+    def encode(input_file, output_file, offset):
+        start = time.perf_counter()
+        if args.workers > 1:
+            count = encode_file_parallel(encoder, input_file, output_file, args.workers,
+                                         args.output_format, offset, args.sentences)
+        else:
+            count = encoder.encode_file(input_file, output_file, args.output_format, offset, args.sentences)
+        return count, time.perf_counter() - start
+
+    cache = None if args.force or args.sentences else TokenizeCache()
+    options = {"tokenizer": "obpe", "output_format": args.output_format}
     for input_file, output_file in zip(args.input, args.output):
-        with open(input_file, encoding="utf-8") as fin, \
-             open(output_file, "w", encoding="utf-8") as fout:
-            for line in fin:
-                line = line.strip()
-                if not line:
-                    fout.write("\n")
-                    continue
-                obpe_line = apply_obpe_sentence(line, merges)
-                fout.write(obpe_line + "\n")
+        run_cached(cache, input_file, output_file, encoder.codes_hash, options,
+                   lambda offset: encode(input_file, output_file, offset))
 
     print(f"OBPE-applied text written to {args.output}")
+    if args.cache_size:
+        print(encoder.cache_stats())
+    if args.cache_dir:
+        print(f"Word cache saved to {encoder.save_cache(args.cache_dir)}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
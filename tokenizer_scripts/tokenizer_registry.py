@@ -0,0 +1,170 @@
+'''
+python tokenizer_scripts/tokenizer_registry.py \
+    --models_dir ./models \
+    --obpe_dir /Users/Ingrid/OBPE/models \
+    --manifest ./pilot_data/ud_data/tokenize_jobs.txt \
+    --max_resident 4
+
+Manifest: one job per line, whitespace separated, '#' starts a comment
+    # language  tokenizer  input                                   output
+    sme         bpe        ./pilot_data/ud_data/text/sme_train_v5.txt  ./pilot_data/ud_data/subword/sme_train.bpe
+    et          unigram    ./pilot_data/ud_data/text/et_dev_v5.txt     ./pilot_data/ud_data/subword/et_dev.unigram
+    fi+et_sme_obpe obpe    ./pilot_data/ud_data/text/sme_test_v5.txt   ./pilot_data/ud_data/subword/sme_et_test.obpe
+
+Use --list to print every (language, tokenizer) the registry can serve.
+'''
+
+import argparse
+import glob
+import os
+import time
+from collections import OrderedDict
+
+import sentencepiece as spm
+
+from tokenizer import encode_with_tokenizer, print_throughput
+from tokenizer_obpe import OBPEEncoder
+
+SPM_TOKENIZERS = ('bpe', 'unigram')
+
+
+class TokenizerRegistry:
+    """
+    Discover tokenizer models and load each one lazily on first use.
+    SentencePiece models are found as models/{bpe,unigram}/<lang>_*.model
+    (language = file name up to the first '_'); OBPE codes as
+    <obpe_dir>/**/merges.txt (language = name of the containing folder).
+    At most `max_resident` models stay loaded, least recently used first out.
+    """
+
+    def __init__(self, models_dir='./models', obpe_dirs=(), max_resident=4, num_threads=-1):
+        self.max_resident = max(1, max_resident)
+        self.num_threads = num_threads
+        self.paths = {}
+        self._resident = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+        self.discover(models_dir, obpe_dirs)
+
+    def discover(self, models_dir, obpe_dirs=()):
+        for tok in SPM_TOKENIZERS:
+            for path in sorted(glob.glob(os.path.join(models_dir, tok, '*.model'))):
+                lang = os.path.basename(path).split('_', 1)[0]
+                self.paths.setdefault((lang, tok), path)
+        for obpe_dir in obpe_dirs:
+            pattern = os.path.join(obpe_dir, '**', 'merges.txt')
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                lang = os.path.basename(os.path.dirname(os.path.abspath(path)))
+                self.paths.setdefault((lang, 'obpe'), path)
+
+    def available(self):
+        return sorted(self.paths)
+
+    def get(self, lang, tok):
+        """Return the loaded SentencePieceProcessor / OBPEEncoder for (lang, tok)."""
+        key = (lang, tok)
+        if key in self._resident:
+            self._resident.move_to_end(key)
+            return self._resident[key]
+        if key not in self.paths:
+            raise KeyError(f"No {tok} model found for language '{lang}'")
+
+        path = self.paths[key]
+        if tok == 'obpe':
+            model = OBPEEncoder.from_codes(path)
+        else:
+            model = spm.SentencePieceProcessor(model_file=path)
+        self.loads += 1
+        print(f"Loaded {tok} model for {lang}: {path}")
+
+        self._resident[key] = model
+        while len(self._resident) > self.max_resident:
+            self._resident.popitem(last=False)
+            self.evictions += 1
+        return model
+
+    def encode(self, lang, tok, sentences):
+        """Encode a list of sentences, returning a list of piece lists."""
+        model = self.get(lang, tok)
+        if tok == 'obpe':
+            return [model.encode_sentence(s).split() for s in sentences]
+        return model.encode(list(sentences), out_type=str, num_threads=self.num_threads)
+
+    def encode_file(self, lang, tok, input_file, output_file, chunk_size=10000, output_format='text'):
+        """Tokenize one file with the same output conventions as the per-tokenizer scripts."""
+        model = self.get(lang, tok)
+        if tok == 'obpe':
+            output_dir = os.path.dirname(output_file)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            start = time.perf_counter()
+            count = model.encode_file(input_file, output_file, output_format)
+            print(f"Tokenized {count} sentences -> {output_file}")
+            return count, time.perf_counter() - start
+        return encode_with_tokenizer(self.paths[(lang, tok)], input_file, output_file,
+                                     chunk_size, self.num_threads, sp=model,
+                                     output_format=output_format)
+
+
+def read_manifest(manifest_path):
+    """Return (language, tokenizer, input, output) tuples from a manifest file."""
+    jobs = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            if len(parts) != 4:
+                raise ValueError(f"{manifest_path}:{line_num}: expected 'language tokenizer input output'")
+            jobs.append(tuple(parts))
+    return jobs
+
+
+def run_jobs(registry, jobs, chunk_size=10000, output_format='text'):
+    # group jobs by model, keeping first-appearance order, so each model
+    # is loaded once even when max_resident is small
+    order = {}
+    for lang, tok, _, _ in jobs:
+        order.setdefault((lang, tok), len(order))
+    jobs = sorted(jobs, key=lambda job: order[(job[0], job[1])])
+
+    total_sentences, total_seconds = 0, 0.0
+    for lang, tok, input_file, output_file in jobs:
+        count, seconds = registry.encode_file(lang, tok, input_file, output_file, chunk_size, output_format)
+        total_sentences += count
+        total_seconds += seconds
+    return total_sentences, total_seconds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tokenize a manifest of jobs with models loaded once')
+    parser.add_argument('--models_dir', default='./models',
+                       help='Directory containing bpe/ and unigram/ model folders')
+    parser.add_argument('--obpe_dir', nargs='*', default=[],
+                       help='Directories searched recursively for OBPE merges.txt')
+    parser.add_argument('--manifest', help='Job list: language tokenizer input output')
+    parser.add_argument('--max_resident', type=int, default=4,
+                       help='Maximum number of models kept loaded at once')
+    parser.add_argument('--chunk_size', type=int, default=10000,
+                       help='Lines per batched encode call')
+    parser.add_argument('--num_threads', type=int, default=-1,
+                       help='SentencePiece encode threads (-1 = all cores)')
+    parser.add_argument('--output_format', choices=['text', 'ids'], default='text',
+                       help='text: space-joined pieces; ids: binary token-id corpus (output path is the prefix)')
+    parser.add_argument('--list', action='store_true', help='List available models and exit')
+
+    args = parser.parse_args()
+
+    registry = TokenizerRegistry(args.models_dir, args.obpe_dir, args.max_resident, args.num_threads)
+
+    if args.list:
+        for lang, tok in registry.available():
+            print(f"{lang}\t{tok}\t{registry.paths[(lang, tok)]}")
+    elif not args.manifest:
+        parser.error("--manifest is required unless --list is given")
+    else:
+        jobs = read_manifest(args.manifest)
+        total_sentences, total_seconds = run_jobs(registry, jobs, args.chunk_size, args.output_format)
+        print(f"\nAll done! {len(jobs)} jobs, {registry.loads} model loads, {registry.evictions} evictions")
+        print_throughput(total_sentences, total_seconds)
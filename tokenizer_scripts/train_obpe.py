@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Learn OBPE merges from a high-resource and a low-resource corpus.
+Output is a merges.txt that tokenizer_obpe.py (load_codes) can apply.
+
+python tokenizer_scripts/train_obpe.py \
+    --hrl ./downstream_task/joeynmt/data/extracted_train.fi ./downstream_task/joeynmt/data/et-tatoeba.et \
+    --lrl ./downstream_task/joeynmt/data/sme_train.sme \
+    --num_merges 5000 \
+    --output ./models/obpe/fi+et_sme_obpe/merges.txt
+
+Pair score (OBPE, overlap-weighted):
+    score(a, b) = f_hrl(a, b) + f_lrl(a, b) + alpha * min(f_hrl(a, b), f_lrl(a, b))
+The min term is the generalized-mean overlap with p -> -inf: it only
+rewards pairs that are frequent in both groups, so shared subwords are
+preferred over ones that are frequent in a single language.
+
+Word types are counted once. Pair counts, the pair -> words index and a
+max-heap of scores are updated incrementally after each merge, so only
+the words containing the merged pair are touched.
+"""
+
+import argparse
+import heapq
+import os
+import time
+from collections import Counter, defaultdict
+
+from corpus_io import open_input
+
+
+def count_words(paths):
+    """Word-type frequencies over whitespace-tokenized (optionally compressed) files."""
+    counts = Counter()
+    for path in paths:
+        with open_input(path) as f:
+            for line in f:
+                counts.update(line.split())
+    return counts
+
+
+class OBPETrainer:
+    def __init__(self, hrl_counts, lrl_counts, alpha=0.5):
+        self.alpha = alpha
+        self.words = []       # symbol lists, one per word type
+        self.freqs = []       # (hrl count, lrl count) per word type
+        for word in sorted(set(hrl_counts) | set(lrl_counts)):
+            self.words.append(list(word))
+            self.freqs.append((hrl_counts.get(word, 0), lrl_counts.get(word, 0)))
+
+        self.stats = defaultdict(lambda: [0, 0])   # pair -> [hrl freq, lrl freq]
+        self.index = defaultdict(set)              # pair -> word ids (may be stale)
+        for idx, symbols in enumerate(self.words):
+            f_h, f_l = self.freqs[idx]
+            for pair in zip(symbols, symbols[1:]):
+                stat = self.stats[pair]
+                stat[0] += f_h
+                stat[1] += f_l
+                self.index[pair].add(idx)
+
+        self.heap = [(-self.score(pair), pair) for pair in self.stats]
+        heapq.heapify(self.heap)
+
+    def score(self, pair):
+        f_h, f_l = self.stats[pair]
+        return f_h + f_l + self.alpha * min(f_h, f_l)
+
+    def pop_best(self):
+        """Return (pair, score) of the best current pair, skipping stale heap entries."""
+        while self.heap:
+            neg_score, pair = heapq.heappop(self.heap)
+            if pair in self.stats and -neg_score == self.score(pair):
+                return pair, -neg_score
+        return None, 0
+
+    def merge(self, pair):
+        a, b = pair
+        merged = a + b
+        stats = self.stats
+        index = self.index
+        changed = set()   # pairs whose counts moved; re-pushed once per merge
+
+        for idx in self.index.pop(pair, ()):
+            symbols = self.words[idx]
+            new_symbols = []
+            i = 0
+            while i < len(symbols):
+                if i < len(symbols) - 1 and symbols[i] == a and symbols[i + 1] == b:
+                    new_symbols.append(merged)
+                    i += 2
+                else:
+                    new_symbols.append(symbols[i])
+                    i += 1
+            if len(new_symbols) == len(symbols):
+                continue   # stale index entry
+
+            # net change of this word's pair counts; only pairs next to a
+            # merge site end up non-zero
+            f_h, f_l = self.freqs[idx]
+            delta = {}
+            for p in zip(symbols, symbols[1:]):
+                delta[p] = delta.get(p, 0) - 1
+            for p in zip(new_symbols, new_symbols[1:]):
+                delta[p] = delta.get(p, 0) + 1
+            for p, d in delta.items():
+                if d:
+                    changed.add(p)
+                    stat = stats[p]
+                    stat[0] += d * f_h
+                    stat[1] += d * f_l
+                    if d > 0:
+                        index[p].add(idx)
+            self.words[idx] = new_symbols
+
+        self.stats.pop(pair, None)
+        for p in changed:
+            if p == pair:
+                continue
+            if self.stats[p][0] <= 0 and self.stats[p][1] <= 0:
+                del self.stats[p]
+                self.index.pop(p, None)
+            else:
+                heapq.heappush(self.heap, (-self.score(p), p))
+
+    def train(self, num_merges, min_frequency=2, verbose=True):
+        merges = []
+        start = time.perf_counter()
+        while len(merges) < num_merges:
+            pair, _ = self.pop_best()
+            if pair is None:
+                break
+            f_h, f_l = self.stats[pair]
+            if f_h + f_l < min_frequency:
+                break
+            self.merge(pair)
+            merges.append(pair)
+            if verbose and len(merges) % 1000 == 0:
+                print(f"  {len(merges)} merges ({time.perf_counter() - start:.1f}s)")
+        return merges
+
+
+def save_merges(merges, output_path):
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+        for a, b in merges:
+            f.write(f"{a} {b}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train OBPE merges for a HRL/LRL language pair")
+    parser.add_argument("--hrl", nargs='+', required=True, help="High-resource language text files")
+    parser.add_argument("--lrl", nargs='+', required=True, help="Low-resource language text files")
+    parser.add_argument("--output", required=True, help="Output merges.txt")
+    parser.add_argument("--num_merges", type=int, default=5000, help="Number of merges to learn")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Weight of the overlap term")
+    parser.add_argument("--min_frequency", type=int, default=2,
+                        help="Stop when the best pair occurs fewer times than this")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    hrl_counts = count_words(args.hrl)
+    lrl_counts = count_words(args.lrl)
+    print(f"HRL: {len(hrl_counts)} word types, LRL: {len(lrl_counts)} word types")
+
+    trainer = OBPETrainer(hrl_counts, lrl_counts, alpha=args.alpha)
+    merges = trainer.train(args.num_merges, args.min_frequency)
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    save_merges(merges, args.output)
+    print(f"Learned {len(merges)} merges in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,33 @@ python tokenizer_scripts/train_tokenizer_bpe_unigram.py \
     --output_files ./pilot_data/ud_data/subword/et_train.bpe ./pilot_data/ud_data/subword/et_dev.bpe ./pilot_data/ud_data/subword/et_test.bpe \
     --model_prefix et_unigram_model \
     --vocab_size 5000
+
+Sweep mode (train only, one process per job):
+python tokenizer_scripts/train_tokenizer_bpe_unigram.py \
+    --sweep \
+    --languages et hu sme kpv \
+    --tokenizers bpe unigram \
+    --vocab_sizes 2000 5000 8000 \
+    --train_pattern "./pilot_data/ud_data/text/{lang}_train_v5.txt" \
+    --jobs 4 --threads_per_job 2
 '''
 
 import sentencepiece as spm
 import os
+import sys
 import argparse
+import json
+import multiprocessing as mp
+import time
+from corpus_io import exists, is_plain
+from oversampling import is_view, open_text
+from tokenizer import encode_with_tokenizer, print_throughput
+from tokenize_cache import TokenizeCache, file_sha1, hash_packed, hash_view, run_cached
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 # def train_tokenizer(input_file, model_prefix, tokenizer_type, vocab_size=5000):
 #     """train the tokenizer and store the model"""
@@ -31,7 +53,7 @@ import argparse
 #     print(f"{tokenizer_type.upper()} training completed: {model_prefix}.model")
 #     return f"{model_prefix}.model"
 
-def train_tokenizer(input_file, model_prefix, tokenizer_type, vocab_size=5000):
+def train_tokenizer(input_file, model_prefix, tokenizer_type, vocab_size=5000, num_threads=None):
     """train the tokenizer and store outputs in tokenizer-specific subdirectories"""
     
     # Define the directory structure based on tokenizer type
@@ -50,11 +72,23 @@ def train_tokenizer(input_file, model_prefix, tokenizer_type, vocab_size=5000):
     if tokenizer_type not in ['unigram', 'bpe']:
         raise ValueError(f"Invalid tokenizer: {tokenizer_type}")
 # 1. Training step
-    spm.SentencePieceTrainer.Train(
-        f"--input={input_file} --model_prefix={model_path_prefix} "
-        f"--vocab_size={vocab_size} --model_type={tokenizer_type} --character_coverage=1.0 "
-        f"--unk_piece=<unk> --hard_vocab_limit=false"
-    )
+    if is_view(input_file) or not is_plain(input_file):
+        # oversampled view or compressed corpus: stream its lines instead of
+        # materializing a file (SentencePiece only reads plain --input files)
+        with open_text(input_file) as view:
+            spm.SentencePieceTrainer.Train(
+                sentence_iterator=(line.rstrip("\n") for line in view),
+                model_prefix=model_path_prefix, vocab_size=vocab_size, model_type=tokenizer_type,
+                character_coverage=1.0, unk_piece="<unk>", hard_vocab_limit=False,
+                **({"num_threads": num_threads} if num_threads else {})
+            )
+    else:
+        spm.SentencePieceTrainer.Train(
+            f"--input={input_file} --model_prefix={model_path_prefix} "
+            f"--vocab_size={vocab_size} --model_type={tokenizer_type} --character_coverage=1.0 "
+            f"--unk_piece=<unk> --hard_vocab_limit=false"
+            + (f" --num_threads={num_threads}" if num_threads else "")
+        )
     
     model_file = f"{model_path_prefix}.model"
     temp_vocab_file = f"{model_path_prefix}.vocab"
@@ -70,46 +104,169 @@ def train_tokenizer(input_file, model_prefix, tokenizer_type, vocab_size=5000):
     
     return model_file
 
-def encode_with_tokenizer(model_file, input_file, output_file):
-    """tokenization step"""
-# Ensure the output directory for tokenized text exists
-    output_dir = os.path.dirname(output_file)
-    if output_dir:
-        os.makedirs(output_dir, exist_ok=True)
-            
-    sp = spm.SentencePieceProcessor(model_file=model_file)
-    
-    # encode sentences
-    with open(input_file, "r", encoding="utf-8") as f_in, \
-         open(output_file, "w", encoding="utf-8") as f_out:
-        
-        sentence_count = 0
-        for line in f_in:
-            line = line.strip()
-            if line:  # skip line
-                pieces = sp.encode(line, out_type=str)
-                f_out.write(" ".join(pieces) + "\n")
-                sentence_count += 1
-    
-    print(f"Tokenized {sentence_count} sentences, and saved to {output_file}")
+
+# --- sweep mode ---
+SWEEP_SETTINGS_VERSION = 1
+
+
+def sweep_record_path(tokenizer_type, model_prefix):
+    return os.path.join(".", "models", tokenizer_type, f"{model_prefix}.train.json")
+
+
+def sweep_settings(job):
+    return {
+        "version": SWEEP_SETTINGS_VERSION,
+        "train_file_sha1": job["input_hash"],
+        "tokenizer": job["tokenizer"],
+        "vocab_size": job["vocab_size"],
+    }
+
+
+def is_up_to_date(job):
+    """True if the model and vocab exist and were trained on the same input and settings."""
+    model_file = os.path.join(".", "models", job["tokenizer"], f"{job['model_prefix']}.model")
+    vocab_file = os.path.join(".", "vocab", job["tokenizer"], f"{job['model_prefix']}.vocab")
+    record = sweep_record_path(job["tokenizer"], job["model_prefix"])
+    if not (os.path.exists(model_file) and os.path.exists(vocab_file) and os.path.exists(record)):
+        return False
+    with open(record, 'r', encoding='utf-8') as f:
+        return json.load(f).get("settings") == sweep_settings(job)
+
+
+def peak_memory_mb():
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_sweep_job(job):
+    """Train one (language, tokenizer, vocab_size) model; runs in its own process."""
+    start = time.perf_counter()
+    model_file = train_tokenizer(job["train_file"], job["model_prefix"], job["tokenizer"],
+                                 job["vocab_size"], job["threads"])
+    wall_time = time.perf_counter() - start
+    vocab_size = spm.SentencePieceProcessor(model_file=model_file).get_piece_size()
+
+    with open(sweep_record_path(job["tokenizer"], job["model_prefix"]), 'w', encoding='utf-8') as f:
+        json.dump({"settings": sweep_settings(job), "train_file": job["train_file"],
+                   "resulting_vocab_size": vocab_size}, f, indent=2)
+
+    return dict(job, status="trained", wall_time=wall_time,
+                peak_mb=peak_memory_mb(), resulting_vocab=vocab_size)
+
+
+def run_sweep(languages, tokenizers, vocab_sizes, train_pattern, prefix_template,
+              jobs=1, threads_per_job=1):
+    input_hashes = {}
+    all_jobs = []
+    for lang in languages:
+        train_file = train_pattern.format(lang=lang)
+        if not exists(train_file):
+            print(f"[SKIP] Missing training file for {lang}: {train_file}")
+            continue
+        # a view's hash covers its sources, so editing them retrains
+        input_hashes[lang] = hash_view(train_file) if is_view(train_file) else hash_packed(train_file)
+        for tok in tokenizers:
+            for vocab_size in vocab_sizes:
+                all_jobs.append({
+                    "lang": lang, "tokenizer": tok, "vocab_size": vocab_size,
+                    "train_file": train_file, "input_hash": input_hashes[lang],
+                    "model_prefix": prefix_template.format(lang=lang, tokenizer=tok, vocab_size=vocab_size),
+                    "threads": threads_per_job,
+                })
+
+    rows = []
+    pending = []
+    for job in all_jobs:
+        if is_up_to_date(job):
+            rows.append(dict(job, status="skipped", wall_time=0.0, peak_mb=float('nan'), resulting_vocab=None))
+        else:
+            pending.append(job)
+    print(f"Sweep: {len(all_jobs)} jobs, {len(rows)} up to date, {len(pending)} to train")
+
+    if pending:
+        # one process per job so ru_maxrss is that job's peak memory
+        with mp.Pool(processes=max(1, jobs), maxtasksperchild=1) as pool:
+            for row in pool.imap_unordered(run_sweep_job, pending):
+                print(f"[DONE] {row['model_prefix']} ({row['wall_time']:.1f}s)")
+                rows.append(row)
+
+    order = {job["model_prefix"]: i for i, job in enumerate(all_jobs)}
+    rows.sort(key=lambda row: order[row["model_prefix"]])
+    return rows
+
+
+def print_sweep_summary(rows, summary_file=None):
+    header = ["model_prefix", "lang", "tokenizer", "vocab_size", "status",
+              "wall_time_s", "peak_mem_mb", "resulting_vocab"]
+    lines = ["\t".join(header)]
+    for row in rows:
+        lines.append("\t".join([
+            row["model_prefix"], row["lang"], row["tokenizer"], str(row["vocab_size"]), row["status"],
+            f"{row['wall_time']:.1f}", f"{row['peak_mb']:.0f}",
+            "-" if row["resulting_vocab"] is None else str(row["resulting_vocab"]),
+        ]))
+    print("\n--- Sweep Summary ---")
+    print("\n".join(lines))
+    if summary_file:
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"Summary saved to: {summary_file}")
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='train tokenizer and apply to dev/train sets')
-    parser.add_argument('--tokenizer', choices=['bpe', 'unigram'], required=True, 
+    parser.add_argument('--tokenizer', choices=['bpe', 'unigram'], 
                        help='Tokenizer type')
-    parser.add_argument('--train_file', required=True, 
+    parser.add_argument('--train_file', 
                        help='training file')
-    parser.add_argument('--eval_files', nargs='+', required=True, 
+    parser.add_argument('--eval_files', nargs='+', 
                        help='files to tokenize')
-    parser.add_argument('--output_files', nargs='+', required=True, 
+    parser.add_argument('--output_files', nargs='+', 
                        help='tokenized files')
-    parser.add_argument('--model_prefix', required=True, 
+    parser.add_argument('--model_prefix', 
                        help='model prefix')
     parser.add_argument('--vocab_size', type=int, default=5000, 
                        help='vocal size (keep consistency among tokenizers)')
+    parser.add_argument('--chunk_size', type=int, default=10000,
+                       help='Lines per batched encode call')
+    parser.add_argument('--num_threads', type=int, default=-1,
+                       help='SentencePiece encode threads (-1 = all cores)')
+    parser.add_argument('--output_format', choices=['text', 'ids'], default='text',
+                       help='text: space-joined pieces; ids: binary token-id corpus (output path is the prefix)')
+    parser.add_argument('--force', action='store_true',
+                       help='Re-encode every file, ignoring the .tokenize_manifest.json cache')
+    # sweep mode
+    parser.add_argument('--sweep', action='store_true',
+                       help='Train a languages x tokenizers x vocab sizes grid (no encoding)')
+    parser.add_argument('--languages', nargs='+', help='Sweep: language codes')
+    parser.add_argument('--tokenizers', nargs='+', choices=['bpe', 'unigram'], default=['bpe', 'unigram'],
+                       help='Sweep: tokenizer types')
+    parser.add_argument('--vocab_sizes', nargs='+', type=int, default=[5000],
+                       help='Sweep: vocab sizes')
+    parser.add_argument('--train_pattern', help='Sweep: training file pattern with {lang}')
+    parser.add_argument('--prefix_template', default='{lang}_{tokenizer}_model_{vocab_size}',
+                       help='Sweep: model prefix pattern ({lang}, {tokenizer}, {vocab_size})')
+    parser.add_argument('--jobs', type=int, default=1, help='Sweep: parallel training processes')
+    parser.add_argument('--threads_per_job', type=int, default=1,
+                       help='Sweep: SentencePiece trainer threads per job')
+    parser.add_argument('--summary_file', help='Sweep: write the summary table here (TSV)')
 
     args = parser.parse_args()
 
+    if args.sweep:
+        if not args.languages or not args.train_pattern:
+            parser.error("--sweep requires --languages and --train_pattern")
+        rows = run_sweep(args.languages, args.tokenizers, args.vocab_sizes, args.train_pattern,
+                         args.prefix_template, args.jobs, args.threads_per_job)
+        print_sweep_summary(rows, args.summary_file)
+        sys.exit(0)
+
+    if not all([args.tokenizer, args.train_file, args.eval_files, args.output_files, args.model_prefix]):
+        parser.error("--tokenizer, --train_file, --eval_files, --output_files and --model_prefix are required")
+
     if len(args.eval_files) != len(args.output_files):
         raise ValueError("Amount of sentences should be aligned")
 
@@ -121,10 +278,23 @@ if __name__ == '__main__':
         args.vocab_size
     )
     
-    # 2. tokenize
+    # 2. tokenize (outputs are reused when the retrained model is byte-identical)
+    cache = None if args.force else TokenizeCache()
+    model_hash = file_sha1(model_file)
+    options = {'tokenizer': 'sentencepiece', 'output_format': args.output_format}
+    sp = spm.SentencePieceProcessor(model_file=model_file)
+    total_sentences, total_seconds = 0, 0.0
     for eval_file, output_file in zip(args.eval_files, args.output_files):
-        encode_with_tokenizer(model_file, eval_file, output_file)
+        count, seconds = run_cached(
+            cache, eval_file, output_file, model_hash, options,
+            lambda offset: encode_with_tokenizer(model_file, eval_file, output_file,
+                                                 args.chunk_size, args.num_threads, sp=sp,
+                                                 output_format=args.output_format,
+                                                 start_offset=offset))
+        total_sentences += count
+        total_seconds += seconds
     
     print(f"\nAll done!")
     print(f"Model saved as: {model_file}")
-    print(f"Output file: {', '.join(args.output_files)}")
\ No newline at end of file
+    print(f"Output file: {', '.join(args.output_files)}")
+    print_throughput(total_sentences, total_seconds)